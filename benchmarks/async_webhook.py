@@ -0,0 +1,105 @@
+"""Webhook latency and sustained throughput of the inline (sync) webhook
+versus the async webhook with background workers, against a stubbed
+Telegram API.
+
+    python -m benchmarks.async_webhook --updates 500 --api-latency-ms 50
+"""
+
+import argparse
+import asyncio
+import time
+import os
+
+from benchmarks.fake_telegram import FakeTelegramServer
+from benchmarks.common import (
+    disable_outbound_limits,
+    make_update_data,
+    print_latencies,
+    setup_django,
+    setup_test_database,
+)
+
+
+def make_payloads(updates: int, chats: int) -> list:
+    return [
+        make_update_data(i, 1000 + i % chats, f"/income {i % 100 + 1} salary")
+        for i in range(updates)
+    ]
+
+
+def run_sync(payloads: list):
+    from django.test import RequestFactory
+    from botapp.views import TelegramWebhookView
+
+    factory = RequestFactory()
+    view = TelegramWebhookView.as_view()
+    latencies = []
+    started = time.perf_counter()
+    for data in payloads:
+        request = factory.post(
+            "/telegram/webhook/", data, content_type="application/json"
+        )
+        request_started = time.perf_counter()
+        view(request)
+        latencies.append(time.perf_counter() - request_started)
+    elapsed = time.perf_counter() - started
+
+    print_latencies("sync webhook latency", latencies)
+    print(f"sync webhook throughput: {len(payloads) / elapsed:.1f} updates/sec")
+
+
+async def run_async(payloads: list, concurrency: int):
+    from botapp.workers import shutdown_worker_pool
+    from botapp.views import AsyncTelegramWebhookView
+    from django.test import AsyncRequestFactory
+    from asgiref.sync import sync_to_async
+
+    factory = AsyncRequestFactory()
+    view = AsyncTelegramWebhookView.as_view()
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    rejected = 0
+
+    async def post(data):
+        nonlocal rejected
+        async with semaphore:
+            request = factory.post(
+                "/telegram/webhook/", data, content_type="application/json"
+            )
+            request_started = time.perf_counter()
+            response = await view(request)
+            latencies.append(time.perf_counter() - request_started)
+            if response.status_code != 200:
+                rejected += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(post(data) for data in payloads))
+    await sync_to_async(shutdown_worker_pool, thread_sensitive=False)()
+    elapsed = time.perf_counter() - started
+
+    print_latencies("async webhook latency", latencies)
+    print(
+        f"async webhook throughput: {(len(payloads) - rejected) / elapsed:.1f} "
+        f"updates/sec, rejected (503): {rejected}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--updates", type=int, default=500)
+    parser.add_argument("--chats", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--api-latency-ms", type=float, default=50)
+    args = parser.parse_args()
+
+    server = FakeTelegramServer(latency=args.api_latency_ms / 1000).start()
+    os.environ["TELEGRAM_API_URL"] = server.api_url
+    setup_django()
+    setup_test_database()
+    disable_outbound_limits()
+
+    payloads = make_payloads(args.updates, args.chats)
+    run_sync(payloads)
+    asyncio.run(run_async(payloads, args.concurrency))
+    print(f"Telegram API calls: {dict(server.calls)}")
+    server.stop()
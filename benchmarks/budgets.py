@@ -0,0 +1,93 @@
+"""Latency and queries per expense in a chat with a total and a category
+budget: re-summing the period on every expense versus the incremental
+`spent` kept by `Operation.save`.
+
+    python -m benchmarks.budgets --rows 100000 --updates 500
+"""
+
+from datetime import timedelta
+import argparse
+import time
+
+from benchmarks.common import print_latencies, setup_django, setup_test_database
+
+
+def seed(chat_id: int, rows: int, batch_size: int = 10000):
+    """`rows` expenses this month."""
+    from botapp.models import Chat, Operation, OperationType
+    from django.utils import timezone
+
+    Chat.objects.create(id=chat_id, username=f"user{chat_id}")
+    month_start = timezone.localtime().replace(day=1, hour=12)
+    for offset in range(0, rows, batch_size):
+        Operation.objects.bulk_create(
+            Operation(
+                chat_id=chat_id,
+                amount=100,
+                operation_type=OperationType.EXPENSE,
+                note="food" if i % 2 else "rent",
+                created_at=month_start + timedelta(seconds=i % 86400),
+            )
+            for i in range(offset, min(offset + batch_size, rows))
+        )
+
+
+def measure(title: str, write, updates: int):
+    from django.test.utils import CaptureQueriesContext
+    from django.db import connection
+
+    latencies = []
+    with CaptureQueriesContext(connection) as queries:
+        for _ in range(updates):
+            started = time.perf_counter()
+            write()
+            latencies.append(time.perf_counter() - started)
+
+    print_latencies(title, latencies)
+    print(f"{title}: {len(queries) / updates:.1f} queries per expense")
+
+
+def run(rows: int, updates: int):
+    from botapp.models import Budget, Operation, OperationType
+    from botapp.money import MAX_AMOUNT
+    from django.utils import timezone
+
+    def expense(chat_id):
+        return Operation(
+            chat_id=chat_id,
+            amount=100,
+            operation_type=OperationType.EXPENSE,
+            note="food",
+        )
+
+    seed(1, rows)
+    seed(2, rows)
+    # Chat 1 has no stored budgets, its period is summed on every expense
+    unsaved = []
+    for category in (Budget.TOTAL, "food"):
+        budget = Budget(chat_id=1, category=category, period="monthly")
+        budget.roll_over(timezone.localdate())
+        unsaved.append(budget)
+        Budget.set(2, category, "monthly", MAX_AMOUNT)
+
+    def write_before():
+        expense(1).save()
+        for budget in unsaved:
+            budget.spent = budget.get_ledger_spent()
+
+    def write_after():
+        expense(2).save()
+
+    measure("re-sum the period (before)", write_before, updates)
+    measure("incremental spent (after)", write_after, updates)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--updates", type=int, default=500)
+    args = parser.parse_args()
+
+    setup_django()
+    setup_test_database()
+    run(args.rows, args.updates)
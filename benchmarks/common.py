@@ -0,0 +1,116 @@
+"""Shared helpers for the benchmark scripts.
+
+Run any benchmark from the project root, e.g. ``python -m benchmarks.dispatcher``.
+"""
+
+from datetime import timedelta
+import statistics
+import tempfile
+import random
+import time
+import os
+
+
+def setup_django():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "telegram_bot.settings")
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:benchmark")
+
+    import django
+    from django.conf import settings
+
+    django.setup()
+    # As in production: with DEBUG on, Django keeps a log of executed queries
+    settings.DEBUG = False
+
+
+def setup_test_database():
+    """Create a throwaway file-backed SQLite database and return its path.
+
+    A file (rather than in-memory) database lets worker threads use their own
+    connections the way they do in production.
+    """
+    from django.db import connection
+
+    path = None
+    if connection.vendor == "sqlite":
+        path = tempfile.mktemp(suffix=".sqlite3", prefix="bench-")
+        connection.settings_dict.setdefault("TEST", {})["NAME"] = path
+    # Other databases get Django's usual `test_<name>` database
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    return path
+
+
+def disable_outbound_limits():
+    """The fake Bot API has no send limits, so do not wait for Telegram's."""
+    from botapp.throttling import LocalBucketStore, OutboundLimiter
+    from botapp.bot import bot
+
+    unlimited = (10**9, 10**9)
+    bot.limiter = OutboundLimiter(LocalBucketStore(), unlimited, unlimited, unlimited)
+
+
+def seed_operations(chat_id: int, rows: int, days: int = 730, batch_size: int = 10000):
+    """Insert `rows` random operations for a chat, spread over the past `days`."""
+    from botapp.models import Chat, Operation, OperationType
+    from django.core.management import call_command
+    from django.utils import timezone
+
+    Chat.objects.get_or_create(id=chat_id, defaults={"username": f"user{chat_id}"})
+    now = timezone.now()
+    types = [OperationType.INCOME, OperationType.EXPENSE]
+
+    for offset in range(0, rows, batch_size):
+        Operation.objects.bulk_create(
+            Operation(
+                chat_id=chat_id,
+                amount=random.randint(1, 100000),
+                operation_type=random.choice(types),
+                note="seeded",
+                created_at=now - timedelta(seconds=random.randint(0, days * 86400)),
+            )
+            for _ in range(min(batch_size, rows - offset))
+        )
+
+    call_command("rebuild_totals", chat=chat_id, stdout=open(os.devnull, "w"))
+
+
+def make_update_data(update_id: int, chat_id: int, text: str) -> dict:
+    """Build the JSON body Telegram posts to the webhook for a text message."""
+    data = {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private", "username": f"user{chat_id}"},
+            "from": {
+                "id": chat_id,
+                "is_bot": False,
+                "first_name": "Bench",
+                "username": f"user{chat_id}",
+            },
+            "text": text,
+        },
+    }
+    if text.startswith("/"):
+        command_length = len(text.split()[0])
+        data["message"]["entities"] = [
+            {"type": "bot_command", "offset": 0, "length": command_length}
+        ]
+    return data
+
+
+def percentile(values: list, percent: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def print_latencies(title: str, latencies: list):
+    """Print count, mean, p50 and p99 of latencies given in seconds."""
+    print(
+        f"{title}: n={len(latencies)} "
+        f"mean={statistics.mean(latencies) * 1000:.3f}ms "
+        f"p50={percentile(latencies, 50) * 1000:.3f}ms "
+        f"p99={percentile(latencies, 99) * 1000:.3f}ms"
+    )
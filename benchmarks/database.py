@@ -0,0 +1,100 @@
+"""Write throughput of /income with 1, 4 and 16 concurrent workers on the
+default SQLite settings, tuned SQLite (WAL) and PostgreSQL.
+
+    python -m benchmarks.database --updates 2000
+    DB_HOST=localhost DB_USER=postgres python -m benchmarks.database --postgresql
+
+Every mode and worker count runs in a fresh process, as settings are read once.
+"""
+
+from unittest import mock
+import subprocess
+import threading
+import argparse
+import time
+import sys
+import os
+
+from benchmarks.common import make_update_data, setup_django, setup_test_database
+
+
+MODES = {
+    "sqlite": {"DB_ENGINE": "sqlite", "SQLITE_TUNED": "False"},
+    "sqlite-tuned": {"DB_ENGINE": "sqlite", "SQLITE_TUNED": "True"},
+    "postgresql": {"DB_ENGINE": "postgresql"},
+    "postgresql-pool": {"DB_ENGINE": "postgresql", "DB_POOL_SIZE": "16"},
+}
+
+
+def measure(updates: int, workers: int):
+    """Runs in the child process, prints updates/sec and failed updates."""
+    from botapp.throttling import CommandThrottle, LocalBucketStore
+    from django.db import close_old_connections
+    from botapp.dispatcher import get_dispatcher
+    from telegram import Update
+    from botapp.bot import bot
+
+    dispatcher = get_dispatcher()
+    failed = []
+    dispatcher.add_error_handler(lambda update, context: failed.append(context.error))
+    payloads = [
+        Update.de_json(
+            make_update_data(i, 1000 + i % 500, f"/income {i % 90 + 1}"), bot
+        )
+        for i in range(updates)
+    ]
+
+    def work(number: int):
+        for update in payloads[number::workers]:
+            dispatcher.process_update(update)
+        close_old_connections()
+
+    unlimited = CommandThrottle(
+        LocalBucketStore(), {"default": (1e9, 1e9)}, None, "", 1
+    )
+    threads = [threading.Thread(target=work, args=(n,)) for n in range(workers)]
+    with mock.patch("telegram.Bot.username", "bench_bot"), mock.patch(
+        "telegram.Message.reply_text"
+    ), mock.patch("botapp.dispatcher._command_throttle", unlimited):
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    print(f"{updates / elapsed:.1f} {len(failed)}")
+
+
+def run_child(mode: str, updates: int, workers: int) -> str:
+    env = dict(os.environ, **MODES[mode])
+    command = [sys.executable, "-W", "ignore", "-m", "benchmarks.database"]
+    command += ["--child", "--updates", str(updates), "--workers", str(workers)]
+    result = subprocess.run(command, env=env, capture_output=True, text=True)
+    if result.returncode:
+        return f"failed: {result.stderr.strip().splitlines()[-1]}"
+    throughput, failed = result.stdout.split()[-2:]
+    return f"{throughput} updates/sec, {failed} failed"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--postgresql", action="store_true")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        setup_django()
+        setup_test_database()
+        measure(args.updates, args.workers[0])
+        sys.exit()
+
+    modes = ["sqlite", "sqlite-tuned"]
+    if args.postgresql:
+        modes += ["postgresql", "postgresql-pool"]
+    for mode in modes:
+        for workers in args.workers:
+            print(
+                f"{mode}, {workers} workers: {run_child(mode, args.updates, workers)}"
+            )
@@ -0,0 +1,59 @@
+"""Per-update overhead of building the dispatcher on every webhook call
+versus reusing the process-wide one.
+
+    python -m benchmarks.dispatcher --updates 2000
+"""
+
+import argparse
+import time
+
+from benchmarks.common import make_update_data, print_latencies, setup_django
+
+
+def measure(view, payloads) -> list:
+    from django.test import RequestFactory
+
+    factory = RequestFactory()
+    latencies = []
+    for data in payloads:
+        request = factory.post(
+            "/telegram/webhook/", data, content_type="application/json"
+        )
+        started = time.perf_counter()
+        view(request)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def run(updates: int):
+    from botapp.dispatcher import build_dispatcher
+    from rest_framework.response import Response
+    from botapp.views import TelegramWebhookView
+    from telegram import Update
+    from botapp.bot import bot
+
+    class PerRequestDispatcherView(TelegramWebhookView):
+        """The webhook as it was: a new dispatcher for every update."""
+
+        def post(self, request, *args, **kwargs):
+            update = Update.de_json(request.data, bot)
+            build_dispatcher().process_update(update)
+            return Response(status=200)
+
+    # Plain text is not matched by any command, so no reply is sent
+    # and only the dispatch overhead is measured.
+    payloads = [make_update_data(i, 1, "hello") for i in range(updates)]
+
+    before = measure(PerRequestDispatcherView.as_view(), payloads)
+    print_latencies("dispatcher per request (before)", before)
+    after = measure(TelegramWebhookView.as_view(), payloads)
+    print_latencies("shared dispatcher (after)", after)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--updates", type=int, default=2000)
+    args = parser.parse_args()
+
+    setup_django()
+    run(args.updates)
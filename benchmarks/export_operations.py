@@ -0,0 +1,50 @@
+"""Time and peak memory of `manage.py export_operations` for large chats.
+
+python -m benchmarks.export_operations --rows 1000000 --gzip
+"""
+
+import argparse
+import resource
+import tempfile
+import time
+import os
+
+from benchmarks.common import seed_operations, setup_django, setup_test_database
+
+
+def max_rss_mib() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run(rows: int, file_format: str, compress: bool):
+    from django.core.management import call_command
+
+    seed_operations(1, rows)
+    path = tempfile.mktemp(prefix="bench-export-")
+    rss_before = max_rss_mib()
+
+    options = ["--format", file_format, "--output", path]
+    if compress:
+        options.append("--gzip")
+    started = time.perf_counter()
+    call_command("export_operations", "1", *options, stderr=open(os.devnull, "w"))
+    elapsed = time.perf_counter() - started
+
+    size = os.path.getsize(path) / 2**20
+    os.remove(path)
+    print(
+        f"exported {rows} rows in {elapsed:.1f}s ({rows / elapsed:.0f} rows/sec), "
+        f"{size:.1f} MiB file, max RSS {rss_before:.1f} -> {max_rss_mib():.1f} MiB"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--format", choices=["csv", "jsonl"], default="csv")
+    parser.add_argument("--gzip", action="store_true")
+    args = parser.parse_args()
+
+    setup_django()
+    setup_test_database()
+    run(args.rows, args.format, args.gzip)
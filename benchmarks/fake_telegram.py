@@ -0,0 +1,110 @@
+"""A local stand-in for the Telegram Bot API.
+
+Every method answers ``ok``; message-sending methods return a minimal
+``Message`` so python-telegram-bot can parse the result.
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import Counter
+import threading
+import json
+import time
+
+
+MESSAGE_METHODS = {"sendMessage", "sendDocument"}
+
+
+class FakeTelegramServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency: float = 0.0, port: int = 0):
+        super().__init__(("127.0.0.1", port), FakeTelegramHandler)
+        self.latency = latency
+        self.calls = Counter()
+        self.connections = 0
+        self.updates = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def api_url(self) -> str:
+        """Value for the `TELEGRAM_API_URL` setting."""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/bot"
+
+    def add_updates(self, updates: list):
+        """Queue update payloads for `getUpdates`."""
+        with self._lock:
+            self.updates.extend(updates)
+
+    def get_updates(self, offset: int, limit: int) -> list:
+        """Like Telegram: an offset confirms and drops the earlier updates."""
+        with self._lock:
+            self.updates = [u for u in self.updates if u["update_id"] >= offset]
+            return self.updates[:limit]
+
+    def record(self, method: str):
+        with self._lock:
+            self.calls[method] += 1
+
+    def process_request(self, request, client_address):
+        with self._lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class FakeTelegramHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        method = self.path.rsplit("/", 1)[-1]
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.record(method)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        result = True
+        if method == "getUpdates":
+            data = json.loads(body or b"{}")
+            result = self.server.get_updates(
+                int(data.get("offset") or 0), int(data.get("limit") or 100)
+            )
+            if not result:
+                # Long polling: wait a little for new updates instead of the timeout
+                time.sleep(min(float(data.get("timeout") or 0), 0.05))
+        elif method == "getMe":
+            result = {
+                "id": 1,
+                "is_bot": True,
+                "first_name": "Fake",
+                "username": "fake_bot",
+            }
+        elif method in MESSAGE_METHODS:
+            chat_id = 0
+            if self.headers.get("Content-Type", "").startswith("application/json"):
+                chat_id = int(json.loads(body).get("chat_id", 0))
+            result = {
+                "message_id": 1,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+            }
+
+        payload = json.dumps({"ok": True, "result": result}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
@@ -0,0 +1,65 @@
+"""Throughput and peak memory of `manage.py import_operations`.
+
+python -m benchmarks.import_operations --rows 1000000
+"""
+
+from datetime import date, timedelta
+import argparse
+import resource
+import tempfile
+import random
+import time
+import csv
+import os
+
+from benchmarks.common import setup_django, setup_test_database
+
+
+def write_csv(path: str, rows: int):
+    """Write a CSV of random operations without holding it in memory."""
+    start = date(2020, 1, 1)
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["date", "type", "amount", "note"])
+        for _ in range(rows):
+            writer.writerow(
+                [
+                    start + timedelta(days=random.randint(0, 2000)),
+                    random.choice(["income", "expense"]),
+                    f"{random.randint(1, 100000) / 100:.2f}",
+                    "imported",
+                ]
+            )
+
+
+def max_rss_mib() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run(rows: int, batch_size: int):
+    from django.core.management import call_command
+
+    path = tempfile.mktemp(suffix=".csv", prefix="bench-import-")
+    write_csv(path, rows)
+    rss_before = max_rss_mib()
+
+    started = time.perf_counter()
+    call_command("import_operations", "1", path, "--batch-size", str(batch_size))
+    elapsed = time.perf_counter() - started
+    os.remove(path)
+
+    print(
+        f"imported {rows} rows in {elapsed:.1f}s ({rows / elapsed:.0f} rows/sec), "
+        f"max RSS {rss_before:.1f} -> {max_rss_mib():.1f} MiB"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    setup_django()
+    setup_test_database()
+    run(args.rows, args.batch_size)
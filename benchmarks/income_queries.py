@@ -0,0 +1,57 @@
+"""Queries and latency per /income for a known chat, looking the chat up
+with `get_or_create` on every write versus the per-process chat cache.
+
+    python -m benchmarks.income_queries --updates 1000
+"""
+
+import argparse
+import time
+
+from benchmarks.common import print_latencies, setup_django, setup_test_database
+
+
+def measure(title: str, write, updates: int):
+    from django.test.utils import CaptureQueriesContext
+    from django.db import connection
+
+    write(1)  # The first write creates the chat
+    latencies = []
+    with CaptureQueriesContext(connection) as queries:
+        for amount in range(updates):
+            started = time.perf_counter()
+            write(amount + 1)
+            latencies.append(time.perf_counter() - started)
+
+    print_latencies(title, latencies)
+    print(f"{title}: {len(queries) / updates:.1f} queries per /income")
+
+
+def run(updates: int):
+    from botapp.models import Chat, Operation, OperationType
+    from botapp.chats import ensure_chat
+
+    def write_before(amount):
+        chat, _ = Chat.objects.get_or_create(id=1, username="user1")
+        operation = Operation(
+            chat=chat, amount=amount, operation_type=OperationType.INCOME
+        )
+        # What `Operation.save` validated before: including the chat lookup
+        operation.full_clean()
+        operation.save()
+
+    def write_after(amount):
+        ensure_chat(2, "user2")
+        Operation(chat_id=2, amount=amount, operation_type=OperationType.INCOME).save()
+
+    measure("get_or_create (before)", write_before, updates)
+    measure("chat cache (after)", write_after, updates)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--updates", type=int, default=1000)
+    args = parser.parse_args()
+
+    setup_django()
+    setup_test_database()
+    run(args.updates)
@@ -0,0 +1,64 @@
+"""Webhook latency and outbound API calls with replies sent through
+`sendMessage` versus returned inline in the webhook response.
+
+    python -m benchmarks.inline_reply --updates 300 --api-latency-ms 50
+"""
+
+import argparse
+import time
+import os
+
+from benchmarks.fake_telegram import FakeTelegramServer
+from benchmarks.common import (
+    disable_outbound_limits,
+    make_update_data,
+    print_latencies,
+    setup_django,
+    setup_test_database,
+)
+
+
+def run(server, payloads: list, inline: bool):
+    from django.test import RequestFactory, override_settings
+    from botapp.views import TelegramWebhookView
+
+    factory = RequestFactory()
+    view = TelegramWebhookView.as_view()
+    calls_before = server.calls["sendMessage"]
+    latencies = []
+    with override_settings(WEBHOOK_INLINE_REPLY=inline):
+        for data in payloads:
+            request = factory.post(
+                "/telegram/webhook/", data, content_type="application/json"
+            )
+            started = time.perf_counter()
+            view(request)
+            latencies.append(time.perf_counter() - started)
+
+    mode = "inline" if inline else "sendMessage"
+    print_latencies(f"{mode} replies", latencies)
+    print(
+        f"{mode} replies: sendMessage calls={server.calls['sendMessage'] - calls_before}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--updates", type=int, default=300)
+    parser.add_argument("--api-latency-ms", type=float, default=50)
+    args = parser.parse_args()
+
+    server = FakeTelegramServer(latency=args.api_latency_ms / 1000).start()
+    os.environ["TELEGRAM_API_URL"] = server.api_url
+    setup_django()
+    setup_test_database()
+    disable_outbound_limits()
+
+    commands = ["/balance", "/income 10 salary", "/help", "/expense 5 food"]
+    payloads = [
+        make_update_data(i, 1000 + i, commands[i % len(commands)])
+        for i in range(args.updates)
+    ]
+    run(server, payloads, inline=False)
+    run(server, payloads, inline=True)
+    server.stop()
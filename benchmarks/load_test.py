@@ -0,0 +1,336 @@
+"""Replay synthetic updates for every allowed command against the webhook
+at a target rate, with a fake Telegram Bot API and a seeded database.
+
+Reports throughput, latency percentiles per command, database queries per
+command and memory. Exits with status 1 when a `--max-*` / `--min-*`
+threshold is missed, so it can run in CI:
+
+    python -m benchmarks.load_test --updates 2000 --rate 200 --seed-rows 100000
+    python -m benchmarks.load_test --mix income=5,balance=1,report=1 --json
+    python -m benchmarks.load_test --updates 500 --max-p99-ms 250 --min-throughput 50
+"""
+
+from collections import defaultdict
+from contextlib import ExitStack
+from unittest import mock
+import statistics
+import tracemalloc
+import threading
+import itertools
+import argparse
+import resource
+import random
+import json
+import time
+import sys
+import os
+
+from benchmarks.fake_telegram import FakeTelegramServer
+from benchmarks.common import (
+    disable_outbound_limits,
+    make_update_data,
+    percentile,
+    seed_operations,
+    setup_django,
+    setup_test_database,
+)
+
+
+DEFAULT_MIX = {
+    "income": 30,
+    "expense": 30,
+    "balance": 10,
+    "report": 5,
+    "stats": 5,
+    "update": 5,
+    "delete": 5,
+    "help": 4,
+    "start": 3,
+    "export": 1,
+}
+
+INTERVALS = ("yesterday", "day", "week", "month", "year")
+NOTES = ("", "food", "rent", "salary", "coffee with friends", "taxi")
+
+
+def parse_mix(value: str) -> dict:
+    mix = {}
+    for item in value.split(","):
+        command, _, weight = item.partition("=")
+        mix[command.strip()] = float(weight or 1)
+    return mix
+
+
+class UpdateGenerator:
+    """Random but reproducible message texts for each command."""
+
+    def __init__(self, mix: dict, chats: list, max_operation_id: int, seed: int):
+        self._random = random.Random(seed)
+        self._commands = list(mix)
+        self._weights = list(mix.values())
+        self._chats = chats
+        self._max_operation_id = max(max_operation_id, 1)
+
+    def amount(self) -> str:
+        return f"{self._random.randint(1, 500000) / 100:g}"
+
+    def text(self, command: str) -> str:
+        choice = self._random.choice
+        if command in ("income", "expense"):
+            # Some updates ask for the total instead of adding an operation
+            if self._random.random() < 0.1:
+                return f"/{command}"
+            return f"/{command} {self.amount()} {choice(NOTES)}".rstrip()
+        if command in ("report", "stats"):
+            return f"/{command} {choice(INTERVALS)}"
+        if command == "export":
+            return f"/export {choice(INTERVALS)} {choice(('csv', 'jsonl'))}"
+        operation_id = self._random.randint(1, self._max_operation_id)
+        if command == "delete":
+            return f"/delete {operation_id}"
+        if command == "update":
+            sign = choice("+-")
+            return f"/update {operation_id} {sign}{self.amount()} {choice(NOTES)}"
+        return f"/{command}"
+
+    def payloads(self, count: int) -> list:
+        commands = self._random.choices(self._commands, self._weights, k=count)
+        return [
+            (
+                command,
+                make_update_data(
+                    number, self._random.choice(self._chats), self.text(command)
+                ),
+            )
+            for number, command in enumerate(commands, start=1)
+        ]
+
+
+def seed_database(chats: list, seed_rows: int) -> int:
+    """Spreads `seed_rows` operations over the chats, returns the highest ID."""
+    from botapp.models import Chat, Operation
+
+    random.seed(0)
+    for chat_id in chats:
+        seed_operations(chat_id, seed_rows // len(chats))
+        Chat.objects.filter(id=chat_id).update(username=f"user{chat_id}")
+    return Operation.objects.order_by("-id").values_list("id", flat=True).first() or 0
+
+
+def replay(payloads: list, rate: float, concurrency: int) -> dict:
+    """Posts the payloads from `concurrency` threads, paced to `rate` per second."""
+    from django.db import close_old_connections
+    from django.test import RequestFactory
+    from botapp.views import TelegramWebhookView
+
+    view = TelegramWebhookView.as_view()
+    factory = RequestFactory()
+    latencies = defaultdict(list)
+    failures = defaultdict(int)
+    lock = threading.Lock()
+    queue = iter(enumerate(payloads))
+    queue_lock = threading.Lock()
+
+    started = time.perf_counter()
+
+    def worker():
+        while True:
+            with queue_lock:
+                number, item = next(queue, (None, None))
+            if item is None:
+                break
+            command, data = item
+            if rate:
+                delay = started + number / rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+            request = factory.post(
+                "/telegram/webhook/", data, content_type="application/json"
+            )
+            request_started = time.perf_counter()
+            try:
+                ok = view(request).status_code == 200
+            except Exception:
+                ok = False
+            elapsed = time.perf_counter() - request_started
+            with lock:
+                latencies[command].append(elapsed)
+                if not ok:
+                    failures[command] += 1
+        close_old_connections()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {
+        "elapsed": time.perf_counter() - started,
+        "latencies": latencies,
+        "failures": failures,
+    }
+
+
+def summarize(result: dict, errors: dict, api_calls: dict) -> dict:
+    from botapp.metrics import command_db_queries
+
+    def stats(values: list) -> dict:
+        return {
+            "count": len(values),
+            "mean_ms": statistics.mean(values) * 1000,
+            "p50_ms": percentile(values, 50) * 1000,
+            "p90_ms": percentile(values, 90) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+            "max_ms": max(values) * 1000,
+        }
+
+    commands = {}
+    for command, values in sorted(result["latencies"].items()):
+        handled = command_db_queries.count(command)
+        commands[command] = {
+            **stats(values),
+            "failures": result["failures"][command],
+            "errors": errors.get(command, 0),
+            "queries_per_update": (
+                command_db_queries.sum(command) / handled if handled else 0
+            ),
+        }
+
+    every_latency = list(itertools.chain(*result["latencies"].values()))
+    # Zero unless `--trace-memory`, which slows the run down considerably
+    _, traced_peak = tracemalloc.get_traced_memory()
+    return {
+        "updates": len(every_latency),
+        "elapsed_s": result["elapsed"],
+        "throughput": len(every_latency) / result["elapsed"],
+        "overall": stats(every_latency),
+        "commands": commands,
+        "failures": sum(result["failures"].values()),
+        "errors": sum(errors.values()),
+        "api_calls": api_calls,
+        "traced_peak_mib": traced_peak / 2**20,
+        # Kilobytes on Linux
+        "max_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10,
+    }
+
+
+def print_report(report: dict):
+    overall = report["overall"]
+    print(
+        f"{report['updates']} updates in {report['elapsed_s']:.2f}s: "
+        f"{report['throughput']:.1f} updates/sec, p50={overall['p50_ms']:.2f}ms "
+        f"p99={overall['p99_ms']:.2f}ms, failures={report['failures']} "
+        f"errors={report['errors']}"
+    )
+    print(
+        f"{'command':<10}{'n':>7}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}"
+        f"{'max ms':>10}{'queries':>9}"
+    )
+    for command, stats in report["commands"].items():
+        print(
+            f"{command:<10}{stats['count']:>7}{stats['p50_ms']:>10.2f}"
+            f"{stats['p90_ms']:>10.2f}{stats['p99_ms']:>10.2f}"
+            f"{stats['max_ms']:>10.2f}{stats['queries_per_update']:>9.1f}"
+        )
+    print(
+        f"memory: traced peak {report['traced_peak_mib']:.1f} MiB, "
+        f"max RSS {report['max_rss_mib']:.1f} MiB"
+    )
+    print(f"Telegram API calls: {report['api_calls']}")
+
+
+def check_thresholds(report: dict, args) -> list:
+    failed = []
+    if args.max_p99_ms and report["overall"]["p99_ms"] > args.max_p99_ms:
+        failed.append(f"p99 {report['overall']['p99_ms']:.2f}ms > {args.max_p99_ms}ms")
+    if args.min_throughput and report["throughput"] < args.min_throughput:
+        failed.append(
+            f"throughput {report['throughput']:.1f} < {args.min_throughput} updates/sec"
+        )
+    if report["errors"] > args.max_errors:
+        failed.append(f"{report['errors']} handler errors > {args.max_errors}")
+    return failed
+
+
+def run(args, server: FakeTelegramServer) -> int:
+    from botapp.throttling import CommandThrottle, LocalBucketStore
+    from botapp.dispatcher import get_dispatcher
+    from botapp.constants import ALLOWED_COMMANDS
+
+    mix = parse_mix(args.mix) if args.mix else DEFAULT_MIX
+    unknown = set(mix) - set(ALLOWED_COMMANDS)
+    if unknown:
+        raise SystemExit(f"Unknown commands in --mix: {', '.join(sorted(unknown))}")
+
+    chats = [1000 + number for number in range(args.chats)]
+    max_operation_id = seed_database(chats, args.seed_rows)
+    generator = UpdateGenerator(mix, chats, max_operation_id, args.seed)
+    payloads = generator.payloads(args.updates)
+
+    # Count exceptions the dispatcher would otherwise only log
+    errors = defaultdict(int)
+
+    def count_error(update, context):
+        text = update.effective_message.text if update else ""
+        errors[text.split()[0][1:] if text else "unknown"] += 1
+
+    get_dispatcher().add_error_handler(count_error)
+
+    patches = [mock.patch("telegram.Bot.username", "fake_bot")]
+    if not args.with_rate_limits:
+        unlimited = {"default": (10**9, 10**9)}
+        throttle = CommandThrottle(LocalBucketStore(), unlimited, None, "", 1)
+        patches.append(mock.patch("botapp.dispatcher._command_throttle", throttle))
+
+    if args.trace_memory:
+        tracemalloc.start()
+    with ExitStack() as stack:
+        for patch in patches:
+            stack.enter_context(patch)
+        result = replay(payloads, args.rate, args.concurrency)
+    report = summarize(result, errors, dict(server.calls))
+    if args.trace_memory:
+        tracemalloc.stop()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+    failed = check_thresholds(report, args)
+    for message in failed:
+        print(f"FAILED: {message}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=0, help="updates/sec, 0 = max")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--mix", help="e.g. income=30,expense=30,balance=10")
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--seed-rows", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--api-latency-ms", type=float, default=0)
+    parser.add_argument("--with-rate-limits", action="store_true")
+    parser.add_argument("--trace-memory", action="store_true")
+    parser.add_argument("--json", action="store_true")
+    parser.add_argument("--max-p99-ms", type=float)
+    parser.add_argument("--min-throughput", type=float)
+    parser.add_argument("--max-errors", type=int, default=0)
+    args = parser.parse_args()
+
+    server = FakeTelegramServer(latency=args.api_latency_ms / 1000).start()
+    os.environ["TELEGRAM_API_URL"] = server.api_url
+    os.environ.setdefault("WEBHOOK_WORKERS", str(args.concurrency))
+    setup_django()
+    setup_test_database()
+    disable_outbound_limits()
+
+    status = run(args, server)
+    server.stop()
+    sys.exit(status)
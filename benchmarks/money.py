@@ -0,0 +1,60 @@
+"""Parse, sum and format throughput of amounts: through `float` into `Decimal`
+as before, versus straight from text to integer cents. Cents are for exact
+amounts, not speed; both paths run at about 490-505k amounts/sec here, so
+this only checks that cents cost nothing.
+
+    python -m benchmarks.money --amounts 100000
+"""
+
+from decimal import Decimal
+import argparse
+import random
+import time
+
+
+def before(texts: list):
+    amounts = [abs(Decimal(str(float(text)))) for text in texts]
+    lines = [f"{amount:.2f}" for amount in amounts]
+    return f"{sum(amounts):.2f}", lines
+
+
+def after(texts: list):
+    from botapp.money import format_cents, parse_cents
+
+    amounts = [parse_cents(text) for text in texts]
+    lines = [format_cents(amount) for amount in amounts]
+    return format_cents(sum(amounts)), lines
+
+
+def measure(title: str, convert, texts: list, repeat: int):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = convert(texts)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    print(
+        f"{title}: {len(texts) / best:,.0f} amounts/sec "
+        f"({best * 1e9 / len(texts):.0f} ns each)"
+    )
+    return result
+
+
+def run(amounts: int, repeat: int):
+    texts = [
+        random.choice(("", "+", "-")) + f"{random.randint(1, 10**8) / 100:.2f}"
+        for _ in range(amounts)
+    ]
+    expected = measure("float and Decimal (before)", before, texts, repeat)
+    result = measure("integer cents (after)", after, texts, repeat)
+    if result != expected:
+        raise SystemExit("The results differ")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--amounts", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    run(args.amounts, args.repeat)
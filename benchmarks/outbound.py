@@ -0,0 +1,75 @@
+"""Replies per second and new connections for concurrent senders with
+python-telegram-bot's default request (one pooled connection) versus the
+project's pooled, retrying request, against the fake Telegram API.
+
+    python -m benchmarks.outbound --senders 16 --messages 100 --api-latency-ms 20
+"""
+
+import threading
+import random
+import argparse
+import logging
+import time
+
+from benchmarks.fake_telegram import FakeTelegramServer
+from benchmarks.common import setup_django
+
+
+def measure(title: str, server, request, senders: int, messages: int, work: float):
+    from telegram import Bot
+
+    bot = Bot(token="123456:benchmark", base_url=server.api_url, request=request)
+
+    def send(sender: int):
+        for number in range(messages):
+            # The work of handling the next update, between two replies
+            time.sleep(random.uniform(0, work))
+            bot.send_message(chat_id=sender + 1, text=f"Income added: +{number}.00")
+
+    connections = server.connections
+    threads = [
+        threading.Thread(target=send, args=(sender,)) for sender in range(senders)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    print(
+        f"{title}: {senders * messages / elapsed:.1f} replies/sec, "
+        f"{server.connections - connections} new connections"
+    )
+
+
+def run(server: FakeTelegramServer, senders: int, messages: int, work: float):
+    from botapp.telegram_http import TelegramRequest
+    from telegram.utils.request import Request
+
+    measure("default request (before)", server, Request(), senders, messages, work)
+    request = TelegramRequest(
+        pool_size=senders,
+        connect_timeout=5,
+        read_timeout=10,
+        retries=3,
+        backoff=0.5,
+        max_wait=30,
+    )
+    measure("pooled request (after)", server, request, senders, messages, work)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--senders", type=int, default=16)
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--api-latency-ms", type=float, default=20)
+    parser.add_argument("--work-ms", type=float, default=5, help="Up to, per update")
+    args = parser.parse_args()
+
+    # urllib3 warns on every connection it discards from a full pool
+    logging.getLogger("telegram.vendor.ptb_urllib3.urllib3").setLevel(logging.ERROR)
+    server = FakeTelegramServer(latency=args.api_latency_ms / 1000).start()
+    setup_django()
+    run(server, args.senders, args.messages, args.work_ms / 1000)
+    server.stop()
@@ -0,0 +1,56 @@
+"""Argument parsing cost per update for each command's grammar,
+next to the bare `str.split` every update pays anyway.
+
+    python -m benchmarks.parsers --updates 100000
+"""
+
+import argparse
+import time
+
+from benchmarks.common import setup_django
+
+TEXTS = {
+    "income": "/income 1250.50 salary for march",
+    "expense": "/expense 3.20 coffee",
+    "delete": "/delete 123456",
+    "update": "/update 123456 -45.10 groceries",
+    "report": "/report 2025-01-01 2025-03-31",
+    "stats": "/stats month",
+    "export": "/export jsonl week gz",
+    "invalid": "/update 123456 +12.345",
+}
+
+
+def best_of(repeat: int, run) -> float:
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(updates: int, repeat: int):
+    from botapp.parsers import parse_command
+
+    for name, text in TEXTS.items():
+        command = text.split()[0][1:]
+        split = best_of(repeat, lambda: [text.split() for _ in range(updates)])
+        parse = best_of(
+            repeat, lambda: [parse_command(command, text) for _ in range(updates)]
+        )
+        print(
+            f"{name:>8}: {parse * 1e9 / updates:.0f} ns per update "
+            f"(split alone {split * 1e9 / updates:.0f} ns)"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--updates", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    run(args.updates, args.repeat)
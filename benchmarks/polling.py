@@ -0,0 +1,81 @@
+"""Throughput of `manage.py runbot` long polling versus the sync webhook,
+for the same updates against the fake Telegram API.
+
+    python -m benchmarks.polling --updates 1000 --workers 8 --api-latency-ms 20
+"""
+
+import argparse
+import time
+import os
+
+from benchmarks.fake_telegram import FakeTelegramServer
+from benchmarks.common import (
+    disable_outbound_limits,
+    make_update_data,
+    setup_django,
+    setup_test_database,
+)
+
+
+def make_payloads(offset: int, updates: int, chats: int) -> list:
+    return [
+        make_update_data(offset + i, 1000 + i % chats, f"/income {i % 100 + 1} pay")
+        for i in range(updates)
+    ]
+
+
+def run_webhook(payloads: list):
+    from django.test import RequestFactory
+    from botapp.views import TelegramWebhookView
+
+    factory = RequestFactory()
+    view = TelegramWebhookView.as_view()
+    started = time.perf_counter()
+    for data in payloads:
+        view(factory.post("/telegram/webhook/", data, content_type="application/json"))
+    elapsed = time.perf_counter() - started
+    print(f"sync webhook: {len(payloads) / elapsed:.1f} updates/sec")
+
+
+def run_polling(server: FakeTelegramServer, payloads: list, workers: int):
+    from botapp.dispatcher import process_update
+    from botapp.polling import Poller
+    from botapp.bot import bot
+
+    handled = []
+    poller = Poller(
+        bot,
+        lambda update: handled.append(process_update(update)),
+        workers=workers,
+        queue_size=1000,
+        timeout=1,
+    )
+    server.add_updates(payloads)
+    started = time.perf_counter()
+    while len(handled) < len(payloads):
+        poller.poll()
+    elapsed = time.perf_counter() - started
+    poller.shutdown()
+    print(f"long polling, {workers} workers: {len(payloads) / elapsed:.1f} updates/sec")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--chats", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--api-latency-ms", type=float, default=20)
+    args = parser.parse_args()
+
+    server = FakeTelegramServer(latency=args.api_latency_ms / 1000).start()
+    os.environ["TELEGRAM_API_URL"] = server.api_url
+    os.environ.setdefault("WEBHOOK_WORKERS", str(args.workers))
+    setup_django()
+    setup_test_database()
+    disable_outbound_limits()
+
+    run_webhook(make_payloads(1, args.updates, args.chats))
+    run_polling(
+        server, make_payloads(args.updates + 1, args.updates, args.chats), args.workers
+    )
+    server.stop()
@@ -0,0 +1,81 @@
+"""Latency of `/report year` and `/balance` for chats with a growing number
+of operations, with and without the composite indexes.
+
+    python -m benchmarks.reports --rows 1000 100000 1000000
+    python -m benchmarks.reports --rows 100000 --without-indexes
+"""
+
+from unittest import mock
+import tracemalloc
+import argparse
+import time
+
+from benchmarks.common import (
+    make_update_data,
+    print_latencies,
+    seed_operations,
+    setup_django,
+    setup_test_database,
+)
+
+
+def drop_indexes():
+    from botapp.models import Operation
+    from django.db import connection
+
+    with connection.schema_editor() as schema_editor:
+        for index in Operation._meta.indexes:
+            schema_editor.remove_index(Operation, index)
+
+
+def measure(text: str, chat_id: int, repeat: int) -> list:
+    from botapp.dispatcher import get_dispatcher
+    from telegram import Update
+    from botapp.bot import bot
+
+    dispatcher = get_dispatcher()
+    latencies = []
+    for number in range(repeat):
+        update = Update.de_json(make_update_data(number, chat_id, text), bot)
+        started = time.perf_counter()
+        dispatcher.process_update(update)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def measure_peak_memory(text: str, chat_id: int) -> float:
+    """Peak Python memory of one command, in MiB."""
+    tracemalloc.start()
+    measure(text, chat_id, 1)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 2**20
+
+
+def run(rows_per_chat: list, repeat: int, without_indexes: bool):
+    if without_indexes:
+        drop_indexes()
+
+    # Only the database work and rendering are measured, replies are dropped
+    with mock.patch("telegram.Bot.username", "bench_bot"), mock.patch(
+        "telegram.Message.reply_text", lambda message, text: None
+    ):
+        for chat_id, rows in enumerate(rows_per_chat, start=1):
+            seed_operations(chat_id, rows)
+            for text in ("/report year", "/balance"):
+                latencies = measure(text, chat_id, repeat)
+                print_latencies(f"{text} @ {rows} rows", latencies)
+                peak = measure_peak_memory(text, chat_id)
+                print(f"{text} @ {rows} rows: peak memory {peak:.2f} MiB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--without-indexes", action="store_true")
+    args = parser.parse_args()
+
+    setup_django()
+    setup_test_database()
+    run(args.rows, args.repeat, args.without_indexes)
@@ -0,0 +1,92 @@
+"""One scheduler tick with every chat due: a daily recurring expense and a
+daily digest per chat, sent to a no-op sender. Reports the duration and the
+queries of the tick, and the peak memory of the process.
+
+    python -m benchmarks.scheduler --chats 100000
+"""
+
+from datetime import timedelta
+import resource
+import argparse
+import time
+
+from benchmarks.common import setup_django, setup_test_database
+
+
+def seed(chats: int, batch_size: int = 10000):
+    from botapp.models import (
+        Chat,
+        DigestSubscription,
+        Operation,
+        OperationType,
+        RecurringOperation,
+    )
+    from django.utils import timezone
+
+    now = timezone.now()
+    yesterday = now - timedelta(days=1)
+    for offset in range(0, chats, batch_size):
+        chat_ids = range(offset + 1, min(offset + batch_size, chats) + 1)
+        Chat.objects.bulk_create(Chat(id=i, username=f"user{i}") for i in chat_ids)
+        # Something to report in the digests
+        Operation.bulk_insert(
+            [
+                Operation(
+                    chat_id=i,
+                    amount=1000,
+                    operation_type=OperationType.INCOME,
+                    created_at=yesterday,
+                )
+                for i in chat_ids
+            ]
+        )
+        RecurringOperation.objects.bulk_create(
+            RecurringOperation(
+                chat_id=i,
+                operation_type=OperationType.EXPENSE,
+                amount=300,
+                frequency="daily",
+                next_run_at=now,
+            )
+            for i in chat_ids
+        )
+        DigestSubscription.objects.bulk_create(
+            DigestSubscription(chat_id=i, frequency="daily", next_run_at=now)
+            for i in chat_ids
+        )
+    return now
+
+
+def run(chats: int):
+    from django.test.utils import CaptureQueriesContext
+    from botapp.scheduler import tick
+    from django.db import connection
+
+    now = seed(chats)
+    sent = []
+
+    def send(chat_id, text):
+        sent.append(chat_id)
+
+    started = time.perf_counter()
+    with CaptureQueriesContext(connection) as queries:
+        added, digests = tick(now=now, send=send)
+    elapsed = time.perf_counter() - started
+    # In KiB on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    print(f"{chats} chats: {added} operations added, {digests} digests sent")
+    print(
+        f"tick: {elapsed:.2f}s ({chats / elapsed:,.0f} chats/sec), "
+        f"{len(queries)} queries, peak memory {peak / 1024:.0f} MiB"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chats", type=int, default=100000)
+    args = parser.parse_args()
+
+    setup_django()
+    setup_test_database()
+    run(args.chats)
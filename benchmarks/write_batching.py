@@ -0,0 +1,83 @@
+"""Sustained /income throughput with a commit per update versus write-behind
+batching, with updates handled by the worker pool on a file SQLite database.
+
+    python -m benchmarks.write_batching --updates 2000 --workers 16
+"""
+
+import argparse
+import time
+import os
+
+from benchmarks.fake_telegram import FakeTelegramServer
+from benchmarks.common import (
+    disable_outbound_limits,
+    make_update_data,
+    setup_django,
+    setup_test_database,
+)
+
+
+def run(title: str, updates: list, workers: int, batching: bool):
+    from botapp.dispatcher import process_update
+    from botapp.workers import UpdateWorkerPool
+    from django.conf import settings
+    from botapp import batching as batching_module
+
+    settings.WRITE_BATCHING = batching
+    batching_module._operation_batcher = None
+    batches = []
+    write = batching_module.write_operations
+
+    def counting_write(batch):
+        batches.append(len(batch))
+        write(batch)
+
+    batching_module.write_operations = counting_write
+    pool = UpdateWorkerPool(process_update, workers=workers, queue_size=len(updates))
+    started = time.perf_counter()
+    for update in updates:
+        pool.submit(update)
+    pool.shutdown()
+    elapsed = time.perf_counter() - started
+    batching_module.write_operations = write
+
+    line = f"{title}: {len(updates) / elapsed:.1f} updates/sec"
+    if batches:
+        line += (
+            f", {len(batches)} commits, mean batch {len(updates) / len(batches):.1f}"
+        )
+    print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--chats", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--api-latency-ms", type=float, default=0)
+    args = parser.parse_args()
+
+    server = FakeTelegramServer(latency=args.api_latency_ms / 1000).start()
+    os.environ["TELEGRAM_API_URL"] = server.api_url
+    os.environ.setdefault("WEBHOOK_WORKERS", str(args.workers))
+    setup_django()
+    setup_test_database()
+    disable_outbound_limits()
+
+    from telegram import Update
+    from botapp.bot import bot
+
+    def make_updates(offset: int) -> list:
+        return [
+            Update.de_json(
+                make_update_data(
+                    offset + i, 1000 + i % args.chats, f"/income {i % 100 + 1} pay"
+                ),
+                bot,
+            )
+            for i in range(args.updates)
+        ]
+
+    run("commit per update", make_updates(0), args.workers, batching=False)
+    run("batched commits", make_updates(args.updates), args.workers, batching=True)
+    server.stop()
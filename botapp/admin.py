@@ -1,6 +1,36 @@
 from django.contrib import admin
 from botapp.models import Chat, Operation
+from botapp.responses import invalidate_chat
+from django.db import transaction
 
 
-admin.site.register(Chat)
-admin.site.register(Operation)
+@admin.register(Chat)
+class ChatAdmin(admin.ModelAdmin):
+    # Kept up to date by `Operation`, a form would write back stale totals
+    readonly_fields = ("total_income", "total_expense")
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            obj.save(update_fields=form.changed_data)
+        else:
+            obj.save()
+
+
+@admin.register(Operation)
+class OperationAdmin(admin.ModelAdmin):
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        invalidate_chat(obj.chat_id)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        invalidate_chat(obj.chat_id)
+
+    def delete_queryset(self, request, queryset):
+        # One by one, `QuerySet.delete()` would skip the totals and the budgets
+        with transaction.atomic():
+            operations = list(queryset.select_for_update())
+            for operation in operations:
+                operation.delete()
+        for chat_id in {operation.chat_id for operation in operations}:
+            invalidate_chat(chat_id)
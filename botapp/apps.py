@@ -1,6 +1,28 @@
+from django.core.exceptions import ImproperlyConfigured
 from django.apps import AppConfig
 
 
 class BotappConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "botapp"
+
+    def ready(self):
+        from botapp.exceptions import CommandRegistrarError
+        from telegram.error import InvalidToken
+        from django.conf import settings
+        from telegram import Bot
+
+        # A bad token or command list must fail at boot, not on a user's message
+        try:
+            Bot._validate_token(settings.TELEGRAM_BOT_TOKEN)
+        except InvalidToken as e:
+            raise ImproperlyConfigured(
+                "TELEGRAM_BOT_TOKEN is missing or invalid"
+            ) from e
+
+        from botapp.dispatcher import setup_dispatcher
+
+        try:
+            setup_dispatcher()
+        except CommandRegistrarError as e:
+            raise ImproperlyConfigured(str(e)) from e
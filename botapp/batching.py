@@ -0,0 +1,103 @@
+from botapp.models import Operation
+from django.conf import settings
+import threading
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class PendingWrite:
+    def __init__(self, operation: Operation):
+        self.operation = operation
+        self.error = None
+        self.done = threading.Event()
+
+
+def write_operations(pending: list):
+    """Inserts the operations and updates the totals in one transaction."""
+    Operation.bulk_insert([write.operation for write in pending])
+
+
+class OperationBatcher:
+    """
+    Coalesces operations written by concurrent handlers into one transaction.
+
+    The first caller of `.submit()` leads the batch: it waits up to `max_delay`
+    seconds, or until `max_size` operations are queued, then writes them all
+    on its own database connection. Every caller returns only after the batch
+    is committed, so a reply is never sent for an unsaved operation.
+    """
+
+    def __init__(self, write, max_size: int, max_delay: float):
+        self._write = write
+        self._max_size = max_size
+        self._max_delay = max_delay
+        self._pending = []
+        self._condition = threading.Condition()
+
+    def submit(self, operation: Operation) -> Operation:
+        write = PendingWrite(operation)
+        with self._condition:
+            self._pending.append(write)
+            is_leader = len(self._pending) == 1
+            if len(self._pending) >= self._max_size:
+                self._condition.notify_all()
+
+        if is_leader:
+            self._write_batch(self._collect())
+        else:
+            write.done.wait()
+
+        if write.error is not None:
+            raise write.error
+        return write.operation
+
+    def _collect(self) -> list:
+        deadline = time.monotonic() + self._max_delay
+        with self._condition:
+            while len(self._pending) < self._max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batch, self._pending = self._pending, []
+        return batch
+
+    def _write_batch(self, batch: list):
+        try:
+            self._write(batch)
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0].error = e
+            else:
+                # Do not fail the whole batch for one bad operation
+                logger.warning("Batch write failed, writing operations one by one")
+                for write in batch:
+                    self._write_one(write)
+        finally:
+            for write in batch:
+                write.done.set()
+
+    def _write_one(self, write: PendingWrite):
+        try:
+            self._write([write])
+        except Exception as e:
+            write.error = e
+
+
+_operation_batcher = None
+_operation_batcher_lock = threading.Lock()
+
+
+def get_operation_batcher() -> OperationBatcher:
+    global _operation_batcher
+    with _operation_batcher_lock:
+        if _operation_batcher is None:
+            _operation_batcher = OperationBatcher(
+                write_operations,
+                max_size=settings.WRITE_BATCH_SIZE,
+                max_delay=settings.WRITE_BATCH_DELAY,
+            )
+        return _operation_batcher
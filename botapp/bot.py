@@ -1,5 +1,65 @@
+from telegram_bot.settings import (
+    RATE_LIMIT_STORE,
+    TELEGRAM_API_URL,
+    TELEGRAM_BOT_TOKEN,
+    TELEGRAM_CONNECT_TIMEOUT,
+    TELEGRAM_MAX_RETRY_WAIT,
+    TELEGRAM_MAX_SEND_WAIT,
+    TELEGRAM_POOL_SIZE,
+    TELEGRAM_READ_TIMEOUT,
+    TELEGRAM_RETRIES,
+    TELEGRAM_RETRY_BACKOFF,
+)
+from botapp.throttling import OutboundLimiter, get_bucket_store
+from botapp.telegram_http import TelegramRequest
+from botapp.metrics import timed
 from telegram import Bot
-from telegram_bot.settings import TELEGRAM_BOT_TOKEN
+from botapp.constants import (
+    OUTBOUND_CHAT_RATE_LIMIT,
+    OUTBOUND_GROUP_RATE_LIMIT,
+    OUTBOUND_RATE_LIMIT,
+)
 
 
-bot = Bot(token=TELEGRAM_BOT_TOKEN)
+# Bot API methods that count towards Telegram's message limits
+SEND_METHODS = {"sendMessage", "sendDocument"}
+
+
+class RateLimitedBot(Bot):
+    """Waits for the outbound limiter before sending a message, to avoid 429s."""
+
+    def __init__(self, *args, limiter: OutboundLimiter, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.limiter = limiter
+
+    def _post(self, endpoint, data=None, *args, **kwargs):
+        if endpoint in SEND_METHODS and data and "chat_id" in data:
+            self.limiter.wait(data["chat_id"])
+        with timed("telegram"):
+            return super()._post(endpoint, data, *args, **kwargs)
+
+
+# Every call to the Bot API, from any command or script, goes through it
+request = TelegramRequest(
+    pool_size=TELEGRAM_POOL_SIZE,
+    connect_timeout=TELEGRAM_CONNECT_TIMEOUT,
+    read_timeout=TELEGRAM_READ_TIMEOUT,
+    retries=TELEGRAM_RETRIES,
+    backoff=TELEGRAM_RETRY_BACKOFF,
+    max_wait=TELEGRAM_MAX_RETRY_WAIT,
+)
+
+limiter = OutboundLimiter(
+    get_bucket_store(RATE_LIMIT_STORE),
+    limit=OUTBOUND_RATE_LIMIT,
+    chat_limit=OUTBOUND_CHAT_RATE_LIMIT,
+    group_limit=OUTBOUND_GROUP_RATE_LIMIT,
+    max_wait=TELEGRAM_MAX_SEND_WAIT,
+)
+
+bot = RateLimitedBot(
+    token=TELEGRAM_BOT_TOKEN,
+    base_url=TELEGRAM_API_URL,
+    request=request,
+    limiter=limiter,
+)
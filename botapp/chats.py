@@ -0,0 +1,75 @@
+from botapp.constants import CHAT_CACHE_SIZE
+from collections import OrderedDict
+from django.db.models.signals import post_delete
+from botapp.responses import invalidate_chat
+from botapp.models import Chat
+import threading
+
+
+class ChatCache:
+    """
+    Usernames of chats known to exist, the least recently used are dropped first.
+    A known chat with an unchanged username costs no query.
+    """
+
+    def __init__(self, max_size: int):
+        self._usernames = OrderedDict()
+        self._max_size = max_size
+        self._lock = threading.Lock()
+
+    def get(self, chat_id: int):
+        with self._lock:
+            if chat_id not in self._usernames:
+                return None
+            self._usernames.move_to_end(chat_id)
+            return self._usernames[chat_id]
+
+    def set(self, chat_id: int, username: str):
+        with self._lock:
+            self._usernames[chat_id] = username
+            self._usernames.move_to_end(chat_id)
+            if len(self._usernames) > self._max_size:
+                self._usernames.popitem(last=False)
+
+    def discard(self, chat_id: int):
+        with self._lock:
+            self._usernames.pop(chat_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._usernames.clear()
+
+
+chat_cache = ChatCache(CHAT_CACHE_SIZE)
+
+
+def ensure_chat(chat_id: int, username: str = None):
+    """
+    Makes sure the chat exists and has the current username,
+    with a single upsert when the cache does not know it already.
+    An empty or None username leaves the stored one as it is.
+    """
+    cached = chat_cache.get(chat_id)
+    if cached is not None and (not username or cached == username):
+        return
+
+    chat = Chat(id=chat_id, username=username or "")
+    if not username:
+        # Without a username, do not overwrite the one already stored
+        Chat.objects.bulk_create([chat], ignore_conflicts=True)
+    else:
+        Chat.objects.bulk_create(
+            [chat],
+            update_conflicts=True,
+            unique_fields=["id"],
+            update_fields=["username"],
+        )
+    chat_cache.set(chat_id, username or cached or "")
+
+
+def forget_chat(sender, instance, **kwargs):
+    chat_cache.discard(instance.id)
+    invalidate_chat(instance.id)
+
+
+post_delete.connect(forget_chat, sender=Chat, dispatch_uid="forget_chat")
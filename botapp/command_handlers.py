@@ -1,5 +1,8 @@
 from botapp.exceptions import CommandRegistrarError
 from telegram.ext import CommandHandler
+from botapp.responses import cached_replies
+from botapp.constants import CACHED_COMMANDS
+from botapp.metrics import instrument
 import importlib
 
 
@@ -50,4 +53,7 @@ class CommandRegistrar:
 
     def register_commands(self, dispatcher):
         for command_name, handler in self.handlers.items():
+            if command_name in CACHED_COMMANDS:
+                handler = cached_replies(command_name, handler)
+            handler = instrument(command_name, handler)
             dispatcher.add_handler(CommandHandler(command_name, handler))
@@ -1,105 +1,356 @@
-from botapp.models import Operation, Chat, OperationType
-from botapp.utils import get_operation_sign, reply_text
-from botapp.constants import HELP_TEXT, START_TEXT
+from botapp.models import (
+    Budget,
+    DailyTotal,
+    DigestSubscription,
+    Frequency,
+    Operation,
+    OperationType,
+    RecurringOperation,
+)
+from botapp.scheduler import get_next_digest_at, get_run_at
+from botapp.utils import (
+    format_budget_alert,
+    format_summary,
+    get_operation_sign,
+    reply_text,
+)
+from botapp.constants import (
+    HELP_TEXT,
+    IMPORT_BATCH_SIZE,
+    IMPORT_MAX_ERRORS,
+    MESSAGE_MAX_LENGTH,
+    REPORT_PAGE_SIZE,
+    START_TEXT,
+)
+from botapp.batching import get_operation_batcher
+from botapp.responses import invalidate_chat
+from botapp.money import format_cents
+from botapp.chats import ensure_chat
+from botapp.exceptions import ParsingError
+from django.conf import settings
 from django.utils import timezone
-from botapp import parsers
+from botapp import exporters, importers, parsers
+import tempfile
+import csv
+import io
 
 
 def handle_income_or_expense(update, context, operation_type):
-    parser = parsers.IncomeAndExpenseParser(update, context)
+    chat_id = update.effective_chat.id
     sign = get_operation_sign(operation_type)
 
     # If we have no arguments, then we give the income or expense amount
-    if not parser.is_args():
-        total_sum = Operation.get_sum_by_type(parser.chat_id, operation_type)
-        reply_text(update, f"Total {operation_type.value}: {sign}{total_sum:.2f}")
+    if not context.args:
+        total_sum = Operation.get_sum_by_type(chat_id, operation_type)
+        reply_text(
+            update, f"Total {operation_type.value}: {sign}{format_cents(total_sum)}"
+        )
         return
 
     # Else, we parse command arguments to perform other command
-    if not parser.is_valid():
-        reply_text(update, parser.error)
+    result = parsers.parse_command(operation_type.value, update.effective_message.text)
+    if not result.ok:
+        reply_text(update, result.error.message)
         return
 
-    amount = parser.validated_data["amount"]
-    note = parser.validated_data["note"]
-    username = parser.username
-
-    chat, _ = Chat.objects.get_or_create(id=parser.chat_id, username=username)
+    amount = result.values["amount"]
+    note = result.values["note"]
 
-    Operation.objects.create(
-        chat=chat, amount=amount, operation_type=operation_type, note=note
+    ensure_chat(chat_id, update.effective_user.username)
+    operation = Operation(
+        chat_id=chat_id, amount=amount, operation_type=operation_type, note=note
     )
-    reply_text(update, f"{operation_type.value.capitalize()} added: {sign}{amount:.2f}")
+    if settings.WRITE_BATCHING:
+        # Validated here, the batch is written with `bulk_create`
+        operation.clean_fields(exclude=["chat"])
+        get_operation_batcher().submit(operation)
+    else:
+        operation.save()
+    invalidate_chat(chat_id)
+    reply_text(
+        update,
+        f"{operation_type.value.capitalize()} added: {sign}{format_cents(amount)}",
+    )
+    reply_budget_alerts(update, operation)
 
 
-def delete(update, context):
-    parser = parsers.DeleteParser(update, context)
+def reply_budget_alerts(update, operation):
+    for budget, threshold in operation.budget_alerts:
+        reply_text(update, format_budget_alert(budget, threshold))
 
-    if not parser.is_valid():
-        reply_text(update, parser.error)
+
+def delete(update, context):
+    result = parsers.parse_command("delete", update.effective_message.text)
+    if not result.ok:
+        reply_text(update, result.error.message)
         return
 
-    operation_id = parser.validated_data["operation_id"]
-    operation = Operation.objects.filter(
-        id=operation_id, chat_id=parser.chat_id
-    ).first()
+    chat_id = update.effective_chat.id
+    operation_id = result.values["operation_id"]
+    operation = Operation.objects.filter(id=operation_id, chat_id=chat_id).first()
     if not operation:
         reply_text(update, "You have no such transaction")
         return
 
     operation.delete()
+    invalidate_chat(chat_id)
     reply_text(update, f"Transaction {operation_id} successfully deleted")
 
 
 def update(update, context):
-    parser = parsers.UpdateParser(update, context)
-
-    if not parser.is_valid():
-        reply_text(update, parser.error)
+    result = parsers.parse_command("update", update.effective_message.text)
+    if not result.ok:
+        reply_text(update, result.error.message)
         return
 
-    operation_id = parser.validated_data["operation_id"]
-
-    operation = Operation.objects.filter(
-        id=operation_id, chat_id=parser.chat_id
-    ).first()
+    chat_id = update.effective_chat.id
+    operation_id = result.values["operation_id"]
+    operation = Operation.objects.filter(id=operation_id, chat_id=chat_id).first()
     if not operation:
         reply_text(update, "Transaction not found")
         return
 
-    for attr, value in parser.validated_data.items():
+    for attr, value in result.values.items():
         if value:
             setattr(operation, attr, value)
 
     operation.save()
+    invalidate_chat(chat_id)
     reply_text(update, f"Transaction {operation_id} updated successfully")
+    reply_budget_alerts(update, operation)
 
 
 def report(update, context):
-    parser = parsers.ReportParser(update, context)
-    if not parser.is_valid():
-        reply_text(update, parser.error)
+    result = parsers.parse_command("report", update.effective_message.text)
+    if not result.ok:
+        reply_text(update, result.error.message)
+        return
+
+    operations = Operation.get_transactions_in_window(
+        update.effective_chat.id, result.values["window"]
+    )
+
+    # Rows are streamed page by page and sent in messages under Telegram's limit
+    message = ""
+    for page in Operation.iter_pages(operations, REPORT_PAGE_SIZE):
+        for t in page:
+            sign = get_operation_sign(t.operation_type)
+            line = (
+                f"ID: {t.id}\n"
+                f"Amount: {sign}{format_cents(t.amount)}\n"
+                f"Note: {t.note or '-'}\n"
+                f"Date: {timezone.localtime(t.created_at).strftime('%d.%m.%Y %H:%M')}\n"
+            )
+            if message and len(message) + len(line) + 1 > MESSAGE_MAX_LENGTH:
+                reply_text(update, message)
+                message = ""
+            message = f"{message}\n{line}" if message else line
+
+    if not message:
+        reply_text(update, "No transactions")
         return
+    reply_text(update, message)
 
-    operations = parser.validated_data["operations"]
 
-    lines = []
-    for t in operations:
-        sign = get_operation_sign(t.operation_type)
-        lines.append(
-            f"ID: {t.id}\n"
-            f"Amount: {sign}{t.amount:.2f}\n"
-            f"Note: {t.note or '-'}\n"
-            f"Date: {timezone.localtime(t.created_at).strftime('%d.%m.%Y %H:%M')}\n"
+def stats(update, context):
+    result = parsers.parse_command("stats", update.effective_message.text)
+    if not result.ok:
+        reply_text(update, result.error.message)
+        return
+
+    window = result.values["window"]
+    # Days still to come in the current period do not count
+    start_date = window.start_date
+    end_date = min(window.end_date, timezone.localdate())
+
+    # Reads at most one row per day and type, however many transactions there are
+    summary = DailyTotal.get_summary(
+        update.effective_chat.id, window.start_date, window.end_date
+    )
+    expense, _ = summary[OperationType.EXPENSE]
+    # A range that starts in the future has no days yet
+    if end_date < start_date:
+        end_date, days = window.end_date, 0
+    else:
+        days = (end_date - start_date).days + 1
+    average = round(expense / days) if days else 0
+
+    reply_text(
+        update,
+        f"Statistics for {start_date:%d.%m.%Y} - {end_date:%d.%m.%Y}\n"
+        f"{format_summary(summary)}\n"
+        f"Average expense per day: {format_cents(average)}",
+    )
+
+
+def export(update, context):
+    result = parsers.parse_command("export", update.effective_message.text)
+    if not result.ok:
+        reply_text(update, result.error.message)
+        return
+
+    window = result.values["window"]
+    file_format = result.values["format"]
+    compress = result.values["compress"]
+
+    # Rows are streamed into a temporary file, never held in memory
+    file, count = exporters.export_to_temporary_file(
+        update.effective_chat.id, file_format, window, compress
+    )
+    with file:
+        if not count:
+            reply_text(update, "No transactions")
+            return
+        update.message.reply_document(
+            document=file,
+            filename=exporters.get_file_name(file_format, window, compress),
         )
-    report = "\n".join(lines)
-    reply_text(update, report)
+
+
+def describe_schedule(schedule: RecurringOperation) -> str:
+    if schedule.frequency == Frequency.WEEKLY:
+        return f"weekly on weekday {schedule.day}"
+    if schedule.frequency == Frequency.MONTHLY:
+        return f"monthly on day {schedule.day}"
+    return "daily"
+
+
+def recurring(update, context):
+    chat_id = update.effective_chat.id
+    if not context.args:
+        schedules = RecurringOperation.objects.filter(chat_id=chat_id).order_by("id")
+        lines = [
+            f"ID: {schedule.id}\n"
+            f"Amount: {get_operation_sign(schedule.operation_type)}"
+            f"{format_cents(schedule.amount)}\n"
+            f"Note: {schedule.note or '-'}\n"
+            f"Repeats {describe_schedule(schedule)}, next on "
+            f"{timezone.localtime(schedule.next_run_at):%d.%m.%Y}\n"
+            for schedule in schedules
+        ]
+        reply_text(update, "\n".join(lines) or "No recurring transactions")
+        return
+
+    result = parsers.parse_command("recurring", update.effective_message.text)
+    if not result.ok:
+        reply_text(update, result.error.message)
+        return
+
+    values = result.values
+    if values.get("delete"):
+        deleted, _ = RecurringOperation.objects.filter(
+            id=values["recurring_id"], chat_id=chat_id
+        ).delete()
+        if not deleted:
+            reply_text(update, "You have no such recurring transaction")
+            return
+        reply_text(update, f"Recurring transaction {values['recurring_id']} stopped")
+        return
+
+    ensure_chat(chat_id, update.effective_user.username)
+    schedule = RecurringOperation(
+        chat_id=chat_id,
+        operation_type=values["operation_type"],
+        amount=values["amount"],
+        note=values["note"],
+        frequency=values["frequency"],
+        day=values["day"],
+        # Runs today if today is a run date, on the scheduler's next tick
+        next_run_at=get_run_at(
+            values["frequency"], values["day"], timezone.localdate()
+        ),
+    )
+    schedule.save()
+    sign = get_operation_sign(schedule.operation_type)
+    reply_text(
+        update,
+        f"Recurring transaction {schedule.id} added: {sign}"
+        f"{format_cents(schedule.amount)} {describe_schedule(schedule)}, "
+        f"first on {timezone.localtime(schedule.next_run_at):%d.%m.%Y}",
+    )
+
+
+def digest(update, context):
+    chat_id = update.effective_chat.id
+    subscriptions = DigestSubscription.objects.filter(chat_id=chat_id)
+    if not context.args:
+        frequencies = sorted(subscriptions.values_list("frequency", flat=True))
+        if not frequencies:
+            reply_text(update, "No digests. Use /digest <daily|weekly|monthly>")
+            return
+        reply_text(update, f"Digests: {', '.join(frequencies)}")
+        return
+
+    result = parsers.parse_command("digest", update.effective_message.text)
+    if not result.ok:
+        reply_text(update, result.error.message)
+        return
+
+    frequency = result.values["frequency"]
+    if result.values.get("off"):
+        if frequency is not None:
+            subscriptions = subscriptions.filter(frequency=frequency)
+        subscriptions.delete()
+        reply_text(update, "Digests stopped")
+        return
+
+    ensure_chat(chat_id, update.effective_user.username)
+    next_run_at = get_next_digest_at(frequency, timezone.now())
+    DigestSubscription.objects.update_or_create(
+        chat_id=chat_id, frequency=frequency, defaults={"next_run_at": next_run_at}
+    )
+    reply_text(
+        update,
+        f"{frequency.label} digest on, the first on "
+        f"{timezone.localtime(next_run_at):%d.%m.%Y %H:%M}",
+    )
+
+
+def budget(update, context):
+    chat_id = update.effective_chat.id
+    budgets = Budget.objects.filter(chat_id=chat_id)
+    if not context.args:
+        today = timezone.localdate()
+        lines = [
+            f"{budget.name}: {format_cents(budget.get_spent(today))} of "
+            f"{format_cents(budget.amount)} {budget.period}"
+            for budget in budgets.order_by("category", "period")
+        ]
+        if not lines:
+            reply_text(
+                update, "No budgets. Use /budget <category|total> <amount> <period>"
+            )
+            return
+        reply_text(update, "\n".join(lines))
+        return
+
+    result = parsers.parse_command("budget", update.effective_message.text)
+    if not result.ok:
+        reply_text(update, result.error.message)
+        return
+
+    values = result.values
+    if values.get("delete"):
+        budgets = budgets.filter(category=values["category"])
+        if values["period"] is not None:
+            budgets = budgets.filter(period=values["period"])
+        deleted, _ = budgets.delete()
+        reply_text(update, "Budget deleted" if deleted else "You have no such budget")
+        return
+
+    ensure_chat(chat_id, update.effective_user.username)
+    budget = Budget.set(chat_id, values["category"], values["period"], values["amount"])
+    reply_text(
+        update,
+        f"{values['period'].label} budget for {budget.name} set to "
+        f"{format_cents(budget.amount)}, {format_cents(budget.spent)} spent so far",
+    )
 
 
 def balance(update, context):
     chat_id = update.effective_chat.id
     balance = Operation.get_balance(chat_id=chat_id)
-    reply_text(update, f"Total balance: {balance:.2f}")
+    reply_text(update, f"Total balance: {format_cents(balance)}")
 
 
 def help(update, context):
@@ -116,3 +367,33 @@ def expense(update, context):
 
 def start(update, context):
     reply_text(update, START_TEXT)
+
+
+def import_document(update, context):
+    """Imports transactions from a CSV or JSON document sent to the bot."""
+    document = update.message.document
+    file_format = importers.get_file_format(document.file_name or "")
+
+    if file_format not in importers.IMPORT_FORMATS:
+        reply_text(update, "Only .csv, .json and .jsonl files can be imported")
+        return
+
+    with tempfile.TemporaryFile() as file:
+        document.get_file().download(out=file)
+        file.seek(0)
+        stream = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+        try:
+            result = importers.import_operations(
+                update.effective_chat.id,
+                update.effective_user.username,
+                importers.get_rows(stream, file_format),
+                batch_size=IMPORT_BATCH_SIZE,
+                max_errors=IMPORT_MAX_ERRORS,
+            )
+        except (ParsingError, UnicodeDecodeError, csv.Error) as e:
+            reply_text(update, f"Import stopped: {e}")
+            return
+
+    reply_text(update, result.summary())
+    for budget, threshold in result.alerts:
+        reply_text(update, format_budget_alert(budget, threshold))
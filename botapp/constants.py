@@ -23,10 +23,80 @@ HELP_TEXT = (
     "/report week - For the week\n"
     "/report month - For the month\n"
     "/report year - For the year\n"
+    "/report <from> <to> - For the dates, e.g. 2025-01-01 2025-03-31\n"
+    "/stats <interval> - Show income, expense and balance totals for a period\n"
+    "/stats <from> <to> - The same for the dates\n"
+    "/export [interval | <from> <to>] [csv|jsonl] [gz] - Download transactions "
+    "as a file\n"
     "/delete <id> - Delete transaction by ID\n"
     "/update <id> <±amount> [note] - Change existing transaction\n"
+    "/recurring - List recurring transactions\n"
+    "/recurring add <income|expense> <amount> [note] <daily|weekly|monthly> [day] "
+    "- Add a transaction on a schedule, day is 1-7 (Monday first) for weekly "
+    "and 1-31 for monthly, e.g. /recurring add expense 300 rent monthly 1\n"
+    "/recurring delete <id> - Stop a recurring transaction\n"
+    "/digest <daily|weekly|monthly> - Get a summary of each period\n"
+    "/digest off [daily|weekly|monthly] - Stop digests\n"
+    "/budget - Show budgets and what is spent\n"
+    "/budget <category|total> <amount> <daily|weekly|monthly> - Set a budget, "
+    "alerts come at 80% and 100%. The category is the first word of a note, "
+    "e.g. /budget food 300 monthly\n"
+    "/budget delete <category|total> [daily|weekly|monthly] - Delete a budget\n"
+    "Send a .csv, .json or .jsonl file - Import transactions "
+    "(columns: date, type, amount, note)\n"
 )
 
+# Telegram rejects longer text messages
+MESSAGE_MAX_LENGTH = 4096
+
+# Operations fetched per query when building a report
+REPORT_PAGE_SIZE = 200
+
+# Rows inserted per transaction when importing a file
+IMPORT_BATCH_SIZE = 1000
+
+# Row errors listed in the import reply
+IMPORT_MAX_ERRORS = 20
+
+# Longest JSON row an import reads before giving up on a malformed document
+IMPORT_MAX_ROW_LENGTH = 65536
+
+# Per chat `(tokens per second, burst)` for each command, checked before dispatch
+COMMAND_RATE_LIMITS = {
+    "default": (1, 5),
+    "report": (0.2, 3),
+    "stats": (0.5, 3),
+    "export": (1 / 60, 2),
+    "import": (1 / 60, 2),
+}
+
+RATE_LIMIT_TEXT = "Too many requests. Please wait a little and try again."
+
+# Refusals are sent at most once in this many seconds per chat and command
+RATE_LIMIT_REFUSAL_INTERVAL = 10
+
+# Telegram Bot API send limits: overall, per private chat and per group
+OUTBOUND_RATE_LIMIT = (30, 30)
+OUTBOUND_CHAT_RATE_LIMIT = (1, 3)
+OUTBOUND_GROUP_RATE_LIMIT = (20 / 60, 3)
+
+# Local hour digests are sent at
+DIGEST_HOUR = 9
+
+# Chats remembered per process, so writes can skip looking them up
+CHAT_CACHE_SIZE = 100000
+
+# Read-only commands whose replies are cached per chat until its data changes,
+# and whether they are cached when given arguments
+CACHED_COMMANDS = {
+    "balance": True,
+    "help": True,
+    "report": True,
+    "stats": True,
+    "income": False,
+    "expense": False,
+}
+
 MINUS_SIGN = "-"
 PLUS_SIGN = "+"
 
@@ -36,9 +106,14 @@ ALLOWED_COMMANDS = (
     "expense",
     "balance",
     "report",
+    "stats",
+    "export",
     "start",
     "delete",
     "update",
+    "recurring",
+    "digest",
+    "budget",
 )
 
 # This module contains all Telegram commands
@@ -0,0 +1,83 @@
+from botapp.throttling import CommandThrottle, get_bucket_store
+from botapp.exceptions import CommandRegistrarError
+from botapp.command_handlers import CommandRegistrar
+from telegram.ext import Dispatcher, Filters, MessageHandler
+from botapp.commands import import_document
+from botapp.metrics import instrument
+from botapp.utils import reply_text
+from django.conf import settings
+from botapp.bot import bot
+import warnings
+from botapp.constants import (
+    ALLOWED_COMMANDS,
+    COMMAND_RATE_LIMITS,
+    COMMANDS_MODULE,
+    RATE_LIMIT_REFUSAL_INTERVAL,
+    RATE_LIMIT_TEXT,
+)
+
+
+_dispatcher = None
+_command_throttle = None
+
+
+class UnkeptData(dict):
+    """
+    `chat_data` and `user_data` that hand out an empty dict without keeping it.
+    The commands keep their state in the database, and a process-wide
+    dispatcher would otherwise hold an entry for every chat and user it saw.
+    """
+
+    def __missing__(self, key):
+        return {}
+
+
+def build_dispatcher() -> Dispatcher:
+    """Create a dispatcher with all allowed commands registered."""
+    registrar = CommandRegistrar(ALLOWED_COMMANDS, COMMANDS_MODULE)
+    if not registrar.is_valid():
+        raise CommandRegistrarError(registrar.error)
+
+    # Updates are processed synchronously, there are no async callbacks to warn of
+    with warnings.catch_warnings():
+        warnings.filterwarnings(
+            "ignore", "Asynchronous callbacks can not be processed", UserWarning
+        )
+        dispatcher = Dispatcher(
+            bot, update_queue=None, workers=0, persistence=None, use_context=True
+        )
+    dispatcher.chat_data = UnkeptData()
+    dispatcher.user_data = UnkeptData()
+    registrar.register_commands(dispatcher)
+    dispatcher.add_handler(
+        MessageHandler(Filters.document, instrument("import", import_document))
+    )
+    return dispatcher
+
+
+def setup_dispatcher() -> Dispatcher:
+    """Build the process-wide dispatcher. Called once from `BotappConfig.ready`."""
+    global _dispatcher, _command_throttle
+    if _dispatcher is None:
+        _dispatcher = build_dispatcher()
+        _command_throttle = CommandThrottle(
+            get_bucket_store(settings.RATE_LIMIT_STORE),
+            COMMAND_RATE_LIMITS,
+            reply=reply_text,
+            refusal_text=RATE_LIMIT_TEXT,
+            refusal_interval=RATE_LIMIT_REFUSAL_INTERVAL,
+        )
+    return _dispatcher
+
+
+def get_dispatcher() -> Dispatcher:
+    if _dispatcher is None:
+        raise CommandRegistrarError("Dispatcher is not set up yet")
+    return _dispatcher
+
+
+def process_update(update):
+    """Dispatches an update unless its chat is over the command's rate limit."""
+    dispatcher = get_dispatcher()
+    if _command_throttle.allow(update):
+        dispatcher.process_update(update)
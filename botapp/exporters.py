@@ -0,0 +1,87 @@
+from botapp.money import format_cents
+from botapp.models import Operation
+from django.utils import timezone
+import tempfile
+import json
+import gzip
+import csv
+import io
+
+
+EXPORT_FORMATS = ("csv", "jsonl")
+
+# The same columns `importers` reads, plus the transaction ID
+EXPORT_FIELDS = ("id", "date", "type", "amount", "note")
+
+# Rows fetched from the database cursor at a time
+EXPORT_CHUNK_SIZE = 2000
+
+
+def iter_rows(chat_id: int, window=None):
+    """Yields the chat's operations as export rows, streamed from the database."""
+    if window is None:
+        operations = Operation.objects.filter(chat_id=chat_id)
+    else:
+        operations = Operation.get_transactions_in_window(chat_id, window)
+
+    rows = operations.order_by("created_at", "id").values_list(
+        "id", "created_at", "operation_type", "amount", "note"
+    )
+    for id, created_at, operation_type, amount, note in rows.iterator(
+        chunk_size=EXPORT_CHUNK_SIZE
+    ):
+        yield (
+            id,
+            timezone.localtime(created_at).isoformat(),
+            operation_type,
+            format_cents(amount),
+            note,
+        )
+
+
+def write_rows(stream, rows, file_format: str) -> int:
+    """Writes rows to a text stream and returns how many were written."""
+    count = 0
+    if file_format == "csv":
+        writer = csv.writer(stream)
+        writer.writerow(EXPORT_FIELDS)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    else:
+        for row in rows:
+            stream.write(json.dumps(dict(zip(EXPORT_FIELDS, row)), ensure_ascii=False))
+            stream.write("\n")
+            count += 1
+    return count
+
+
+def export_to_file(file, chat_id: int, file_format: str, window=None, compress=False):
+    """Exports into a binary file object and returns the number of rows."""
+    target = gzip.GzipFile(fileobj=file, mode="wb") if compress else file
+    stream = io.TextIOWrapper(target, encoding="utf-8", newline="")
+    try:
+        count = write_rows(stream, iter_rows(chat_id, window), file_format)
+        stream.flush()
+    finally:
+        # Leave `file` open for the caller
+        stream.detach()
+        if compress:
+            target.close()
+    return count
+
+
+def export_to_temporary_file(
+    chat_id: int, file_format: str, window=None, compress=False
+):
+    """Returns `(file, count)`, the file rewound and ready to upload."""
+    file = tempfile.TemporaryFile()
+    count = export_to_file(file, chat_id, file_format, window, compress)
+    file.seek(0)
+    return file, count
+
+
+def get_file_name(file_format: str, window=None, compress=False) -> str:
+    period = window.label if window else "all"
+    file_name = f"transactions-{period}.{file_format}"
+    return f"{file_name}.gz" if compress else file_name
@@ -0,0 +1,89 @@
+from collections import OrderedDict
+from django.core.cache import cache
+from django.conf import settings
+import threading
+import time
+
+
+class LocalUpdateStore:
+    """Update IDs seen by this process, bounded in size and forgotten after `ttl`."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self._seen = OrderedDict()
+        self._max_size = max_size
+        self._ttl = ttl
+        self._lock = threading.Lock()
+
+    def add(self, update_id: int) -> bool:
+        """Returns False if the update was already seen."""
+        now = time.monotonic()
+        with self._lock:
+            # IDs are kept in insertion order, so the expired ones come first
+            while self._seen and next(iter(self._seen.values())) <= now:
+                self._seen.popitem(last=False)
+
+            if update_id in self._seen:
+                return False
+            self._seen[update_id] = now + self._ttl
+            if len(self._seen) > self._max_size:
+                self._seen.popitem(last=False)
+        return True
+
+    def discard(self, update_id: int):
+        with self._lock:
+            self._seen.pop(update_id, None)
+
+
+class CacheUpdateStore:
+    """Update IDs in the Django cache, shared by every process using it."""
+
+    def __init__(self, ttl: float, prefix: str = "update"):
+        self._ttl = ttl
+        self._prefix = prefix
+
+    def add(self, update_id: int) -> bool:
+        # `cache.add` only stores keys that are missing, atomically
+        return cache.add(f"{self._prefix}:{update_id}", 1, timeout=self._ttl)
+
+    def discard(self, update_id: int):
+        cache.delete(f"{self._prefix}:{update_id}")
+
+
+def get_update_store(name: str):
+    if name == "cache":
+        return CacheUpdateStore(ttl=settings.UPDATE_DEDUP_TTL)
+    if name == "local":
+        return LocalUpdateStore(
+            max_size=settings.UPDATE_DEDUP_MAX_SIZE, ttl=settings.UPDATE_DEDUP_TTL
+        )
+    raise ValueError(f"Unknown update store: {name}")
+
+
+_update_store = None
+_update_store_lock = threading.Lock()
+
+
+def _get_store():
+    global _update_store
+    with _update_store_lock:
+        if _update_store is None:
+            _update_store = get_update_store(settings.UPDATE_DEDUP_STORE)
+        return _update_store
+
+
+def is_new_update(data) -> bool:
+    """
+    Records the `update_id` of a webhook payload. Returns False for a redelivery
+    of an update that was already accepted, which should be dropped.
+    """
+    update_id = data.get("update_id") if isinstance(data, dict) else None
+    if not isinstance(update_id, int):
+        return True
+    return _get_store().add(update_id)
+
+
+def forget_update(data):
+    """Lets a redelivery of the update through, e.g. after it failed."""
+    update_id = data.get("update_id") if isinstance(data, dict) else None
+    if isinstance(update_id, int):
+        _get_store().discard(update_id)
@@ -0,0 +1,192 @@
+from botapp.models import Operation, OperationType
+from botapp.responses import invalidate_chat
+from botapp.chats import ensure_chat
+from botapp.constants import IMPORT_MAX_ROW_LENGTH, MINUS_SIGN, PLUS_SIGN
+from django.core.exceptions import ValidationError
+from botapp.parsers import parse_amount, parse_note
+from botapp.exceptions import ParsingError
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils import timezone
+from datetime import datetime, time
+import json
+import csv
+
+
+IMPORT_FORMATS = ("csv", "json", "jsonl")
+
+
+class ImportResult:
+    """
+    Counts imported rows and keeps the first errors as `(row_number, message)`,
+    and the budget alerts of the imported expenses as `(budget, threshold)`.
+    """
+
+    def __init__(self, max_errors: int):
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+        self.alerts = []
+        self._max_errors = max_errors
+
+    def add_batch(self, batch: list):
+        Operation.bulk_insert(batch)
+        self.imported += len(batch)
+        for operation in batch:
+            self.alerts.extend(operation.budget_alerts)
+
+    def add_error(self, row_number: int, message: str):
+        self.failed += 1
+        if len(self.errors) < self._max_errors:
+            self.errors.append((row_number, message))
+
+    def summary(self) -> str:
+        lines = [f"Imported transactions: {self.imported}"]
+        if self.failed:
+            lines.append(f"Rows with errors: {self.failed}")
+            lines.extend(f"Row {number}: {message}" for number, message in self.errors)
+        return "\n".join(lines)
+
+
+def iter_csv_rows(stream):
+    """Yields `(row_number, row)` from a CSV with a `date,type,amount,note` header."""
+    reader = csv.DictReader(stream)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def iter_json_rows(
+    stream, chunk_size: int = 65536, max_row_length: int = IMPORT_MAX_ROW_LENGTH
+):
+    """
+    Yields `(row_number, row)` from a JSON array of objects or from JSON Lines,
+    decoding one object at a time instead of loading the whole document.
+    A row that does not decode within `max_row_length` characters is an error,
+    so a malformed document is never buffered whole.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    row_number = 0
+    eof = False
+
+    while True:
+        # Skip what separates the objects of an array or of JSON Lines
+        while position < len(buffer) and buffer[position] in " \t\r\n,[]":
+            position += 1
+
+        try:
+            row, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                if position < len(buffer):
+                    raise ParsingError(f"Invalid JSON after row {row_number}")
+                return
+            if len(buffer) - position > max_row_length:
+                raise ParsingError(
+                    f"Invalid JSON or a row over {max_row_length} characters "
+                    f"after row {row_number}"
+                )
+            chunk = stream.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+
+        row_number += 1
+        position = end
+        yield row_number, row
+
+
+def parse_created_at(value):
+    if not value:
+        return timezone.now()
+
+    value = str(value)
+    created_at = parse_datetime(value)
+    if created_at is None:
+        date = parse_date(value)
+        if date is None:
+            raise ParsingError("Invalid date")
+        created_at = datetime.combine(date, time())
+    if timezone.is_naive(created_at):
+        created_at = timezone.make_aware(created_at)
+    return created_at
+
+
+def parse_operation_type(value, amount: str):
+    if value:
+        try:
+            return OperationType(str(value).lower())
+        except ValueError:
+            raise ParsingError("Invalid type")
+
+    # Without a type, the sign decides, like in /update
+    if amount.startswith(PLUS_SIGN):
+        return OperationType.INCOME
+    if amount.startswith(MINUS_SIGN):
+        return OperationType.EXPENSE
+    raise ParsingError("Type is required for unsigned amounts")
+
+
+def parse_row(chat_id: int, row) -> Operation:
+    if not isinstance(row, dict):
+        raise ParsingError("Row is not an object")
+
+    amount = str(row.get("amount") or "").strip()
+    if not amount:
+        raise ParsingError("Amount is required")
+
+    operation = Operation(
+        chat_id=chat_id,
+        amount=parse_amount(amount),
+        operation_type=parse_operation_type(row.get("type"), amount),
+        note=parse_note(str(row.get("note") or "").split()),
+        created_at=parse_created_at(row.get("date")),
+    )
+    try:
+        # The same field rules as `Operation.save`, without database lookups
+        operation.clean_fields(exclude=["chat"])
+    except ValidationError as e:
+        raise ParsingError("; ".join(e.messages))
+    return operation
+
+
+def import_operations(
+    chat_id: int, username: str, rows, batch_size: int, max_errors: int
+) -> ImportResult:
+    """Validates `rows` and inserts the valid ones in batches of `batch_size`."""
+    ensure_chat(chat_id, username)
+
+    result = ImportResult(max_errors)
+    batch = []
+    try:
+        for row_number, row in rows:
+            try:
+                batch.append(parse_row(chat_id, row))
+            except ParsingError as e:
+                result.add_error(row_number, str(e))
+                continue
+
+            if len(batch) >= batch_size:
+                result.add_batch(batch)
+                batch = []
+
+        if batch:
+            result.add_batch(batch)
+    finally:
+        # Batches written before a failure stay imported
+        if result.imported:
+            invalidate_chat(chat_id)
+    return result
+
+
+def get_rows(stream, file_format: str):
+    if file_format == "csv":
+        return iter_csv_rows(stream)
+    if file_format in ("json", "jsonl"):
+        return iter_json_rows(stream)
+    raise ParsingError("Only .csv, .json and .jsonl files can be imported")
+
+
+def get_file_format(file_name: str) -> str:
+    return file_name.rsplit(".", 1)[-1].lower() if "." in file_name else ""
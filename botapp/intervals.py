@@ -0,0 +1,150 @@
+from datetime import date, datetime, time, timedelta
+from django.utils import timezone
+from django.conf import settings
+from enum import Enum
+import threading
+
+
+class Interval(Enum):
+    YESTERDAY = "yesterday"
+    DAY = "day"
+    WEEK = "week"
+    MONTH = "month"
+    YEAR = "year"
+
+
+def local_midnight(day: date, tz) -> datetime:
+    """The aware start of a local day, correct across DST changes."""
+    return datetime.combine(day, time(), tzinfo=tz)
+
+
+class Window:
+    """
+    A range of whole local days: `start <= created_at < end` for raw rows,
+    `start_date <= date <= end_date` for the daily totals.
+    """
+
+    __slots__ = ("start", "end", "start_date", "end_date", "label")
+
+    def __init__(self, start_date: date, end_date: date, tz, label: str):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.start = local_midnight(start_date, tz)
+        self.end = local_midnight(end_date + timedelta(days=1), tz)
+        self.label = label
+
+    @classmethod
+    def from_dates(cls, start_date: date, end_date: date, tz=None):
+        tz = tz or timezone.get_current_timezone()
+        return cls(start_date, end_date, tz, f"{start_date}_{end_date}")
+
+    def __eq__(self, other):
+        return isinstance(other, Window) and (self.start, self.end) == (
+            other.start,
+            other.end,
+        )
+
+    def __repr__(self):
+        return f"Window({self.start_date}, {self.end_date})"
+
+
+def get_dates(interval: Interval, today: date, week_start: int):
+    """The first and last day of the interval that contains `today`."""
+    match interval:
+        case Interval.DAY:
+            return today, today
+        case Interval.YESTERDAY:
+            yesterday = today - timedelta(days=1)
+            return yesterday, yesterday
+        case Interval.WEEK:
+            start = today - timedelta(days=(today.weekday() - week_start) % 7)
+            return start, start + timedelta(days=6)
+        case Interval.MONTH:
+            start = today.replace(day=1)
+            next_month = (start + timedelta(days=32)).replace(day=1)
+            return start, next_month - timedelta(days=1)
+        case Interval.YEAR:
+            return today.replace(month=1, day=1), today.replace(month=12, day=31)
+    raise ValueError("Unknown interval")
+
+
+def get_month_day(month: date, day: int) -> date:
+    """Day `day` of the month, or its last day if the month is shorter."""
+    next_month = (month.replace(day=1) + timedelta(days=32)).replace(day=1)
+    return month.replace(day=min(day, (next_month - timedelta(days=1)).day))
+
+
+def get_run_date(frequency: str, day: int, on_or_after: date) -> date:
+    """
+    The first date from `on_or_after` a schedule runs on: every "daily" date,
+    "weekly" on weekday `day` (1 is Monday), "monthly" on day `day`.
+    """
+    if frequency == "daily":
+        return on_or_after
+    if frequency == "weekly":
+        return on_or_after + timedelta(days=(day - 1 - on_or_after.weekday()) % 7)
+
+    run_date = get_month_day(on_or_after, day)
+    if run_date < on_or_after:
+        next_month = (on_or_after.replace(day=1) + timedelta(days=32)).replace(day=1)
+        run_date = get_month_day(next_month, day)
+    return run_date
+
+
+PERIOD_INTERVALS = {
+    "daily": Interval.DAY,
+    "weekly": Interval.WEEK,
+    "monthly": Interval.MONTH,
+}
+
+
+def get_period(frequency: str, day: date):
+    """The first and last day of the "daily", "weekly" or "monthly" period of `day`."""
+    return get_dates(PERIOD_INTERVALS[frequency], day, settings.WEEK_START)
+
+
+def get_previous_period(frequency: str, run_date: date):
+    """The first and last day of the period that ended before `run_date`."""
+    end = run_date - timedelta(days=1)
+    if frequency == "daily":
+        return end, end
+    if frequency == "weekly":
+        return run_date - timedelta(days=7), end
+    return end.replace(day=1), end
+
+
+class WindowCache:
+    """
+    Windows of the named intervals per time zone and week start. A window is
+    computed once and reused until local midnight, when any of them may roll over.
+    """
+
+    def __init__(self):
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def get(self, interval: Interval, tz=None, week_start: int = None, now=None):
+        tz = tz or timezone.get_current_timezone()
+        week_start = settings.WEEK_START if week_start is None else week_start
+        now = now or timezone.now()
+        key = (interval, str(tz), week_start)
+
+        cached = self._windows.get(key)
+        if cached is not None and cached[0] <= now < cached[1]:
+            return cached[2]
+
+        today = timezone.localtime(now, tz).date()
+        window = Window(*get_dates(interval, today, week_start), tz, interval.value)
+        valid_from = local_midnight(today, tz)
+        valid_until = local_midnight(today + timedelta(days=1), tz)
+        with self._lock:
+            self._windows[key] = (valid_from, valid_until, window)
+        return window
+
+
+window_cache = WindowCache()
+
+
+def get_window(interval: Interval, tz=None, week_start: int = None) -> Window:
+    """The window of a named interval, in `tz` or the configured time zone."""
+    return window_cache.get(interval, tz, week_start)
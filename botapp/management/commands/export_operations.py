@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from botapp.exceptions import ParsingError
+from botapp.parsers import get_interval, parse_range
+from botapp.intervals import get_window
+from botapp import exporters
+import sys
+
+
+class Command(BaseCommand):
+    help = "Export a chat's transactions to CSV or JSON Lines."
+
+    def add_arguments(self, parser):
+        parser.add_argument("chat_id", type=int)
+        parser.add_argument("--interval", help="day, week, month, year, yesterday")
+        parser.add_argument("--from", dest="start", help="YYYY-MM-DD, with --to")
+        parser.add_argument("--to", dest="end", help="YYYY-MM-DD, with --from")
+        parser.add_argument("--format", choices=exporters.EXPORT_FORMATS, default="csv")
+        parser.add_argument("--gzip", action="store_true")
+        parser.add_argument("--output", default="-", help="File path, - for stdout")
+
+    def handle(self, *args, **options):
+        window = None
+        try:
+            if options["start"] or options["end"]:
+                if not (options["start"] and options["end"]):
+                    raise ParsingError("--from and --to are used together")
+                window = parse_range(options["start"], options["end"])
+            elif options["interval"]:
+                window = get_window(get_interval(options["interval"]))
+        except ParsingError as e:
+            raise CommandError(str(e))
+
+        arguments = (options["chat_id"], options["format"], window, options["gzip"])
+        if options["output"] == "-":
+            sys.stdout.flush()
+            count = exporters.export_to_file(sys.stdout.buffer, *arguments)
+            sys.stdout.buffer.flush()
+        else:
+            with open(options["output"], "wb") as file:
+                count = exporters.export_to_file(file, *arguments)
+
+        self.stderr.write(f"Exported transactions: {count}")
@@ -0,0 +1,54 @@
+from botapp.responses import SHARED_CACHE_WARNING, is_shared_cache
+from django.core.management.base import BaseCommand, CommandError
+from botapp.constants import IMPORT_BATCH_SIZE
+from botapp.scheduler import send_messages
+from botapp.utils import format_budget_alert
+from botapp.exceptions import ParsingError
+from botapp import importers
+import csv
+
+
+class Command(BaseCommand):
+    help = "Import a chat's transactions from a CSV, JSON or JSON Lines file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("chat_id", type=int)
+        parser.add_argument("path", help="File with date, type, amount, note columns")
+        parser.add_argument("--format", choices=importers.IMPORT_FORMATS)
+        parser.add_argument(
+            "--username", help="Username of a new chat, or a new one for the chat"
+        )
+        parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+        parser.add_argument(
+            "--max-errors", type=int, default=100, help="Row errors to print"
+        )
+
+    def handle(self, *args, **options):
+        # The imported operations should drop the chat's replies cached by the bot
+        if not is_shared_cache():
+            self.stderr.write(f"Warning: {SHARED_CACHE_WARNING}")
+        file_format = options["format"] or importers.get_file_format(options["path"])
+
+        with open(options["path"], encoding="utf-8-sig", newline="") as stream:
+            try:
+                result = importers.import_operations(
+                    options["chat_id"],
+                    options["username"],
+                    importers.get_rows(stream, file_format),
+                    batch_size=options["batch_size"],
+                    max_errors=options["max_errors"],
+                )
+            except (ParsingError, UnicodeDecodeError, csv.Error) as e:
+                raise CommandError(f"Import stopped: {e}")
+
+        self.stdout.write(result.summary())
+        if result.alerts:
+            from botapp.bot import bot
+
+            # The chat learns of the budgets the import went over
+            alerts = [
+                (options["chat_id"], format_budget_alert(budget, threshold))
+                for budget, threshold in result.alerts
+            ]
+            send_messages(bot.send_message, alerts, workers=1)
+            self.stdout.write(f"Budget alerts sent: {len(alerts)}")
@@ -0,0 +1,110 @@
+from django.core.management.base import BaseCommand, CommandError
+from botapp.models import Budget, Chat, DailyTotal, Operation
+from botapp.money import format_cents
+from django.db import transaction
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the running chat totals, daily totals and budget spending "
+        "from the operations ledger."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chat", type=int, help="Only this chat ID")
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Only compare the totals with the ledger, change nothing",
+        )
+
+    def handle(self, *args, **options):
+        chat_id = options["chat"]
+        self.verify = options["verify"]
+
+        chats = Chat.objects.order_by("id")
+        if chat_id is not None:
+            chats = chats.filter(id=chat_id)
+
+        mismatches = 0
+        for chat in chats.iterator():
+            with transaction.atomic():
+                mismatches += self.check_chat_totals(chat)
+                mismatches += self.check_daily_totals(chat)
+                mismatches += self.check_budgets(chat)
+
+        if self.verify and mismatches:
+            raise CommandError(f"{mismatches} mismatch(es) with the ledger")
+
+        action = "Found" if self.verify else "Fixed"
+        self.stdout.write(self.style.SUCCESS(f"{action} {mismatches} mismatch(es)"))
+
+    def check_chat_totals(self, chat) -> int:
+        ledger = Operation.get_ledger_totals(chat.id)
+        expected = ledger.get(chat.id, {"income": 0, "expense": 0})
+        if (
+            chat.total_income == expected["income"]
+            and chat.total_expense == expected["expense"]
+        ):
+            return 0
+
+        self.stdout.write(
+            f"Chat {chat.id}: "
+            f"income {format_cents(chat.total_income)} "
+            f"!= {format_cents(expected['income'])}, "
+            f"expense {format_cents(chat.total_expense)} "
+            f"!= {format_cents(expected['expense'])}"
+        )
+        if not self.verify:
+            chat.total_income = expected["income"]
+            chat.total_expense = expected["expense"]
+            chat.save(update_fields=["total_income", "total_expense"])
+        return 1
+
+    def check_daily_totals(self, chat) -> int:
+        expected = DailyTotal.get_ledger_rows(chat.id)
+        stored = {
+            (row.date, row.operation_type): (row.total, row.count)
+            for row in DailyTotal.objects.filter(chat=chat).exclude(count=0)
+        }
+        if stored == expected:
+            return 0
+
+        self.stdout.write(f"Chat {chat.id}: daily totals differ from the ledger")
+        if not self.verify:
+            DailyTotal.objects.filter(chat=chat).delete()
+            DailyTotal.objects.bulk_create(
+                DailyTotal(
+                    chat=chat,
+                    date=date,
+                    operation_type=operation_type,
+                    total=total,
+                    count=count,
+                )
+                for (date, operation_type), (total, count) in expected.items()
+            )
+        return 1
+
+    def check_budgets(self, chat) -> int:
+        mismatches = 0
+        today = timezone.localdate()
+        for budget in Budget.objects.select_for_update().filter(chat=chat):
+            expected = budget.get_ledger_spent()
+            if budget.spent != expected:
+                self.stdout.write(
+                    f"Chat {chat.id}: {budget.period} budget for {budget.name} "
+                    f"spent {format_cents(budget.spent)} != {format_cents(expected)}"
+                )
+                mismatches += 1
+            if self.verify:
+                continue
+
+            # Budgets without expenses since their period ended roll over too
+            if today > budget.period_end:
+                budget.roll_over(today)
+                expected = budget.get_ledger_spent()
+            budget.spent = expected
+            budget.alerted = min(budget.alerted, budget.get_threshold())
+            budget.save()
+        return mismatches
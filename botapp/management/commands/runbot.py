@@ -0,0 +1,64 @@
+from apscheduler.schedulers.background import BackgroundScheduler
+from django.core.management.base import BaseCommand, CommandError
+from botapp.scheduler import build_scheduler
+from botapp.dispatcher import process_update
+from telegram.error import Conflict
+from botapp.polling import Poller
+from django.conf import settings
+from botapp.bot import bot
+import signal
+
+
+class Command(BaseCommand):
+    help = "Run the bot with getUpdates long polling instead of the webhook."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=settings.WEBHOOK_WORKERS)
+        parser.add_argument(
+            "--queue-size", type=int, default=settings.WEBHOOK_QUEUE_SIZE
+        )
+        parser.add_argument(
+            "--timeout", type=int, default=30, help="Long polling timeout, seconds"
+        )
+        parser.add_argument(
+            "--delete-webhook",
+            action="store_true",
+            help="Remove the webhook first, Telegram refuses getUpdates while set",
+        )
+        parser.add_argument(
+            "--scheduler",
+            action="store_true",
+            help="Also run recurring transactions and digests in this process",
+        )
+
+    def handle(self, *args, **options):
+        if options["delete_webhook"]:
+            bot.delete_webhook()
+
+        poller = Poller(
+            bot,
+            process_update,
+            workers=options["workers"],
+            queue_size=options["queue_size"],
+            timeout=options["timeout"],
+            allowed_updates=["message"],
+        )
+        scheduler = None
+        if options["scheduler"]:
+            scheduler = build_scheduler(BackgroundScheduler)
+            scheduler.start()
+
+        # Stop on SIGTERM like on Ctrl+C
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        self.stdout.write(f"Polling with {options['workers']} workers, Ctrl+C to stop")
+        try:
+            poller.run()
+        except Conflict as e:
+            poller.shutdown(commit=False)
+            raise CommandError(f"{e}. Run with --delete-webhook to remove the webhook")
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping, waiting for queued updates")
+        poller.shutdown()
+        if scheduler is not None:
+            scheduler.shutdown()
+        self.stdout.write("Stopped")
@@ -0,0 +1,26 @@
+from apscheduler.schedulers.blocking import BlockingScheduler
+from botapp.responses import SHARED_CACHE_WARNING, is_shared_cache
+from django.core.management.base import BaseCommand
+from botapp.scheduler import build_scheduler
+from django.conf import settings
+import signal
+
+
+class Command(BaseCommand):
+    help = "Add due recurring transactions and send digests, checking every minute."
+
+    def handle(self, *args, **options):
+        # Added operations should drop the cached replies of the bot's processes
+        if not is_shared_cache():
+            self.stderr.write(f"Warning: {SHARED_CACHE_WARNING}")
+        scheduler = build_scheduler(BlockingScheduler)
+        # Stop on SIGTERM like on Ctrl+C
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        self.stdout.write(
+            f"Checking every {settings.SCHEDULER_INTERVAL}s, Ctrl+C to stop"
+        )
+        try:
+            scheduler.start()
+        except KeyboardInterrupt:
+            scheduler.shutdown()
+        self.stdout.write("Stopped")
@@ -0,0 +1,273 @@
+from django.db import connection
+import threading
+import functools
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+
+class Series:
+    def __init__(self, buckets: tuple):
+        self.bucket_counts = [0] * len(buckets)
+        self.sum = 0
+        self.count = 0
+
+
+class Histogram:
+    """A Prometheus histogram with a single `command` label, kept per process."""
+
+    def __init__(self, name: str, description: str, buckets: tuple):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, command: str, value: float):
+        with self._lock:
+            series = self._series.get(command)
+            if series is None:
+                series = self._series[command] = Series(self.buckets)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series.bucket_counts[index] += 1
+            series.sum += value
+            series.count += 1
+
+    def count(self, command: str) -> int:
+        with self._lock:
+            series = self._series.get(command)
+            return series.count if series else 0
+
+    def sum(self, command: str) -> float:
+        with self._lock:
+            series = self._series.get(command)
+            return series.sum if series else 0
+
+    def render(self) -> list:
+        """Lines of the Prometheus text exposition format."""
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            for command, series in sorted(self._series.items()):
+                label = f'command="{command}"'
+                for bound, count in zip(self.buckets, series.bucket_counts):
+                    lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {count}')
+                lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {series.count}')
+                lines.append(f"{self.name}_sum{{{label}}} {series.sum}")
+                lines.append(f"{self.name}_count{{{label}}} {series.count}")
+        return lines
+
+
+command_duration = Histogram(
+    "bot_command_duration_seconds", "Wall time of a command.", DURATION_BUCKETS
+)
+command_db_queries = Histogram(
+    "bot_command_db_queries", "Database queries of a command.", QUERY_COUNT_BUCKETS
+)
+command_db_duration = Histogram(
+    "bot_command_db_duration_seconds",
+    "Time a command spent in database queries.",
+    DURATION_BUCKETS,
+)
+command_telegram_duration = Histogram(
+    "bot_command_telegram_duration_seconds",
+    "Time a command spent in Telegram Bot API calls.",
+    DURATION_BUCKETS,
+)
+command_parse_duration = Histogram(
+    "bot_command_parse_duration_seconds",
+    "Time a command spent parsing its arguments.",
+    DURATION_BUCKETS,
+)
+
+HISTOGRAMS = (
+    command_duration,
+    command_db_queries,
+    command_db_duration,
+    command_telegram_duration,
+    command_parse_duration,
+)
+
+
+class Counter:
+    """A Prometheus counter with a single `command` label, kept per process."""
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, command: str, amount: float = 1):
+        with self._lock:
+            self._values[command] = self._values.get(command, 0) + amount
+
+    def value(self, command: str) -> float:
+        with self._lock:
+            return self._values.get(command, 0)
+
+    def values(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> list:
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} counter",
+        ]
+        with self._lock:
+            for command, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{{command="{command}"}} {value}')
+        return lines
+
+
+response_cache_hits = Counter(
+    "bot_response_cache_hits_total", "Replies served from the response cache."
+)
+response_cache_misses = Counter(
+    "bot_response_cache_misses_total", "Replies rendered and stored in the cache."
+)
+response_cache_render_duration = Counter(
+    "bot_response_cache_render_seconds_total", "Time spent rendering cache misses."
+)
+response_cache_saved_duration = Counter(
+    "bot_response_cache_saved_seconds_total",
+    "Render time saved by hits, estimated from the average miss.",
+)
+
+COUNTERS = (
+    response_cache_hits,
+    response_cache_misses,
+    response_cache_render_duration,
+    response_cache_saved_duration,
+)
+
+
+class Gauge:
+    """A Prometheus gauge read from `collect()` when the metrics are rendered."""
+
+    def __init__(self, name: str, description: str, label: str):
+        self.name = name
+        self.description = description
+        self.label = label
+        self.collect = dict
+
+    def render(self) -> list:
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} gauge",
+        ]
+        for value, sample in sorted(self.collect().items()):
+            lines.append(f'{self.name}{{{self.label}="{value}"}} {sample}')
+        return lines
+
+
+update_queue_depth = Gauge(
+    "bot_update_queue_depth", "Updates waiting in a worker's queue.", "shard"
+)
+
+
+def get_response_cache_hit_ratios() -> dict:
+    hits, misses = response_cache_hits.values(), response_cache_misses.values()
+    return {
+        command: hits.get(command, 0) / (hits.get(command, 0) + misses.get(command, 0))
+        for command in hits.keys() | misses.keys()
+    }
+
+
+response_cache_hit_ratio = Gauge(
+    "bot_response_cache_hit_ratio",
+    "Share of cacheable replies served from the cache.",
+    "command",
+)
+response_cache_hit_ratio.collect = get_response_cache_hit_ratios
+
+GAUGES = (update_queue_depth, response_cache_hit_ratio)
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in HISTOGRAMS + COUNTERS + GAUGES:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class CommandTimings:
+    """What one command spent its time on, collected while it runs."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db = 0.0
+        self.telegram = 0.0
+        self.parse = 0.0
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db += time.perf_counter() - started
+
+
+class timed:
+    """
+    Adds the time of the block to `kind` ("telegram" or "parse") of the command.
+    A class, as `@contextmanager` costs more than parsing most commands.
+    """
+
+    __slots__ = ("kind", "timings", "started")
+
+    def __init__(self, kind: str):
+        self.kind = kind
+
+    def __enter__(self):
+        self.timings = getattr(_local, "timings", None)
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        if self.timings is not None:
+            elapsed = time.perf_counter() - self.started
+            setattr(self.timings, self.kind, getattr(self.timings, self.kind) + elapsed)
+
+
+def instrument(command: str, handler):
+    """Wraps a handler to record its timings as metrics and a log line."""
+
+    @functools.wraps(handler)
+    def wrapper(update, context):
+        timings = _local.timings = CommandTimings()
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(timings.record_query):
+                return handler(update, context)
+        finally:
+            _local.timings = None
+            duration = time.perf_counter() - started
+            command_duration.observe(command, duration)
+            command_db_queries.observe(command, timings.queries)
+            command_db_duration.observe(command, timings.db)
+            command_telegram_duration.observe(command, timings.telegram)
+            command_parse_duration.observe(command, timings.parse)
+            logger.info(
+                "command=%s duration_ms=%.1f db_queries=%d db_ms=%.1f "
+                "telegram_ms=%.1f parse_ms=%.1f",
+                command,
+                duration * 1000,
+                timings.queries,
+                timings.db * 1000,
+                timings.telegram * 1000,
+                timings.parse * 1000,
+            )
+
+    return wrapper
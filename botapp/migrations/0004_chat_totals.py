@@ -0,0 +1,39 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:53
+
+from django.db import migrations, models
+
+
+def fill_chat_totals(apps, schema_editor):
+    Chat = apps.get_model("botapp", "Chat")
+    Operation = apps.get_model("botapp", "Operation")
+
+    rows = (
+        Operation.objects.values("chat_id", "operation_type")
+        .annotate(total=models.Sum("amount"))
+        .order_by()
+    )
+    for row in rows:
+        Chat.objects.filter(id=row["chat_id"]).update(
+            **{f"total_{row['operation_type']}": row["total"]}
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("botapp", "0003_alter_operation_chat_alter_operation_operation_type"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chat",
+            name="total_expense",
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name="chat",
+            name="total_income",
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.RunPython(fill_chat_totals, migrations.RunPython.noop),
+    ]
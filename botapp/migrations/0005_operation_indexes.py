@@ -0,0 +1,26 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("botapp", "0004_chat_totals"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="operation",
+            index=models.Index(
+                fields=["chat", "created_at", "id"], name="operation_chat_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="operation",
+            index=models.Index(
+                fields=["chat", "operation_type", "amount"],
+                name="operation_chat_type_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+
+
+def fill_daily_totals(apps, schema_editor):
+    DailyTotal = apps.get_model("botapp", "DailyTotal")
+    Operation = apps.get_model("botapp", "Operation")
+
+    rows = (
+        Operation.objects.annotate(date=TruncDate("created_at"))
+        .values("chat_id", "date", "operation_type")
+        .annotate(total=models.Sum("amount"), count=models.Count("id"))
+        .order_by()
+    )
+    DailyTotal.objects.bulk_create(
+        (DailyTotal(**row) for row in rows.iterator()), batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("botapp", "0005_operation_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyTotal",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                (
+                    "operation_type",
+                    models.CharField(
+                        choices=[("income", "Income"), ("expense", "Expense")],
+                        max_length=10,
+                    ),
+                ),
+                (
+                    "total",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                ("count", models.IntegerField(default=0)),
+                (
+                    "chat",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="botapp.chat"
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("chat", "date", "operation_type"),
+                        name="daily_total_unique",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(fill_daily_totals, migrations.RunPython.noop),
+    ]
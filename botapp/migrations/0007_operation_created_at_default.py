@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-18 18:00
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("botapp", "0006_daily_totals"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="operation",
+            name="created_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,73 @@
+import django.core.validators
+from django.db import migrations, models
+from django.db.models.functions import Round
+
+
+# (model, field) pairs holding money
+AMOUNT_FIELDS = (
+    ("Operation", "amount"),
+    ("Chat", "total_income"),
+    ("Chat", "total_expense"),
+    ("DailyTotal", "total"),
+)
+
+
+def scale_amounts(factor):
+    def scale(apps, schema_editor):
+        for model_name, field in AMOUNT_FIELDS:
+            model = apps.get_model("botapp", model_name)
+            # Rounded, as SQLite stores decimals as floating point
+            model.objects.update(**{field: Round(models.F(field) * factor, 2)})
+
+    return scale
+
+
+def widen(max_digits):
+    """Decimal fields wide enough to hold the amounts while they are scaled."""
+    return [
+        migrations.AlterField(
+            model_name=model_name.lower(),
+            name=field,
+            field=models.DecimalField(
+                max_digits=max_digits, decimal_places=2, default=0
+            ),
+        )
+        for model_name, field in AMOUNT_FIELDS
+    ]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("botapp", "0007_operation_created_at_default"),
+    ]
+
+    operations = [
+        *widen(18),
+        migrations.RunPython(scale_amounts(100), scale_amounts(0.01)),
+        migrations.AlterField(
+            model_name="operation",
+            name="amount",
+            field=models.BigIntegerField(
+                validators=[
+                    django.core.validators.MinValueValidator(1),
+                    django.core.validators.MaxValueValidator(9999999999),
+                ]
+            ),
+        ),
+        migrations.AlterField(
+            model_name="chat",
+            name="total_income",
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name="chat",
+            name="total_expense",
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name="dailytotal",
+            name="total",
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -1,21 +1,40 @@
-from django.core.validators import MinValueValidator
-from django.db import models
-from datetime import timedelta
+from django.core.validators import MaxValueValidator, MinValueValidator
+from botapp.money import MAX_AMOUNT
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models.functions import TruncDate
+from botapp.intervals import Interval, Window, get_period, get_window
 from django.utils import timezone
-from enum import Enum
 
 
 class Chat(models.Model):
     id = models.PositiveBigIntegerField(primary_key=True)
     username = models.CharField(blank=False, null=False)
 
+    # Running totals of the chat's operations in cents, kept up to date by `Operation`
+    total_income = models.BigIntegerField(default=0)
+    total_expense = models.BigIntegerField(default=0)
 
-class Interval(Enum):
-    YESTERDAY = "yesterday"
-    DAY = "day"
-    WEEK = "week"
-    MONTH = "month"
-    YEAR = "year"
+    @classmethod
+    def add_to_totals(cls, chat_id: int, income=0, expense=0):
+        cls.objects.filter(id=chat_id).update(
+            total_income=models.F("total_income") + income,
+            total_expense=models.F("total_expense") + expense,
+        )
+
+    @classmethod
+    def add_many_to_totals(cls, totals: dict):
+        """
+        Add `{chat_id: (income, expense)}` with one update per distinct pair,
+        so chats that got the same amounts, e.g. from one schedule, share it.
+        """
+        chat_ids = {}
+        for chat_id, amounts in totals.items():
+            chat_ids.setdefault(amounts, []).append(chat_id)
+        for (income, expense), ids in chat_ids.items():
+            cls.objects.filter(id__in=ids).update(
+                total_income=models.F("total_income") + income,
+                total_expense=models.F("total_expense") + expense,
+            )
 
 
 class OperationType(models.TextChoices):
@@ -23,68 +42,542 @@ class OperationType(models.TextChoices):
     EXPENSE = "expense", "Expense"
 
 
+def get_category(note: str) -> str:
+    """The budget category of an operation: the first word of its note, lowercased."""
+    words = note.split(maxsplit=1)
+    return words[0].lower() if words else ""
+
+
+def add_expense(spending: dict, values: dict, factor: int):
+    """Add an expense to `{(chat_id, category, date): amount}` for `Budget`."""
+    if values["operation_type"] != OperationType.EXPENSE:
+        return
+    key = (
+        values["chat_id"],
+        get_category(values["note"]),
+        timezone.localdate(values["created_at"]),
+    )
+    spending[key] = spending.get(key, 0) + values["amount"] * factor
+
+
 class Operation(models.Model):
     chat = models.ForeignKey(Chat, on_delete=models.CASCADE)
-    amount = models.DecimalField(
-        max_digits=10, decimal_places=2, validators=[MinValueValidator(0.01)]
+    # In cents, see `botapp.money`
+    amount = models.BigIntegerField(
+        validators=[MinValueValidator(1), MaxValueValidator(MAX_AMOUNT)]
     )
     operation_type = models.CharField(
         max_length=10, choices=OperationType.choices, default=None
     )
     note = models.CharField(max_length=255, null=False, blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Reports: chat operations within a date range
+            models.Index(
+                fields=["chat", "created_at", "id"], name="operation_chat_created_idx"
+            ),
+            # Totals by type, covering so the sum never touches the table
+            models.Index(
+                fields=["chat", "operation_type", "amount"],
+                name="operation_chat_type_idx",
+            ),
+        ]
+
+    @classmethod
+    def get_transactions_in_window(cls, chat_id: int, window: Window):
+        return cls.objects.filter(
+            chat_id=chat_id, created_at__gte=window.start, created_at__lt=window.end
+        )
 
     @classmethod
     def get_transactions_by_interval(cls, chat_id: int, interval: Interval):
-        now = timezone.now()
-
-        match interval:
-            case Interval.DAY:
-                start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-                end = now
-            case Interval.YESTERDAY:
-                start = (now - timedelta(days=1)).replace(
-                    hour=0, minute=0, second=0, microsecond=0
-                )
-                end = (now - timedelta(days=1)).replace(
-                    hour=23, minute=59, second=59, microsecond=999999
-                )
-            case Interval.WEEK:
-                start = (now - timedelta(days=now.weekday())).replace(
-                    hour=0, minute=0, second=0, microsecond=0
-                )
-                end = now
-            case Interval.MONTH:
-                start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-                end = now
-            case Interval.YEAR:
-                start = now.replace(
-                    month=1, day=1, hour=0, minute=0, second=0, microsecond=0
-                )
-                end = now
-            case _:
-                raise ValueError("Unknown interval")
+        return cls.get_transactions_in_window(chat_id, get_window(interval))
 
-        operations = cls.objects.filter(
-            chat_id=chat_id, created_at__gte=start, created_at__lte=end
-        )
-        return operations
+    # Fields the chat and daily totals and the budgets depend on
+    TOTALS_FIELDS = ("chat_id", "operation_type", "amount", "note", "created_at")
+
+    # `(budget, threshold)` of the budget thresholds the last write crossed
+    budget_alerts = ()
 
     @classmethod
-    def get_sum_by_type(cls, chat_id: int, operation_type) -> float:
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # What is stored in the database, used to adjust the totals
+        stored_values = dict(zip(field_names, values))
+        if all(field in stored_values for field in cls.TOTALS_FIELDS):
+            instance._stored_values = {
+                field: stored_values[field] for field in cls.TOTALS_FIELDS
+            }
+        return instance
+
+    @classmethod
+    def iter_pages(cls, operations, page_size: int):
+        """
+        Yield `operations` page by page in (created_at, id) order.
+        Keyset pagination keeps every page query cheap, no matter how deep.
+        """
+        operations = operations.order_by("created_at", "id")
+        page = list(operations[:page_size])
+        while page:
+            yield page
+            if len(page) < page_size:
+                return
+            last = page[-1]
+            page = list(
+                operations.filter(
+                    models.Q(created_at__gt=last.created_at)
+                    | models.Q(created_at=last.created_at, id__gt=last.id)
+                )[:page_size]
+            )
+
+    @classmethod
+    def get_sum_by_type(cls, chat_id: int, operation_type) -> int:
         if operation_type not in OperationType:
             raise ValueError("Invalid operation type")
 
-        operations = cls.objects.filter(chat_id=chat_id, operation_type=operation_type)
-        total_amount = operations.aggregate(total=models.Sum("amount"))["total"] or 0
-        return total_amount
+        field = f"total_{operation_type.value}"
+        total_amount = (
+            Chat.objects.filter(id=chat_id).values_list(field, flat=True).first()
+        )
+        return total_amount or 0
 
     @classmethod
-    def get_balance(cls, chat_id: int):
-        total_expense = cls.get_sum_by_type(chat_id, OperationType.EXPENSE)
-        total_income = cls.get_sum_by_type(chat_id, OperationType.INCOME)
+    def get_balance(cls, chat_id: int) -> int:
+        totals = (
+            Chat.objects.filter(id=chat_id)
+            .values_list("total_income", "total_expense")
+            .first()
+        )
+        if not totals:
+            return 0
+        total_income, total_expense = totals
         return total_income - total_expense
 
+    @classmethod
+    def get_ledger_totals(cls, chat_id: int = None) -> dict:
+        """
+        Sum the raw ledger, ignoring the running totals.
+        Returns `{chat_id: {"income": ..., "expense": ...}}`.
+        """
+        operations = cls.objects.all()
+        if chat_id is not None:
+            operations = operations.filter(chat_id=chat_id)
+
+        totals = {}
+        rows = operations.values("chat_id", "operation_type").annotate(
+            total=models.Sum("amount")
+        )
+        for row in rows.order_by():
+            chat_totals = totals.setdefault(row["chat_id"], {"income": 0, "expense": 0})
+            chat_totals[row["operation_type"]] = row["total"]
+        return totals
+
+    @classmethod
+    def bulk_insert(cls, operations: list, batch_size: int = None):
+        """
+        Insert already validated operations with `bulk_create` and add them
+        to the chat and daily totals and the budgets in the same transaction.
+        The budget alerts are set on the last operation of each chat.
+        """
+        chat_totals = {}
+        daily_totals = {}
+        spending = {}
+        for operation in operations:
+            add_expense(spending, operation._current_values(), 1)
+            income, expense = chat_totals.get(operation.chat_id, (0, 0))
+            if operation.operation_type == OperationType.INCOME:
+                income += operation.amount
+            else:
+                expense += operation.amount
+            chat_totals[operation.chat_id] = (income, expense)
+
+            key = (
+                operation.chat_id,
+                timezone.localdate(operation.created_at),
+                operation.operation_type,
+            )
+            total, count = daily_totals.get(key, (0, 0))
+            daily_totals[key] = (total + operation.amount, count + 1)
+
+        with transaction.atomic():
+            created = cls.objects.bulk_create(operations, batch_size=batch_size)
+            Chat.add_many_to_totals(chat_totals)
+            DailyTotal.add_many(daily_totals)
+            alerts = Budget.add_spending(spending)
+
+        last_operations = {operation.chat_id: operation for operation in operations}
+        for budget, threshold in alerts:
+            operation = last_operations[budget.chat_id]
+            operation.budget_alerts = (*operation.budget_alerts, (budget, threshold))
+        return created
+
+    def _add_to_totals(self, values: dict, factor: int):
+        amount = values["amount"] * factor
+        if values["operation_type"] == OperationType.INCOME:
+            Chat.add_to_totals(values["chat_id"], income=amount)
+        else:
+            Chat.add_to_totals(values["chat_id"], expense=amount)
+
+        DailyTotal.add(
+            values["chat_id"],
+            timezone.localdate(values["created_at"]),
+            values["operation_type"],
+            amount,
+            factor,
+        )
+
+    def _current_values(self) -> dict:
+        return {field: getattr(self, field) for field in self.TOTALS_FIELDS}
+
+    def _get_stored_values(self):
+        if self._state.adding:
+            return None
+        stored_values = getattr(self, "_stored_values", None)
+        if stored_values is None:
+            stored_values = (
+                Operation.objects.filter(pk=self.pk).values(*self.TOTALS_FIELDS).first()
+            )
+        return stored_values
+
     def save(self, *args, **kwargs):
-        self.full_clean()
-        super().save(*args, **kwargs)
+        # The database enforces the chat foreign key, no need to look it up
+        self.full_clean(exclude=["chat"])
+        with transaction.atomic():
+            stored_values = self._get_stored_values()
+            super().save(*args, **kwargs)
+            current_values = self._current_values()
+            spending = {}
+            if stored_values:
+                self._add_to_totals(stored_values, -1)
+                add_expense(spending, stored_values, -1)
+            self._add_to_totals(current_values, 1)
+            add_expense(spending, current_values, 1)
+            self.budget_alerts = Budget.add_spending(spending)
+        self._stored_values = current_values
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            stored_values = self._get_stored_values()
+            result = super().delete(*args, **kwargs)
+            if stored_values:
+                self._add_to_totals(stored_values, -1)
+                spending = {}
+                add_expense(spending, stored_values, -1)
+                Budget.add_spending(spending)
+        self._stored_values = None
+        return result
+
+
+class DailyTotal(models.Model):
+    """Sum in cents and count of a chat's operations per local day and type."""
+
+    chat = models.ForeignKey(Chat, on_delete=models.CASCADE)
+    date = models.DateField()
+    operation_type = models.CharField(max_length=10, choices=OperationType.choices)
+    total = models.BigIntegerField(default=0)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["chat", "date", "operation_type"], name="daily_total_unique"
+            ),
+        ]
+
+    @classmethod
+    def add(cls, chat_id: int, date, operation_type, amount, count: int):
+        lookup = {"chat_id": chat_id, "date": date, "operation_type": operation_type}
+        updated = cls.objects.filter(**lookup).update(
+            total=models.F("total") + amount, count=models.F("count") + count
+        )
+        if updated:
+            return
+
+        try:
+            with transaction.atomic():
+                cls.objects.create(**lookup, total=amount, count=count)
+        except IntegrityError:
+            # Another write created the row first
+            cls.objects.filter(**lookup).update(
+                total=models.F("total") + amount, count=models.F("count") + count
+            )
+
+    @classmethod
+    def add_many(cls, totals: dict):
+        """
+        Add `{(chat_id, date, operation_type): (amount, count)}` with one upsert
+        per batch, however many days are touched. The conflict clause adds to
+        the stored row, so concurrent writers that both miss a row do not
+        overwrite each other's increments.
+        """
+        if not totals:
+            return
+        ops = connection.ops
+        fields = [
+            cls._meta.get_field(name)
+            for name in ("chat", "date", "operation_type", "total", "count")
+        ]
+        table = ops.quote_name(cls._meta.db_table)
+        columns = [ops.quote_name(field.column) for field in fields]
+        unique = ", ".join(columns[:3])
+        total, count = (ops.quote_name(name) for name in ("total", "count"))
+        rows = [
+            (chat_id, ops.adapt_datefield_value(date), operation_type, amount, number)
+            for (chat_id, date, operation_type), (amount, number) in totals.items()
+        ]
+
+        batch_size = ops.bulk_batch_size(fields, rows)
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start : start + batch_size]
+                values = ", ".join(["(%s, %s, %s, %s, %s)"] * len(batch))
+                cursor.execute(
+                    f"INSERT INTO {table} ({', '.join(columns)}) VALUES {values} "
+                    f"ON CONFLICT ({unique}) DO UPDATE SET "
+                    f"{total} = {table}.{total} + excluded.{total}, "
+                    f"{count} = {table}.{count} + excluded.{count}",
+                    [value for row in batch for value in row],
+                )
+
+    @classmethod
+    def get_ledger_rows(cls, chat_id: int) -> dict:
+        """
+        Daily totals computed from the raw ledger.
+        Returns `{(date, operation_type): (total, count)}`.
+        """
+        rows = (
+            Operation.objects.filter(chat_id=chat_id)
+            .annotate(date=TruncDate("created_at"))
+            .values("date", "operation_type")
+            .annotate(total=models.Sum("amount"), count=models.Count("id"))
+            .order_by()
+        )
+        return {
+            (row["date"], row["operation_type"]): (row["total"], row["count"])
+            for row in rows
+        }
+
+    @classmethod
+    def get_summary(cls, chat_id: int, start_date, end_date) -> dict:
+        """Returns `{operation_type: (total, count)}` for the dates, inclusive."""
+        rows = (
+            cls.objects.filter(
+                chat_id=chat_id, date__gte=start_date, date__lte=end_date
+            )
+            .values("operation_type")
+            .annotate(total=models.Sum("total"), count=models.Sum("count"))
+            .order_by()
+        )
+        summary = {operation_type.value: (0, 0) for operation_type in OperationType}
+        for row in rows:
+            summary[row["operation_type"]] = (row["total"] or 0, row["count"] or 0)
+        return summary
+
+    @classmethod
+    def get_summaries(cls, chat_ids, start_date, end_date) -> dict:
+        """`get_summary` of many chats in one query: `{chat_id: summary}`."""
+        rows = (
+            cls.objects.filter(
+                chat_id__in=chat_ids, date__gte=start_date, date__lte=end_date
+            )
+            .values("chat_id", "operation_type")
+            .annotate(total=models.Sum("total"), count=models.Sum("count"))
+            .order_by()
+        )
+        summaries = {
+            chat_id: {operation_type.value: (0, 0) for operation_type in OperationType}
+            for chat_id in chat_ids
+        }
+        for row in rows:
+            summaries[row["chat_id"]][row["operation_type"]] = (
+                row["total"] or 0,
+                row["count"] or 0,
+            )
+        return summaries
+
+
+class Frequency(models.TextChoices):
+    DAILY = "daily", "Daily"
+    WEEKLY = "weekly", "Weekly"
+    MONTHLY = "monthly", "Monthly"
+
+
+class RecurringOperation(models.Model):
+    """
+    An operation added on a schedule: every day, on weekday `day` (1 is Monday)
+    or on day `day` of the month. The rows are the job store, the scheduler
+    selects the due ones by `next_run_at`.
+    """
+
+    chat = models.ForeignKey(Chat, on_delete=models.CASCADE)
+    operation_type = models.CharField(max_length=10, choices=OperationType.choices)
+    amount = models.BigIntegerField(
+        validators=[MinValueValidator(1), MaxValueValidator(MAX_AMOUNT)]
+    )
+    note = models.CharField(max_length=255, blank=True)
+    frequency = models.CharField(max_length=10, choices=Frequency.choices)
+    day = models.PositiveSmallIntegerField(default=1)
+    next_run_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [models.Index(fields=["next_run_at"], name="recurring_next_run_idx")]
+
+
+class DigestSubscription(models.Model):
+    """A chat's opt-in to a daily, weekly or monthly summary message."""
+
+    chat = models.ForeignKey(Chat, on_delete=models.CASCADE)
+    frequency = models.CharField(max_length=10, choices=Frequency.choices)
+    next_run_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["chat", "frequency"], name="digest_subscription_unique"
+            ),
+        ]
+        indexes = [models.Index(fields=["next_run_at"], name="digest_next_run_idx")]
+
+
+class Budget(models.Model):
+    """
+    A spending limit per day, week or month, on all of a chat's expenses or on
+    one category of them. `spent` is the sum of the expenses from `period_start`
+    to `period_end`, kept up to date by `Operation` like the totals; an expense
+    after the period, up to today, rolls the budget over to the expense's period.
+    """
+
+    # The category of budgets on all expenses
+    TOTAL = ""
+    # Percentages of the amount to alert at
+    THRESHOLDS = (80, 100)
+
+    chat = models.ForeignKey(Chat, on_delete=models.CASCADE)
+    category = models.CharField(max_length=255, blank=True)
+    amount = models.BigIntegerField(
+        validators=[MinValueValidator(1), MaxValueValidator(MAX_AMOUNT)]
+    )
+    period = models.CharField(max_length=10, choices=Frequency.choices)
+    period_start = models.DateField()
+    period_end = models.DateField()
+    spent = models.BigIntegerField(default=0)
+    # The highest threshold reached in this period, alerts are sent once
+    alerted = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["chat", "category", "period"], name="budget_unique"
+            ),
+        ]
+
+    @property
+    def name(self) -> str:
+        return self.category or "all expenses"
+
+    def get_threshold(self) -> int:
+        """The highest threshold `spent` has reached, 0 if none."""
+        reached = [t for t in self.THRESHOLDS if self.spent * 100 >= self.amount * t]
+        return max(reached, default=0)
+
+    def get_spent(self, today) -> int:
+        """`spent` in the period of `today`, which is 0 if the budget did not roll over."""
+        return self.spent if today <= self.period_end else 0
+
+    def roll_over(self, day):
+        self.period_start, self.period_end = get_period(self.period, day)
+        self.spent = 0
+        self.alerted = 0
+
+    def add(self, day, amount: int, today) -> bool:
+        """
+        Add an expense of `day`. Returns whether it falls in the period.
+        Expenses dated after `today` never roll the budget over.
+        """
+        if self.period_end < day <= today and amount > 0:
+            self.roll_over(day)
+        elif not self.period_start <= day <= self.period_end:
+            return False
+        self.spent += amount
+        return True
+
+    def get_ledger_spent(self) -> int:
+        """`spent` of the period computed from the raw ledger."""
+        window = Window.from_dates(self.period_start, self.period_end)
+        expenses = Operation.get_transactions_in_window(self.chat_id, window).filter(
+            operation_type=OperationType.EXPENSE
+        )
+        if self.category == self.TOTAL:
+            return expenses.aggregate(total=models.Sum("amount"))["total"] or 0
+        # Matched in Python, database `LOWER` and `LIKE` are ASCII only in SQLite
+        return sum(
+            amount
+            for note, amount in expenses.values_list("note", "amount").iterator()
+            if get_category(note) == self.category
+        )
+
+    @classmethod
+    def set(cls, chat_id: int, category: str, period: str, amount: int):
+        """Create or change a budget, counting the current period's expenses."""
+        with transaction.atomic():
+            budget = (
+                cls.objects.select_for_update()
+                .filter(chat_id=chat_id, category=category, period=period)
+                .first()
+            ) or cls(chat_id=chat_id, category=category, period=period)
+            budget.amount = amount
+            budget.roll_over(timezone.localdate())
+            budget.spent = budget.get_ledger_spent()
+            # No alert for what was spent before the budget was set
+            budget.alerted = budget.get_threshold()
+            budget.full_clean(exclude=["chat"])
+            budget.save()
+        return budget
+
+    @classmethod
+    def add_spending(cls, spending: dict) -> list:
+        """
+        Add `{(chat_id, category, date): amount}` of expenses, negative for
+        removed ones, to the budgets they fall in: one read, and one write when
+        any budget changed. Returns `(budget, threshold)` of each threshold
+        newly reached.
+        """
+        spending = {key: amount for key, amount in spending.items() if amount}
+        if not spending:
+            return []
+
+        chat_ids = {chat_id for chat_id, _, _ in spending}
+        categories = {category for _, category, _ in spending} | {cls.TOTAL}
+        budgets = {}
+        for budget in cls.objects.select_for_update().filter(
+            chat_id__in=chat_ids, category__in=categories
+        ):
+            budgets.setdefault((budget.chat_id, budget.category), []).append(budget)
+        if not budgets:
+            return []
+
+        changed = {}
+        today = timezone.localdate()
+        # In date order, so that a later period's expense rolls a budget over last
+        for (chat_id, category, day), amount in sorted(
+            spending.items(), key=lambda item: item[0][2]
+        ):
+            for key in {(chat_id, category), (chat_id, cls.TOTAL)}:
+                for budget in budgets.get(key, ()):
+                    if budget.add(day, amount, today):
+                        changed[budget.id] = budget
+
+        alerts = []
+        for budget in changed.values():
+            threshold = budget.get_threshold()
+            if threshold > budget.alerted:
+                alerts.append((budget, threshold))
+            # Falling below a threshold, e.g. on delete, alerts again on the next rise
+            budget.alerted = threshold
+        if changed:
+            cls.objects.bulk_update(
+                changed.values(), ["period_start", "period_end", "spent", "alerted"]
+            )
+        return alerts
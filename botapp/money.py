@@ -0,0 +1,32 @@
+# Amounts are integer cents everywhere: parsed from text and rendered here only.
+
+# The largest amount of one operation, 99 999 999.99
+MAX_AMOUNT = 99_999_999_99
+
+
+def to_cents(text: str):
+    """`12`, `12.5`, `+.99` or `-3.50` in cents, without the sign. None if invalid."""
+    if text[:1] in ("+", "-"):
+        text = text[1:]
+    units, _, fraction = text.partition(".")
+    digits = units + fraction.ljust(2, "0")
+    # `isdigit` alone accepts digits of other scripts, `int` would take them too
+    if len(fraction) > 2 or not digits.isascii() or not digits.isdigit():
+        return None
+    if not units and not fraction:
+        return None
+    return int(digits)
+
+
+def parse_cents(text: str) -> int:
+    cents = to_cents(text)
+    if cents is None:
+        raise ValueError(f"Invalid amount: {text!r}")
+    return cents
+
+
+def format_cents(cents: int) -> str:
+    """`1250` as `12.50`, `-5` as `-0.05`."""
+    if cents < 0:
+        return f"-{format_cents(-cents)}"
+    return f"{cents // 100}.{cents % 100:02d}"
@@ -1,165 +1,429 @@
+from botapp.money import MAX_AMOUNT, format_cents, to_cents
+from botapp.intervals import Interval, Window, get_window
 from botapp.constants import MINUS_SIGN, PLUS_SIGN
-from botapp.models import Operation, OperationType, Interval
 from botapp.exceptions import ParsingError
+from botapp.exporters import EXPORT_FORMATS
+from botapp.models import Budget, Frequency, OperationType
+from botapp.metrics import timed
+from datetime import date
 
 
-def get_interval(interval: Interval):
-    try:
-        interval = Interval(interval)
-    except Exception:
-        raise ParsingError("There is no such interval. Please check /help")
-    return interval
+class ArgumentError:
+    """Why the arguments of a command were rejected, and at which token."""
 
+    __slots__ = ("code", "message", "position", "token")
 
-def parse_amount(amount) -> float:
-    try:
-        amount = float(amount)
-        return abs(amount)
-    except ValueError:
-        raise ParsingError("Invalid amount")
+    def __init__(self, code: str, message: str, position: int = None, token=None):
+        self.code = code
+        self.message = message
+        self.position = position
+        self.token = token
 
+    def __str__(self):
+        return self.message
 
-def parse_id(id) -> int:
-    try:
-        id = int(id)
-        if id < 0:
-            raise ParsingError("The ID can't be less than 0")
-        return id
-    except ValueError:
-        raise ParsingError("Invalid ID")
+    def __repr__(self):
+        return f"ArgumentError({self.code!r}, {self.message!r}, {self.position})"
 
 
-def parse_note(note: list) -> str:
-    return " ".join(note)
+class ParseResult:
+    """The arguments of one command: `values` when valid, else `error`."""
 
+    __slots__ = ("command", "args", "values", "error")
 
-class ParserUtils:
-    """The properties can be used even without validation `.is_valid()`."""
+    def __init__(self, command: str, args: list, values, error):
+        self.command = command
+        self.args = args
+        self.values = values
+        self.error = error
 
     @property
-    def chat_id(self):
-        if not hasattr(self, "update"):
-            raise ParsingError("Hasn't attribute `update`")
-        return self.update.effective_chat.id
+    def ok(self) -> bool:
+        return self.error is None
 
-    @property
-    def username(self):
-        if not hasattr(self, "update"):
-            raise ParsingError("Hasn't attribute `update`")
-        return self.update.effective_user.username
 
+# Converters return the value of a token, or an `ArgumentError` instead of raising
 
-class Parser:
-    def __init__(self, update, context):
-        self.__context = context
-        self.__update = update
-        self.__is_valid = False
-        self.__error = None
-        self.__validated_data = None
+INTERVALS = {interval.value: interval for interval in Interval}
 
-    @property
-    def context(self):
-        return self.__context
+# The budget category of all expenses
+TOTAL_CATEGORY = "total"
 
-    @property
-    def update(self):
-        return self.__update
+AMOUNT_RANGE_ERROR = f"The amount must be from 0.01 to {format_cents(MAX_AMOUNT)}"
 
-    @property
-    def error(self):
-        return self.__error
 
-    @property
-    def validated_data(self):
-        """
-        Check `.is_valid()` before accessing `.validated_data`,
-        or it will raise an exception.
-        """
-        if not self.__is_valid:
-            raise ParsingError("Call `.is_valid()` first")
-        return self.__validated_data
-
-    def is_valid(self):
-        """Used to understand if data was successfully parsed."""
+def convert_amount(token: str):
+    cents = to_cents(token)
+    if cents is None:
+        return ArgumentError("invalid_amount", "Invalid amount")
+    if not 0 < cents <= MAX_AMOUNT:
+        return ArgumentError("amount_out_of_range", AMOUNT_RANGE_ERROR)
+    return cents
+
+
+def convert_signed_amount(token: str):
+    """`+amount` is an income and `-amount` an expense: `(operation_type, cents)`."""
+    cents = convert_amount(token)
+    if type(cents) is ArgumentError:
+        return cents
+    if token[0] == PLUS_SIGN:
+        return OperationType.INCOME, cents
+    return OperationType.EXPENSE, cents
+
+
+def convert_id(token: str):
+    if token.isascii() and token.isdigit():
+        return int(token)
+    if token[:1] == MINUS_SIGN and token[1:].isascii() and token[1:].isdigit():
+        return ArgumentError("negative_id", "The ID can't be less than 0")
+    return ArgumentError("invalid_id", "Invalid ID")
+
+
+def convert_interval(token: str):
+    interval = INTERVALS.get(token.lower())
+    if interval is None:
+        return ArgumentError(
+            "unknown_interval", "There is no such interval. Please check /help"
+        )
+    return interval
+
+
+# The windows of the first and last days `date` can hold overflow `datetime`
+MIN_YEAR = 1900
+MAX_YEAR = 2999
+
+
+def convert_date(token: str):
+    # Only YYYY-MM-DD, `fromisoformat` takes other ISO forms as well
+    if len(token) == 10 and token[4] == token[7] == "-":
         try:
-            self.__validated_data = self.parse_data()
-        except ParsingError as e:
-            self.__error = str(e)
-            return False
+            value = date.fromisoformat(token)
+        except ValueError:
+            pass
+        else:
+            if MIN_YEAR <= value.year <= MAX_YEAR:
+                return value
+            return ArgumentError(
+                "invalid_date",
+                f"Invalid date: {token}. The year must be from {MIN_YEAR} to {MAX_YEAR}",
+            )
+    return ArgumentError("invalid_date", f"Invalid date: {token}. Use YYYY-MM-DD")
 
-        self.__is_valid = True
-        return True
 
-    def parse_data(self):
-        """There must be custom logic here."""
-        raise NotImplementedError()
+def convert_operation_type(token: str):
+    return OperationType(token.lower())
 
-    def is_args(self):
-        return bool(self.context.args)
 
+def convert_frequency(token: str):
+    return Frequency(token.lower())
 
-class IncomeAndExpenseParser(Parser, ParserUtils):
-    def parse_data(self):
-        command_args = self.context.args
-        amount = parse_amount(command_args[0])
-        note = parse_note(command_args[1:]) if len(command_args) > 1 else ""
-        return {"amount": amount, "note": note}
 
+def convert_day(token: str):
+    if token.isascii() and token.isdigit() and 1 <= int(token) <= 31:
+        return int(token)
+    return ArgumentError("invalid_day", "The day must be from 1 to 31")
 
-class DeleteParser(Parser, ParserUtils):
-    def parse_data(self):
-        command_args = self.context.args
-        if not self.is_args():
-            raise ParsingError("One argument is required")
 
-        operation_id = parse_id(command_args[0])
-        return {"operation_id": operation_id}
+def convert_category(token: str):
+    category = token.lower()
+    return Budget.TOTAL if category == TOTAL_CATEGORY else category
 
 
-class UpdateParser(Parser, ParserUtils):
-    def parse_data(self):
-        command_args = self.context.args
-        if len(command_args) < 2:
-            raise ParsingError("Two arguments are required")
+def is_operation_type(token: str) -> bool:
+    return token.lower() in OperationType.values
 
-        operation_id = parse_id(command_args[0])
 
-        amount, note, operation_type = None, None, None
-        startswith_plus = command_args[1].startswith(PLUS_SIGN)
-        startswith_minus = command_args[1].startswith(MINUS_SIGN)
+def is_frequency(token: str) -> bool:
+    return token.lower() in Frequency.values
 
-        # If there is only amount or amount with note
-        if startswith_plus or startswith_minus:
-            operation_type = (
-                OperationType.INCOME if startswith_plus else OperationType.EXPENSE
-            )
-            amount = parse_amount(command_args[1])
 
-            if len(command_args) >= 3:
-                note = parse_note(command_args[2:])
+def is_signed(token: str) -> bool:
+    return token[0] in (PLUS_SIGN, MINUS_SIGN)
+
+
+def is_word(token: str) -> bool:
+    return token[0].isalpha()
+
 
-        # if there is only note
+def is_date(token: str) -> bool:
+    return token[0].isdigit()
+
+
+def is_format(token: str) -> bool:
+    return token.lower() in EXPORT_FORMATS
+
+
+def is_gzip(token: str) -> bool:
+    return token.lower() in ("gz", "gzip")
+
+
+def is_any(token: str) -> bool:
+    return True
+
+
+# Argument types: whether a token has the type's shape, and its converter.
+# A token of the right shape that does not convert is an error, not a mismatch.
+ARGUMENT_TYPES = {
+    "amount": (is_any, convert_amount),
+    "signed_amount": (is_signed, convert_signed_amount),
+    "id": (is_any, convert_id),
+    "interval": (is_word, convert_interval),
+    "date": (is_date, convert_date),
+    "format": (is_format, str.lower),
+    "gzip": (is_gzip, bool),
+    "operation_type": (is_operation_type, convert_operation_type),
+    "frequency": (is_frequency, convert_frequency),
+    "day": (is_date, convert_day),
+    "category": (is_word, convert_category),
+    # With `*` or `+`: the tokens up to the fields after it, joined
+    "text": (is_any, None),
+}
+
+
+class Field:
+    """`name:type` with an optional `?`, `*` or `+`, or a literal keyword like `add`."""
+
+    __slots__ = ("name", "matches", "convert", "optional", "rest")
+
+    def __init__(self, spec: str):
+        name, _, type_name = spec.partition(":")
+        self.name = name
+        if not type_name:
+            self.matches, self.convert = (lambda token: token.lower() == name), bool
+            self.optional = self.rest = False
+            return
+
+        modifier = type_name[-1] if type_name[-1] in "?*+" else ""
+        self.matches, self.convert = ARGUMENT_TYPES[type_name.rstrip("?*+")]
+        self.optional = modifier in ("?", "*")
+        self.rest = modifier in ("*", "+")
+
+
+class Grammar:
+    """
+    The arguments of a command, compiled once from a spec such as
+    `"operation_id:id amount:signed_amount note:text* | operation_id:id note:text+"`.
+    Alternatives are tried in order and the first whose fields fit the shapes
+    of the tokens is converted; when none fits, the error is `usage`. With
+    `unordered`, each token fills the first free field it fits, in any order.
+    `finish` turns the values of the matched alternative into the command's
+    arguments, or an error.
+    """
+
+    __slots__ = ("alternatives", "usage", "unordered", "finish")
+
+    def __init__(self, spec: str, usage: str, unordered=False, finish=None):
+        self.alternatives = tuple(
+            tuple(Field(field) for field in alternative.split())
+            for alternative in spec.split("|")
+        )
+        self.usage = usage
+        self.unordered = unordered
+        self.finish = finish
+
+    def parse(self, tokens: list):
+        """Returns `(values, None)` or `(None, error)`."""
+        for fields in self.alternatives:
+            if self.unordered:
+                matched = match_unordered(fields, tokens)
+            else:
+                matched = match_in_order(fields, tokens)
+            if matched is not None:
+                break
         else:
-            note = parse_note(command_args[1:])
+            return None, ArgumentError("usage", self.usage)
+
+        values = dict.fromkeys(field.name for field in fields)
+        for field, position, end in matched:
+            if field.rest:
+                values[field.name] = " ".join(tokens[position:end])
+                continue
+            value = field.convert(tokens[position])
+            if type(value) is ArgumentError:
+                value.position, value.token = position, tokens[position]
+                return None, value
+            values[field.name] = value
+
+        if self.finish is not None:
+            values = self.finish(values)
+            if type(values) is ArgumentError:
+                return None, values
+        return values, None
+
+
+def match_in_order(fields: tuple, tokens: list):
+    """
+    `(field, start, end)` of the tokens of each field, None if the tokens do
+    not fit the fields. A rest field leaves one token to each field after it.
+    """
+    matched = []
+    position = 0
+    for index, field in enumerate(fields):
+        if field.rest:
+            end = len(tokens) - (len(fields) - index - 1)
+            if end < position or (end == position and not field.optional):
+                return None
+            matched.append((field, position, end))
+            position = end
+            continue
+        if position < len(tokens) and field.matches(tokens[position]):
+            matched.append((field, position, position + 1))
+            position += 1
+        elif not field.optional:
+            return None
+    return matched if position == len(tokens) else None
+
+
+def match_unordered(fields: tuple, tokens: list):
+    matched = []
+    free = list(fields)
+    for position, token in enumerate(tokens):
+        for field in free:
+            if field.matches(token):
+                matched.append((field, position, position + 1))
+                free.remove(field)
+                break
+        else:
+            return None
+    if any(not field.optional for field in free):
+        return None
+    return matched
+
+
+def make_range(start: date, end: date):
+    if start > end:
+        return ArgumentError("date_order", "The start date is after the end date")
+    return Window.from_dates(start, end)
+
+
+def finish_update(values: dict):
+    signed_amount = values.get("amount")
+    if signed_amount is None:
+        values["amount"] = values["operation_type"] = None
+    else:
+        values["operation_type"], values["amount"] = signed_amount
+    return values
+
+
+def finish_window(values: dict):
+    if "interval" in values:
+        return {"window": get_window(values["interval"])}
+    window = make_range(values["start"], values["end"])
+    if type(window) is ArgumentError:
+        return window
+    return {"window": window}
+
+
+def finish_export(values: dict):
+    start, end = values.pop("start"), values.pop("end")
+    if start is not None or end is not None:
+        if start is None or end is None:
+            return ArgumentError("usage", "Two dates are required for a range")
+        window = make_range(start, end)
+        if type(window) is ArgumentError:
+            return window
+    elif values["interval"] is not None:
+        window = get_window(values["interval"])
+    else:
+        window = None
+    return {
+        "window": window,
+        "format": values["format"] or "csv",
+        "compress": bool(values["compress"]),
+    }
+
+
+def finish_recurring(values: dict):
+    if values.get("add"):
+        frequency, day = values["frequency"], values.get("day")
+        if frequency == Frequency.DAILY and day is not None:
+            return ArgumentError("invalid_day", "Daily schedules have no day")
+        if frequency == Frequency.WEEKLY and day is not None and day > 7:
+            return ArgumentError("invalid_day", "The weekday must be from 1 to 7")
+        values["day"] = day or 1
+    return values
+
+
+WINDOW_GRAMMAR = Grammar(
+    "interval:interval | start:date end:date",
+    "An interval or two dates are required",
+    finish=finish_window,
+)
+
+GRAMMARS = {
+    "income": Grammar("amount:amount note:text*", "One argument is required"),
+    "expense": Grammar("amount:amount note:text*", "One argument is required"),
+    "delete": Grammar("operation_id:id", "One argument is required"),
+    "update": Grammar(
+        "operation_id:id amount:signed_amount note:text* | operation_id:id note:text+",
+        "Two arguments are required",
+        finish=finish_update,
+    ),
+    "report": WINDOW_GRAMMAR,
+    "stats": WINDOW_GRAMMAR,
+    "export": Grammar(
+        "format:format? compress:gzip? interval:interval? start:date? end:date?",
+        "Arguments: [interval | <from> <to>] [csv|jsonl] [gz]",
+        unordered=True,
+        finish=finish_export,
+    ),
+    "recurring": Grammar(
+        "add operation_type:operation_type amount:amount note:text* "
+        "frequency:frequency day:day"
+        " | add operation_type:operation_type amount:amount note:text* "
+        "frequency:frequency"
+        " | delete recurring_id:id",
+        "Usage: /recurring add <income|expense> <amount> [note] "
+        "<daily|weekly|monthly> [day], /recurring delete <id>",
+        finish=finish_recurring,
+    ),
+    "digest": Grammar(
+        "frequency:frequency | off frequency:frequency?",
+        "Usage: /digest <daily|weekly|monthly>, /digest off [daily|weekly|monthly]",
+    ),
+    "budget": Grammar(
+        "delete category:category period:frequency?"
+        " | category:category amount:amount period:frequency",
+        "Usage: /budget <category|total> <amount> <daily|weekly|monthly>, "
+        "/budget delete <category|total> [daily|weekly|monthly]",
+    ),
+}
+
+
+def parse_command(command: str, text: str) -> ParseResult:
+    """Splits a message's text once and parses it with the command's grammar."""
+    with timed("parse"):
+        # The first token is the command itself, e.g. `/income@bot`
+        args = text.split()[1:]
+        values, error = GRAMMARS[command].parse(args)
+    return ParseResult(command, args, values, error)
+
+
+# For callers outside the commands, which expect `ParsingError`
+
+
+def checked(value):
+    if type(value) is ArgumentError:
+        raise ParsingError(value.message)
+    return value
+
+
+def parse_amount(amount: str) -> int:
+    """The amount in cents, without its sign."""
+    return checked(convert_amount(amount))
+
+
+def parse_note(note: list) -> str:
+    return " ".join(note)
+
 
-        return {
-            "operation_id": operation_id,
-            "amount": amount,
-            "note": note,
-            "operation_type": operation_type,
-        }
+def get_interval(interval: str) -> Interval:
+    return checked(convert_interval(interval))
 
 
-class ReportParser(Parser, ParserUtils):
-    def parse_data(self):
-        command_args = self.context.args
-        if len(command_args) != 1:
-            raise ParsingError("One argument is required")
+def parse_date(value: str) -> date:
+    return checked(convert_date(value))
 
-        chat_id = self.chat_id
-        interval = get_interval(command_args[0])
-        operations = Operation.get_transactions_by_interval(chat_id, interval)
-        if not operations:
-            raise ParsingError("No transactions")
 
-        return {"operations": operations}
+def parse_range(start: str, end: str) -> Window:
+    return checked(make_range(parse_date(start), parse_date(end)))
@@ -0,0 +1,149 @@
+from telegram.error import Conflict, NetworkError, RetryAfter
+from botapp.workers import UpdateWorkerPool
+import threading
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+# Longest wait before polling again while handled updates hold the offset back
+IDLE_DELAY = 1
+
+
+class OffsetTracker:
+    """
+    Tracks updates taken from `getUpdates` until they are handled.
+    `.offset` only moves past an update once it and every earlier one is handled,
+    so Telegram redelivers whatever was not handled if the process stops.
+    """
+
+    def __init__(self):
+        self._pending = set()
+        self._last_seen = None
+        self._handled = 0
+        self._lock = threading.Lock()
+        self._progress = threading.Condition(self._lock)
+
+    def start(self, update_id: int) -> bool:
+        """Returns False for an update that was already taken."""
+        with self._lock:
+            if self._last_seen is not None and update_id <= self._last_seen:
+                return False
+            self._pending.add(update_id)
+            self._last_seen = update_id
+        return True
+
+    def done(self, update_id: int):
+        with self._lock:
+            self._pending.discard(update_id)
+            self._handled += 1
+            self._progress.notify_all()
+
+    @property
+    def handled(self) -> int:
+        """How many updates were handled so far."""
+        with self._lock:
+            return self._handled
+
+    @property
+    def waiting(self) -> bool:
+        """True while an update still being handled holds the offset back."""
+        with self._lock:
+            return bool(self._pending)
+
+    def wait_for_progress(self, handled: int, timeout: float):
+        """Waits until more than `handled` updates were handled, or `timeout`."""
+        with self._progress:
+            self._progress.wait_for(lambda: self._handled > handled, timeout)
+
+    @property
+    def offset(self):
+        with self._lock:
+            if self._pending:
+                return min(self._pending)
+            if self._last_seen is not None:
+                return self._last_seen + 1
+            return None
+
+
+class Poller:
+    """
+    Long polls `getUpdates` and hands the updates to a worker pool, which
+    keeps the updates of each chat in order. The offset sent with every call
+    confirms the updates handled so far.
+
+    While an update is being handled, Telegram returns it again right away
+    instead of long polling, so a batch with nothing new waits for a handler
+    to finish, or `IDLE_DELAY` at most, before polling again.
+    """
+
+    def __init__(
+        self,
+        bot,
+        process,
+        workers: int,
+        queue_size: int,
+        timeout: int,
+        allowed_updates: list = None,
+    ):
+        self._bot = bot
+        self._process = process
+        self._pool = UpdateWorkerPool(self._handle, workers, queue_size)
+        self._timeout = timeout
+        self._allowed_updates = allowed_updates
+        self._tracker = OffsetTracker()
+        self._stopped = threading.Event()
+
+    def _handle(self, update):
+        try:
+            self._process(update)
+        finally:
+            self._tracker.done(update.update_id)
+
+    def poll(self) -> int:
+        """Fetches one batch of updates and returns how many were new."""
+        updates = self._bot.get_updates(
+            offset=self._tracker.offset,
+            timeout=self._timeout,
+            allowed_updates=self._allowed_updates,
+        )
+        new = 0
+        for update in updates:
+            if self._stopped.is_set():
+                break
+            if not self._tracker.start(update.update_id):
+                continue
+            # Blocks while the chat's queue is full, which slows the polling down
+            self._pool.submit(update, block=True)
+            new += 1
+        return new
+
+    def run(self):
+        delay = 0
+        while not self._stopped.is_set():
+            try:
+                handled = self._tracker.handled
+                if not self.poll() and self._tracker.waiting:
+                    self._tracker.wait_for_progress(handled, IDLE_DELAY)
+                delay = 0
+            except RetryAfter as e:
+                time.sleep(e.retry_after)
+            except Conflict:
+                # Another poller or a webhook is taking the updates
+                raise
+            except NetworkError as e:
+                delay = min(max(delay * 2, 1), 30)
+                logger.warning("getUpdates failed: %s, retrying in %ss", e, delay)
+                self._stopped.wait(delay)
+
+    def stop(self):
+        self._stopped.set()
+
+    def shutdown(self, commit: bool = True):
+        """Waits for the submitted updates, then confirms them to Telegram."""
+        self.stop()
+        self._pool.shutdown()
+        offset = self._tracker.offset
+        if commit and offset is not None:
+            self._bot.get_updates(offset=offset, limit=1, timeout=0)
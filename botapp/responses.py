@@ -0,0 +1,191 @@
+from botapp.metrics import (
+    response_cache_hits,
+    response_cache_misses,
+    response_cache_render_duration,
+    response_cache_saved_duration,
+)
+from botapp.utils import capture_replies, reply_text
+from botapp.constants import CACHED_COMMANDS
+from collections import OrderedDict
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache import cache, caches
+from django.utils import timezone
+from django.conf import settings
+import threading
+import functools
+import time
+import uuid
+
+
+# Longer keys are not cached, memcached rejects keys over 250 characters
+MAX_KEY_LENGTH = 200
+
+
+class LocalResponseCache:
+    """
+    Rendered replies of this process, the least recently used are dropped first.
+    Each chat has a generation, bumped when its data changes: replies rendered
+    from data read before the change are not stored.
+    """
+
+    def __init__(self, max_size: int):
+        self._entries = OrderedDict()
+        self._chat_keys = {}
+        self._generations = OrderedDict()
+        self._max_size = max_size
+        self._lock = threading.Lock()
+
+    def get(self, chat_id: int, key: str):
+        """Returns `(replies, generation)`, `replies` is None on a miss."""
+        with self._lock:
+            replies = self._entries.get((chat_id, key))
+            if replies is not None:
+                self._entries.move_to_end((chat_id, key))
+            return replies, self._generations.get(chat_id, 0)
+
+    def set(self, chat_id: int, key: str, generation, replies: list):
+        with self._lock:
+            if self._generations.get(chat_id, 0) != generation:
+                return
+            self._entries[(chat_id, key)] = replies
+            self._entries.move_to_end((chat_id, key))
+            self._chat_keys.setdefault(chat_id, set()).add(key)
+            while len(self._entries) > self._max_size:
+                (old_chat_id, old_key), _ = self._entries.popitem(last=False)
+                keys = self._chat_keys[old_chat_id]
+                keys.discard(old_key)
+                if not keys:
+                    del self._chat_keys[old_chat_id]
+
+    def invalidate(self, chat_id: int):
+        with self._lock:
+            self._generations[chat_id] = self._generations.pop(chat_id, 0) + 1
+            if len(self._generations) > self._max_size:
+                self._generations.popitem(last=False)
+            for key in self._chat_keys.pop(chat_id, ()):
+                del self._entries[(chat_id, key)]
+
+
+class CacheResponseCache:
+    """
+    Rendered replies in the Django cache, shared by every process using it.
+    Entries are keyed by the chat's generation, a random token replaced when
+    its data changes, so the entries of the old generation are never read again.
+    """
+
+    def __init__(self, timeout: int, prefix: str = "reply"):
+        self._timeout = timeout
+        self._prefix = prefix
+
+    def get(self, chat_id: int, key: str):
+        generation_key = f"{self._prefix}:{chat_id}"
+        generation = cache.get(generation_key)
+        if generation is None:
+            # A new or evicted generation, no stored entry may belong to it
+            cache.add(generation_key, uuid.uuid4().hex, timeout=None)
+            return None, cache.get(generation_key)
+        return cache.get(f"{generation_key}:{generation}:{key}"), generation
+
+    def set(self, chat_id: int, key: str, generation, replies: list):
+        cache_key = f"{self._prefix}:{chat_id}:{generation}:{key}"
+        cache.set(cache_key, replies, timeout=self._timeout)
+
+    def invalidate(self, chat_id: int):
+        cache.set(f"{self._prefix}:{chat_id}", uuid.uuid4().hex, timeout=None)
+
+
+def get_response_cache(name: str):
+    if name == "cache":
+        return CacheResponseCache(timeout=settings.RESPONSE_CACHE_TTL)
+    if name == "local":
+        return LocalResponseCache(max_size=settings.RESPONSE_CACHE_SIZE)
+    if name == "none":
+        return None
+    raise ValueError(f"Unknown response cache: {name}")
+
+
+SHARED_CACHE_WARNING = (
+    "Cached replies of the bot are not dropped from this process and may stay "
+    "stale until the chat's next write. Set RESPONSE_CACHE=cache with a shared "
+    "backend in CACHES, or RESPONSE_CACHE=none"
+)
+
+
+def is_shared_cache() -> bool:
+    """Whether invalidating a chat in this process reaches the bot's replies."""
+    if settings.RESPONSE_CACHE == "none":
+        return True
+    return settings.RESPONSE_CACHE == "cache" and not isinstance(
+        caches["default"], LocMemCache
+    )
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def _get_cache():
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = get_response_cache(settings.RESPONSE_CACHE)
+        return _response_cache
+
+
+def get_key(command: str, args: list):
+    """
+    The cache key of a command, None if it is not cached. The local date is
+    part of the key, so the replies of "day", "week" and so on roll over.
+    """
+    cached_with_args = CACHED_COMMANDS.get(command)
+    if cached_with_args is None or (args and not cached_with_args):
+        return None
+    key = ":".join([command, timezone.localdate().isoformat(), *args]).lower()
+    return key if len(key) <= MAX_KEY_LENGTH else None
+
+
+def invalidate_chat(chat_id: int):
+    """Drops the cached replies of a chat. Called after its operations change."""
+    response_cache = _get_cache()
+    if response_cache is not None:
+        response_cache.invalidate(chat_id)
+
+
+def cached_replies(command: str, handler):
+    """
+    Wraps a read-only handler to reuse its replies until the chat's data
+    changes. Only replies that fit in one message are stored.
+    """
+
+    @functools.wraps(handler)
+    def wrapper(update, context):
+        response_cache = _get_cache()
+        chat = update.effective_chat
+        key = get_key(command, context.args or [])
+        if response_cache is None or chat is None or key is None:
+            return handler(update, context)
+
+        started = time.perf_counter()
+        replies, generation = response_cache.get(chat.id, key)
+        if replies is not None:
+            # A hit saves what an average miss spends rendering
+            misses = response_cache_misses.value(command)
+            if misses:
+                average = response_cache_render_duration.value(command) / misses
+                saved = average - (time.perf_counter() - started)
+                response_cache_saved_duration.inc(command, max(saved, 0))
+            response_cache_hits.inc(command)
+        else:
+            # Rendered without sending, so the time excludes Bot API calls
+            with capture_replies() as replies:
+                handler(update, context)
+            response_cache_render_duration.inc(command, time.perf_counter() - started)
+            response_cache_misses.inc(command)
+            # A long report split over many messages is not worth its space
+            if len(replies) == 1:
+                response_cache.set(chat.id, key, generation, replies)
+
+        for text in replies:
+            reply_text(update, text)
+
+    return wrapper
@@ -0,0 +1,270 @@
+from botapp.models import (
+    DailyTotal,
+    DigestSubscription,
+    Frequency,
+    Operation,
+    RecurringOperation,
+)
+from botapp.intervals import get_previous_period, get_run_date
+from django.db import close_old_connections, transaction
+from apscheduler.schedulers.background import BackgroundScheduler
+from concurrent.futures import ThreadPoolExecutor
+from botapp.responses import invalidate_chat
+from telegram.error import RetryAfter, TelegramError, Unauthorized
+from botapp.constants import DIGEST_HOUR
+from botapp.utils import format_budget_alert, format_summary
+from datetime import datetime, time, timedelta
+from django.utils import timezone
+from django.conf import settings
+import threading
+import logging
+from time import sleep
+
+
+logger = logging.getLogger(__name__)
+
+# Sends of a scheduled message, waiting out `RetryAfter` in between
+SEND_ATTEMPTS = 5
+
+
+def get_run_at(frequency: str, day: int, on_or_after, hour: int = 0) -> datetime:
+    """When a schedule next runs, at `hour` local time, from the date `on_or_after`."""
+    run_date = get_run_date(frequency, day, on_or_after)
+    return datetime.combine(
+        run_date, time(hour), tzinfo=timezone.get_current_timezone()
+    )
+
+
+def get_digest_day(frequency: str) -> int:
+    # Weekly digests come on the first day of the week, monthly on the first
+    return settings.WEEK_START + 1 if frequency == Frequency.WEEKLY else 1
+
+
+def get_next_digest_at(frequency: str, now: datetime) -> datetime:
+    """The first digest run after `now`."""
+    today = timezone.localdate(now)
+    day = get_digest_day(frequency)
+    run_at = get_run_at(frequency, day, today, DIGEST_HOUR)
+    if run_at <= now:
+        run_at = get_run_at(frequency, day, today + timedelta(days=1), DIGEST_HOUR)
+    return run_at
+
+
+def lock_due(model, now: datetime, batch_size: int) -> list:
+    """
+    The next `batch_size` due rows, locked until the transaction ends.
+    Rows locked by another scheduler process are skipped, not waited for.
+    """
+    rows = model.objects.select_for_update(skip_locked=True).filter(
+        next_run_at__lte=now
+    )
+    return list(rows.order_by("next_run_at")[:batch_size])
+
+
+def save_next_runs(model, rows: list):
+    """
+    Saves `next_run_at` of the rows with one update per distinct time; rows
+    due together mostly move to the same next run.
+    """
+    ids = {}
+    for row in rows:
+        ids.setdefault(row.next_run_at, []).append(row.id)
+    for next_run_at, row_ids in ids.items():
+        model.objects.filter(id__in=row_ids).update(next_run_at=next_run_at)
+
+
+def run_recurring(now: datetime, batch_size: int, send=None, workers: int = 1) -> int:
+    """
+    Adds the operations of every due recurring schedule, `batch_size` schedules
+    per transaction. Missed runs, e.g. while the scheduler was down, are added
+    with their own dates. Budget alerts are sent with `send`, if given.
+    Returns the number of operations added.
+    """
+    added = 0
+    while True:
+        with transaction.atomic():
+            due = lock_due(RecurringOperation, now, batch_size)
+            operations = []
+            for schedule in due:
+                while schedule.next_run_at <= now:
+                    operations.append(
+                        Operation(
+                            chat_id=schedule.chat_id,
+                            amount=schedule.amount,
+                            operation_type=schedule.operation_type,
+                            note=schedule.note,
+                            created_at=schedule.next_run_at,
+                        )
+                    )
+                    next_day = timezone.localdate(schedule.next_run_at) + timedelta(
+                        days=1
+                    )
+                    schedule.next_run_at = get_run_at(
+                        schedule.frequency, schedule.day, next_day
+                    )
+            if operations:
+                Operation.bulk_insert(operations)
+                save_next_runs(RecurringOperation, due)
+
+        for chat_id in {schedule.chat_id for schedule in due}:
+            invalidate_chat(chat_id)
+        if send is not None:
+            alerts = [
+                (operation.chat_id, format_budget_alert(budget, threshold))
+                for operation in operations
+                for budget, threshold in operation.budget_alerts
+            ]
+            send_messages(send, alerts, workers)
+        added += len(operations)
+        if len(due) < batch_size:
+            return added
+
+
+def get_digest_messages(subscriptions: list) -> list:
+    """
+    `(chat_id, text)` digests of the subscriptions, one totals query per period.
+    Chats without transactions in the period get no digest.
+    """
+    periods = {}
+    for subscription in subscriptions:
+        run_date = timezone.localdate(subscription.next_run_at)
+        key = (subscription.frequency, run_date)
+        periods.setdefault(key, []).append(subscription.chat_id)
+
+    messages = []
+    for (frequency, run_date), chat_ids in periods.items():
+        start, end = get_previous_period(frequency, run_date)
+        dates = (
+            f"{start:%d.%m.%Y}"
+            if start == end
+            else f"{start:%d.%m.%Y} - {end:%d.%m.%Y}"
+        )
+        summaries = DailyTotal.get_summaries(chat_ids, start, end)
+        for chat_id in chat_ids:
+            summary = summaries[chat_id]
+            if not any(count for _, count in summary.values()):
+                continue
+            title = f"{Frequency(frequency).label} digest for {dates}"
+            messages.append((chat_id, f"{title}\n{format_summary(summary)}"))
+    return messages
+
+
+def send_messages(send, messages: list, workers: int) -> set:
+    """
+    Sends `(chat_id, text)` messages from `workers` threads, paced by the bot's
+    outbound limiter. Returns the IDs of chats that blocked the bot.
+    """
+
+    def send_one(message):
+        chat_id, text = message
+        # The sender threads are not handling updates, they wait out the limits
+        for _ in range(SEND_ATTEMPTS):
+            try:
+                send(chat_id=chat_id, text=text)
+                return None
+            except RetryAfter as e:
+                sleep(e.retry_after)
+            except Unauthorized:
+                return chat_id
+            except TelegramError as e:
+                logger.warning("Failed to send a message to chat %s: %s", chat_id, e)
+                return None
+        logger.warning("Failed to send a message to chat %s: rate limited", chat_id)
+        return None
+
+    with ThreadPoolExecutor(workers) as executor:
+        return set(executor.map(send_one, messages)) - {None}
+
+
+def run_digests(now: datetime, batch_size: int, send, workers: int) -> int:
+    """
+    Sends the due digests, `batch_size` subscriptions at a time. The next run
+    is committed before sending, so a crash skips a digest rather than repeating
+    it. Only the latest missed period is sent. Returns the number of digests sent.
+    """
+    sent = 0
+    while True:
+        with transaction.atomic():
+            due = lock_due(DigestSubscription, now, batch_size)
+            messages = get_digest_messages(due)
+            for subscription in due:
+                subscription.next_run_at = get_next_digest_at(
+                    subscription.frequency, now
+                )
+            save_next_runs(DigestSubscription, due)
+
+        blocked = send_messages(send, messages, workers)
+        if blocked:
+            DigestSubscription.objects.filter(chat_id__in=blocked).delete()
+        sent += len(messages) - len(blocked)
+        if len(due) < batch_size:
+            return sent
+
+
+def tick(now: datetime = None, send=None):
+    """Runs everything due by `now`. Returns `(operations added, digests sent)`."""
+    if send is None:
+        from botapp.bot import bot
+
+        send = bot.send_message
+
+    now = now or timezone.now()
+    batch_size = settings.SCHEDULER_BATCH_SIZE
+    workers = settings.DIGEST_SENDERS
+    added = run_recurring(now, batch_size, send, workers)
+    sent = run_digests(now, batch_size, send, workers)
+    return added, sent
+
+
+def run_tick():
+    close_old_connections()
+    try:
+        added, sent = tick()
+        if added or sent:
+            logger.info("Added %d recurring operations, sent %d digests", added, sent)
+    except Exception:
+        logger.exception("Scheduler tick failed")
+    finally:
+        close_old_connections()
+
+
+def build_scheduler(scheduler_class):
+    """
+    An APScheduler scheduler with a single job, whatever the number of chats:
+    the schedules live in the database and each tick processes the due ones.
+    """
+    scheduler = scheduler_class(timezone=settings.TIME_ZONE)
+    scheduler.add_job(
+        run_tick,
+        "interval",
+        seconds=settings.SCHEDULER_INTERVAL,
+        id="tick",
+        max_instances=1,
+        coalesce=True,
+        next_run_time=timezone.now(),
+    )
+    return scheduler
+
+
+_background_scheduler = None
+_background_scheduler_lock = threading.Lock()
+
+
+def start_background_scheduler():
+    """
+    Runs the scheduler on a thread of this process, e.g. beside the ASGI
+    webhook, so the chats' cached replies are dropped where they are served.
+    """
+    global _background_scheduler
+    with _background_scheduler_lock:
+        if _background_scheduler is None:
+            _background_scheduler = build_scheduler(BackgroundScheduler)
+            _background_scheduler.start()
+
+
+def stop_background_scheduler():
+    global _background_scheduler
+    with _background_scheduler_lock:
+        scheduler, _background_scheduler = _background_scheduler, None
+    if scheduler is not None:
+        scheduler.shutdown()
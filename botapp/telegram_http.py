@@ -0,0 +1,108 @@
+from telegram.utils.request import Request
+import itertools
+import logging
+import random
+import json
+import time
+
+try:
+    import telegram.vendor.ptb_urllib3.urllib3 as urllib3
+except ImportError:  # python-telegram-bot installed without the vendored urllib3
+    import urllib3
+
+
+logger = logging.getLogger(__name__)
+
+# Errors raised before the request was sent, so retrying cannot duplicate it
+CONNECT_ERRORS = (
+    urllib3.exceptions.NewConnectionError,
+    urllib3.exceptions.ConnectTimeoutError,
+)
+
+
+def get_retry_after(response) -> float:
+    """Seconds Telegram asks to wait in a 429 response, or None."""
+    try:
+        parameters = json.loads(response.data.decode()).get("parameters") or {}
+    except (ValueError, UnicodeDecodeError, AttributeError):
+        return None
+    return parameters.get("retry_after")
+
+
+def get_backoff(attempt: int, base: float, cap: float) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+class RetryingPoolManager:
+    """
+    Wraps urllib3's pool manager to retry 429 and 5xx responses and failed
+    connection attempts. A 429 waits the `retry_after` Telegram sends, other
+    retries back off exponentially with jitter. The last response is returned
+    as is, so python-telegram-bot still raises its usual errors.
+    """
+
+    def __init__(self, pool, retries: int, backoff: float, max_wait: float):
+        self._pool = pool
+        self._retries = retries
+        self._backoff = backoff
+        self._max_wait = max_wait
+
+    def request(self, method, url, **kwargs):
+        for attempt in itertools.count():
+            try:
+                response = self._pool.request(method, url, **kwargs)
+            except CONNECT_ERRORS:
+                if attempt >= self._retries:
+                    raise
+                delay = get_backoff(attempt, self._backoff, self._max_wait)
+            else:
+                if attempt >= self._retries or not self.is_retryable(response):
+                    return response
+                delay = get_backoff(attempt, self._backoff, self._max_wait)
+                if response.status == 429:
+                    retry_after = get_retry_after(response)
+                    if retry_after is not None:
+                        # Add a little jitter so waiting workers do not retry at once
+                        delay = retry_after + random.uniform(0, self._backoff)
+                if delay > self._max_wait:
+                    return response
+
+            logger.warning("Retrying %s in %.2fs", url.rsplit("/", 1)[-1], delay)
+            time.sleep(delay)
+
+    @staticmethod
+    def is_retryable(response) -> bool:
+        return response.status == 429 or response.status >= 500
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+
+class TelegramRequest(Request):
+    """
+    `Request` with retries and a connection pool that keeps its connections:
+    with `block`, a thread waits for a free pooled connection instead of
+    opening one that is closed right after the call.
+    """
+
+    def __init__(
+        self,
+        pool_size: int,
+        connect_timeout: float,
+        read_timeout: float,
+        retries: int,
+        backoff: float,
+        max_wait: float,
+        block: bool = True,
+    ):
+        super().__init__(
+            con_pool_size=pool_size,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+        )
+        pool = self._con_pool
+        if hasattr(pool, "connection_pool_kw"):
+            # Read when the pool of a host is first created
+            pool.connection_pool_kw["block"] = block
+        self._con_pool = RetryingPoolManager(pool, retries, backoff, max_wait)
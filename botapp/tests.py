@@ -1,3 +1,1615 @@
-from django.test import TestCase
+from botapp.models import (
+    Budget,
+    Chat,
+    DailyTotal,
+    DigestSubscription,
+    Interval,
+    Operation,
+    OperationType,
+    RecurringOperation,
+)
+from botapp.constants import MESSAGE_MAX_LENGTH, RATE_LIMIT_TEXT
+from botapp.dispatcher import build_dispatcher, get_dispatcher, process_update
+from botapp.utils import reply_text
+from botapp.throttling import (
+    CommandThrottle,
+    LocalBucketStore,
+    OutboundLimiter,
+    take_token,
+)
+from botapp.importers import import_operations, iter_json_rows
+from botapp.exceptions import ParsingError
+from botapp.intervals import Window, WindowCache, get_dates, get_run_date
+from botapp.scheduler import run_recurring, send_messages, tick
+from botapp.responses import (
+    SHARED_CACHE_WARNING,
+    CacheResponseCache,
+    LocalResponseCache,
+    invalidate_chat,
+    is_shared_cache,
+)
+from botapp.idempotency import LocalUpdateStore
+from botapp.money import MAX_AMOUNT, format_cents, parse_cents
+from botapp.parsers import GRAMMARS, ParseResult, parse_command
+from botapp.batching import OperationBatcher
+from botapp.polling import OffsetTracker, Poller
+from botapp.chats import chat_cache
+from botapp.metrics import command_db_queries, render_metrics, response_cache_hits
+from botapp.telegram_http import RetryingPoolManager
+from botapp.workers import UpdateWorkerPool, lifespan, shutdown_worker_pool
+from botapp.views import AsyncTelegramWebhookView
+from asgiref.sync import async_to_sync
+from django.test.utils import CaptureQueriesContext
+from django.core.management.base import CommandError
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase, override_settings
+from django.core.exceptions import ImproperlyConfigured
+from django.contrib.admin import site as admin_site
+from django.contrib.auth.models import User
+from django.conf import settings
+from django.apps import apps
+from django.db import connection, connections, models
+from django.utils import timezone
+from unittest import skipUnless
+from collections import defaultdict
+from types import SimpleNamespace
+from unittest import mock
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from zoneinfo import ZoneInfo
+from telegram.error import RetryAfter, Unauthorized
+from telegram import Update
+from botapp.bot import bot
+import threading
+import tempfile
+import warnings
+import random
+import runpy
+import json
+import gzip
+import time
+import io
+import os
 
-# Create your tests here.
+
+def make_update_data(text: str, chat_id: int = 1, update_id: int = 1) -> dict:
+    data = {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {
+                "id": chat_id,
+                "is_bot": False,
+                "first_name": "Test",
+                "username": f"user{chat_id}",
+            },
+            "text": text,
+        },
+    }
+    if text.startswith("/"):
+        data["message"]["entities"] = [
+            {"type": "bot_command", "offset": 0, "length": len(text.split()[0])}
+        ]
+    return data
+
+
+def make_update(text: str, chat_id: int = 1, update_id: int = 1) -> Update:
+    return Update.de_json(make_update_data(text, chat_id, update_id), bot)
+
+
+class BotTestCase(TestCase):
+    """Runs commands through the dispatcher and records the replies."""
+
+    def setUp(self):
+        # Command handlers ask for the bot username, which is a Bot API call
+        username_patcher = mock.patch("telegram.Bot.username", "test_bot")
+        username_patcher.start()
+        self.addCleanup(username_patcher.stop)
+
+        reply_patcher = mock.patch("telegram.Message.reply_text")
+        self.reply_text = reply_patcher.start()
+        self.addCleanup(reply_patcher.stop)
+
+        document_patcher = mock.patch("telegram.Message.reply_document")
+        self.reply_document = document_patcher.start()
+        self.addCleanup(document_patcher.stop)
+
+        # Chats known from other tests were rolled back with them
+        chat_cache.clear()
+        cache_patcher = mock.patch(
+            "botapp.responses._response_cache", LocalResponseCache(max_size=100)
+        )
+        cache_patcher.start()
+        self.addCleanup(cache_patcher.stop)
+
+    def send(self, text: str, chat_id: int = 1):
+        self.reply_text.reset_mock()
+        get_dispatcher().process_update(make_update(text, chat_id))
+        return [call.args[0] for call in self.reply_text.call_args_list]
+
+    @override_settings(METRICS_TOKEN="secret")
+    def get_metrics(self):
+        return self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret")
+
+
+class StartupTests(TestCase):
+    def test_invalid_token_fails_at_startup(self):
+        config = apps.get_app_config("botapp")
+        for token in ("", "token", "12:short", "123456 :space"):
+            with self.subTest(token), override_settings(TELEGRAM_BOT_TOKEN=token):
+                with self.assertRaises(ImproperlyConfigured):
+                    config.ready()
+
+    def test_dispatcher_is_built_once_per_process(self):
+        dispatcher = get_dispatcher()
+        with mock.patch("botapp.dispatcher.build_dispatcher") as build_dispatcher:
+            apps.get_app_config("botapp").ready()
+        build_dispatcher.assert_not_called()
+        self.assertIs(get_dispatcher(), dispatcher)
+
+    def test_dispatcher_keeps_no_data_per_chat(self):
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            dispatcher = build_dispatcher()
+        self.assertEqual(caught, [])
+
+        with mock.patch("telegram.Message.reply_text"):
+            for chat_id in range(1, 4):
+                dispatcher.process_update(make_update("/help", chat_id))
+        self.assertEqual(
+            (dict(dispatcher.chat_data), dict(dispatcher.user_data)), ({}, {})
+        )
+
+
+class DatabaseSettingsTests(TestCase):
+    def load_settings(self, **env) -> dict:
+        with mock.patch.dict(os.environ, env):
+            return runpy.run_path(
+                os.path.join(settings.BASE_DIR, "telegram_bot/settings.py")
+            )
+
+    @skipUnless(connection.vendor == "sqlite", "SQLite only")
+    def test_sqlite_pragmas_are_applied_on_connect(self):
+        database = self.load_settings(DB_ENGINE="sqlite", SQLITE_TUNED="True")[
+            "DATABASES"
+        ]["default"]
+        with tempfile.TemporaryDirectory() as directory:
+            wrapper = connections["default"].__class__(
+                {
+                    **connection.settings_dict,
+                    **database,
+                    "NAME": os.path.join(directory, "db.sqlite3"),
+                }
+            )
+            try:
+                with wrapper.cursor() as cursor:
+                    pragmas = {}
+                    for name in ("journal_mode", "synchronous", "busy_timeout"):
+                        cursor.execute(f"PRAGMA {name}")
+                        pragmas[name] = cursor.fetchone()[0]
+            finally:
+                wrapper.close()
+        # synchronous=1 is NORMAL
+        self.assertEqual(
+            pragmas, {"journal_mode": "wal", "synchronous": 1, "busy_timeout": 5000}
+        )
+        self.assertEqual(database["OPTIONS"]["transaction_mode"], "IMMEDIATE")
+
+    def test_postgresql_profile(self):
+        database = self.load_settings(DB_ENGINE="postgresql", DB_HOST="db")[
+            "DATABASES"
+        ]["default"]
+        self.assertEqual(database["ENGINE"], "django.db.backends.postgresql")
+        self.assertEqual(database["HOST"], "db")
+        self.assertEqual(database["CONN_MAX_AGE"], 60)
+        self.assertTrue(database["CONN_HEALTH_CHECKS"])
+        self.assertEqual(database["OPTIONS"], {})
+
+        database = self.load_settings(DB_ENGINE="postgresql", DB_POOL_SIZE="10")[
+            "DATABASES"
+        ]["default"]
+        self.assertEqual(database["CONN_MAX_AGE"], 0)
+        self.assertEqual(database["OPTIONS"]["pool"], {"min_size": 1, "max_size": 10})
+
+
+class ChatTotalsTests(BotTestCase):
+    def assertTotals(self, chat_id, income, expense):
+        chat = Chat.objects.get(id=chat_id)
+        self.assertEqual((chat.total_income, chat.total_expense), (income, expense))
+
+    def test_totals_follow_create_update_and_delete(self):
+        self.send("/income 100 salary")
+        self.send("/expense 30.50 food")
+        self.send("/expense 10")
+        self.assertTotals(1, 10000, 4050)
+
+        expense = Operation.objects.get(note="food")
+        self.send(f"/update {expense.id} +20")
+        self.assertTotals(1, 12000, 1000)
+
+        self.send(f"/delete {expense.id}")
+        self.assertTotals(1, 10000, 1000)
+        self.assertEqual(self.send("/balance"), ["Total balance: 90.00"])
+
+    def test_amount_with_cents(self):
+        self.assertEqual(self.send("/expense 12.34"), ["Expense added: -12.34"])
+        self.assertTotals(1, 0, 1234)
+
+    def test_balance_is_a_single_query(self):
+        self.send("/income 100")
+        with self.assertNumQueries(1):
+            self.assertEqual(self.send("/balance"), ["Total balance: 100.00"])
+
+    def test_rebuild_totals_fixes_drift(self):
+        self.send("/income 100")
+        self.send("/expense 25", chat_id=2)
+        Chat.objects.update(total_income=0, total_expense=0)
+
+        with self.assertRaises(Exception):
+            call_command("rebuild_totals", "--verify", stdout=mock.Mock())
+        call_command("rebuild_totals", stdout=mock.Mock())
+        call_command("rebuild_totals", "--verify", stdout=mock.Mock())
+        self.assertTotals(1, 10000, 0)
+        self.assertTotals(2, 0, 2500)
+        self.assertEqual(Operation.get_sum_by_type(2, OperationType.EXPENSE), 2500)
+
+
+class AdminTests(BotTestCase):
+    def setUp(self):
+        super().setUp()
+        user = User.objects.create_superuser("admin", "admin@example.com", "x")
+        self.client.force_login(user)
+
+    def test_bulk_delete_keeps_the_totals(self):
+        self.send("/budget total 100 monthly")
+        self.send("/income 100")
+        self.send("/expense 30")
+        self.send("/expense 20")
+        ids = Operation.objects.filter(operation_type="expense").values_list(
+            "id", flat=True
+        )
+        self.client.post(
+            "/admin/botapp/operation/",
+            {"action": "delete_selected", "_selected_action": list(ids), "post": "yes"},
+        )
+        self.assertFalse(Operation.objects.filter(operation_type="expense").exists())
+        chat = Chat.objects.get(id=1)
+        self.assertEqual((chat.total_income, chat.total_expense), (10000, 0))
+        self.assertEqual(Budget.objects.get().spent, 0)
+        self.assertEqual(self.send("/balance"), ["Total balance: 100.00"])
+        call_command("rebuild_totals", "--verify", stdout=io.StringIO())
+
+    def test_chat_form_does_not_write_the_totals(self):
+        self.send("/income 100")
+        chat = Chat.objects.get(id=1)
+        # Written after the form was loaded, the form must not undo it
+        Chat.add_to_totals(1, income=500)
+        admin_site.get_model_admin(Chat).save_model(
+            None, chat, SimpleNamespace(changed_data=["username"]), change=True
+        )
+        self.assertEqual(Chat.objects.get(id=1).total_income, 10500)
+
+        form = admin_site.get_model_admin(Chat).get_form(None, chat)
+        self.assertNotIn("total_income", form.base_fields)
+
+
+class MoneyTests(BotTestCase):
+    def test_parse_and_format_cents(self):
+        for text, cents in (("12", 1200), ("+12.5", 1250), ("-.99", 99), ("0.01", 1)):
+            self.assertEqual(parse_cents(text), cents)
+        for text in ("", ".", "-", "1.234", "1e3", "inf", "1,5", "\u0661"):
+            with self.assertRaises(ValueError, msg=text):
+                parse_cents(text)
+        self.assertEqual(
+            [format_cents(c) for c in (0, 5, 1250, -5)],
+            ["0.00", "0.05", "12.50", "-0.05"],
+        )
+
+    def test_amounts_are_stored_in_cents(self):
+        self.send("/income 0.10")
+        self.send("/income 0.20")
+        self.assertEqual(Operation.objects.order_by("id").first().amount, 10)
+        self.assertEqual(self.send("/income"), ["Total income: +0.30"])
+        self.assertEqual(
+            self.send("/expense 100000000"),
+            ["The amount must be from 0.01 to 99999999.99"],
+        )
+
+
+class ParserTests(TestCase):
+    # Pieces fuzzed texts are built from, valid ones and near misses
+    PIECES = (
+        "",
+        "0",
+        "5",
+        "12.50",
+        "+3",
+        "-3",
+        "+",
+        "-",
+        ".",
+        "1.234",
+        "1e3",
+        "nan",
+        "day",
+        "Week",
+        "dya",
+        "csv",
+        "JSONL",
+        "gz",
+        "2025-01-01",
+        "2025-13-01",
+        "2025-1-1",
+        "\u0661\u0662",
+        "\u00bd",
+        "\u200b",
+        "@bot",
+        "//",
+        "a" * 300,
+    )
+
+    def test_errors_are_structured(self):
+        error = parse_command("update", "/update x +5").error
+        self.assertEqual(
+            (error.code, error.position, error.token), ("invalid_id", 0, "x")
+        )
+
+        error = parse_command("update", "/update 1 +5.555 note").error
+        self.assertEqual((error.code, error.position), ("invalid_amount", 1))
+        self.assertEqual(parse_command("update", "/update 1").error.code, "usage")
+        self.assertEqual(
+            parse_command("delete", "/delete -1").error.code, "negative_id"
+        )
+
+    def test_fuzzed_text_never_raises(self):
+        rng = random.Random(23)
+        for _ in range(3000):
+            command = rng.choice(list(GRAMMARS))
+            tokens = [
+                rng.choice(self.PIECES) + rng.choice(self.PIECES)
+                for _ in range(rng.randint(0, 5))
+            ]
+            text = " ".join([f"/{command}@bot", *tokens])
+            with self.subTest(text=text):
+                result = parse_command(command, text)
+                self.assertIsInstance(result, ParseResult)
+                self.assertEqual(result.ok, result.values is not None)
+                if not result.ok:
+                    self.assertTrue(result.error.message)
+
+    def test_amounts_round_trip(self):
+        rng = random.Random(22)
+        for _ in range(1000):
+            cents = rng.randint(1, MAX_AMOUNT)
+            values = parse_command(
+                "income", f"/income {format_cents(cents)} a  b"
+            ).values
+            self.assertEqual((values["amount"], values["note"]), (cents, "a b"))
+
+            values = parse_command("update", f"/update 7 -{format_cents(cents)}").values
+            self.assertEqual(
+                (values["operation_id"], values["amount"], values["operation_type"]),
+                (7, cents, OperationType.EXPENSE),
+            )
+
+    def test_export_arguments_in_any_order(self):
+        rng = random.Random(21)
+        args = ["2025-01-01", "2025-03-31", "jsonl", "gz"]
+        expected = parse_command("export", "/export " + " ".join(args)).values
+        for _ in range(20):
+            # The dates keep their order, they are the start and the end
+            rng.shuffle(args)
+            dates = iter(sorted(arg for arg in args if arg[0].isdigit()))
+            ordered = [next(dates) if arg[0].isdigit() else arg for arg in args]
+            values = parse_command("export", "/export " + " ".join(ordered)).values
+            self.assertEqual(values, expected)
+
+
+class DailyTotalsTests(BotTestCase):
+    def test_daily_totals_follow_writes(self):
+        self.send("/income 100")
+        self.send("/expense 30")
+        self.send("/expense 20")
+        expense = Operation.objects.filter(operation_type=OperationType.EXPENSE).first()
+        self.send(f"/delete {expense.id}")
+
+        row = DailyTotal.objects.get(operation_type=OperationType.EXPENSE)
+        self.assertEqual((row.total, row.count), (2000, 1))
+        call_command("rebuild_totals", "--verify", stdout=mock.Mock())
+
+    def test_stats_reads_daily_totals_only(self):
+        self.send("/income 100")
+        self.send("/expense 40")
+        with self.assertNumQueries(1):
+            (reply,) = self.send("/stats month")
+        self.assertIn("Income: +100.00 (1 transactions)", reply)
+        self.assertIn("Expense: -40.00 (1 transactions)", reply)
+        self.assertIn("Balance: 60.00", reply)
+
+    def test_stats_of_a_future_range(self):
+        today = timezone.localdate()
+        start, end = today.replace(year=today.year + 1), today.replace(
+            year=today.year + 2
+        )
+        (reply,) = self.send(f"/stats {start} {end}")
+        self.assertIn(f"Statistics for {start:%d.%m.%Y} - {end:%d.%m.%Y}", reply)
+        self.assertIn("Average expense per day: 0.00", reply)
+
+    def test_stats_of_a_range_ending_in_the_future(self):
+        self.send("/expense 30")
+        today = timezone.localdate()
+        start = today - timedelta(days=2)
+        end = today + timedelta(days=400)
+        (reply,) = self.send(f"/stats {start} {end}")
+        self.assertIn(f"Statistics for {start:%d.%m.%Y} - {today:%d.%m.%Y}", reply)
+        # Days still to come do not count
+        self.assertIn("Average expense per day: 10.00", reply)
+
+    def test_add_many_increments_in_the_upsert(self):
+        Chat.objects.create(id=1, username="user1")
+        key = (1, date(2025, 1, 1), OperationType.EXPENSE)
+        # Both writers missed the row, the second must not overwrite the first
+        with CaptureQueriesContext(connection) as queries:
+            DailyTotal.add_many({key: (500, 1)})
+        DailyTotal.add_many({key: (300, 2), (1, date(2025, 1, 2), "income"): (1, 1)})
+        self.assertEqual(len(queries), 1)
+        row = DailyTotal.objects.get(date=date(2025, 1, 1))
+        self.assertEqual((row.total, row.count), (800, 3))
+
+    def test_rebuild_daily_totals(self):
+        self.send("/income 100")
+        DailyTotal.objects.all().delete()
+        call_command("rebuild_totals", stdout=mock.Mock())
+        self.assertEqual(DailyTotal.objects.get().total, 10000)
+
+
+class ImportTests(TestCase):
+    def setUp(self):
+        chat_cache.clear()
+
+    def import_file(self, content: str, suffix: str, *args):
+        with tempfile.NamedTemporaryFile("w", suffix=suffix, delete=False) as file:
+            file.write(content)
+        self.addCleanup(os.remove, file.name)
+        output = io.StringIO()
+        call_command(
+            "import_operations", "7", file.name, *args, stdout=output, stderr=output
+        )
+        return output.getvalue()
+
+    def test_import_csv_in_batches(self):
+        output = self.import_file(
+            "date,type,amount,note\n"
+            "2025-01-05,income,1000,salary\n"
+            "2025-01-06,expense,12.50,coffee beans\n"
+            "2025-01-06,,-7.50,\n"
+            "2025-01-07,expense,abc,broken\n"
+            "2025-01-08,gift,5,\n",
+            ".csv",
+            "--batch-size",
+            "2",
+        )
+
+        self.assertIn("Imported transactions: 3", output)
+        self.assertIn("Row 5: Invalid amount", output)
+        self.assertIn("Row 6: Invalid type", output)
+        chat = Chat.objects.get(id=7)
+        self.assertEqual(chat.total_income, 100000)
+        self.assertEqual(chat.total_expense, 2000)
+        self.assertEqual(
+            DailyTotal.objects.get(operation_type=OperationType.EXPENSE).count, 2
+        )
+        call_command("rebuild_totals", "--verify", stdout=io.StringIO())
+
+    def test_import_json_array_and_lines(self):
+        rows = [{"date": "2025-02-01T10:00:00", "amount": "+15", "note": "x"}] * 3
+        self.import_file(json.dumps(rows), ".json")
+        self.import_file("\n".join(json.dumps(row) for row in rows), ".jsonl")
+        self.assertEqual(Operation.objects.filter(chat_id=7).count(), 6)
+
+    def test_import_warns_of_a_local_cache(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as file:
+            file.write("date,type,amount,note\n")
+        self.addCleanup(os.remove, file.name)
+        stderr = io.StringIO()
+        call_command(
+            "import_operations", "7", file.name, stdout=io.StringIO(), stderr=stderr
+        )
+        self.assertIn(SHARED_CACHE_WARNING, stderr.getvalue())
+
+    def test_import_keeps_the_username(self):
+        Chat.objects.create(id=7, username="alice")
+        self.import_file('[{"amount": "+1"}]', ".json")
+        self.assertEqual(Chat.objects.get(id=7).username, "alice")
+        chat_cache.clear()
+        self.import_file('[{"amount": "+1"}]', ".json", "--username", "bob")
+        self.assertEqual(Chat.objects.get(id=7).username, "bob")
+
+    def test_stream_json_rows_across_chunks(self):
+        content = json.dumps([{"amount": str(number)} for number in range(100)])
+        rows = list(iter_json_rows(io.StringIO(content), chunk_size=7))
+        self.assertEqual(
+            [row["amount"] for _, row in rows], [str(n) for n in range(100)]
+        )
+
+    def test_malformed_json_is_not_buffered_whole(self):
+        content = '[{"amount": "1"}, {"amount": "2", ' + '"note": "x", ' * 10000
+        stream = io.StringIO(content)
+        rows = iter_json_rows(stream, chunk_size=100, max_row_length=1000)
+        self.assertEqual(next(rows), (1, {"amount": "1"}))
+        with self.assertRaisesMessage(ParsingError, "after row 1"):
+            next(rows)
+        self.assertLess(stream.tell(), 2000)
+
+
+class ExportTests(BotTestCase):
+    def export_file(self, *args) -> str:
+        with tempfile.NamedTemporaryFile(suffix=".export", delete=False) as file:
+            pass
+        self.addCleanup(os.remove, file.name)
+        call_command(
+            "export_operations", "1", "--output", file.name, *args, stderr=io.StringIO()
+        )
+        return file.name
+
+    def test_export_can_be_imported_back(self):
+        self.send("/income 100 salary")
+        self.send("/expense 12.50 coffee")
+
+        for args in ([], ["--format", "jsonl"]):
+            path = self.export_file(*args)
+            chat_id = str(10 + len(args))
+            call_command(
+                "import_operations",
+                chat_id,
+                path,
+                "--format",
+                "jsonl" if args else "csv",
+                stdout=io.StringIO(),
+                stderr=io.StringIO(),
+            )
+            chat = Chat.objects.get(id=chat_id)
+            self.assertEqual(chat.total_income, 10000)
+            self.assertEqual(chat.total_expense, 1250)
+
+    def test_gzip_export(self):
+        self.send("/income 100 salary")
+        with gzip.open(self.export_file("--gzip"), "rt") as file:
+            lines = file.read().splitlines()
+        self.assertEqual(lines[0], "id,date,type,amount,note")
+        self.assertTrue(lines[1].endswith(",income,100.00,salary"))
+
+    def test_export_command_uploads_document(self):
+        self.send("/income 100")
+        self.send("/export month jsonl gz")
+        kwargs = self.reply_document.call_args.kwargs
+        self.assertEqual(kwargs["filename"], "transactions-month.jsonl.gz")
+
+        self.assertEqual(self.send("/export yesterday"), ["No transactions"])
+
+
+class ThrottlingTests(BotTestCase):
+    def setUp(self):
+        super().setUp()
+        self.store = LocalBucketStore()
+        throttle = CommandThrottle(
+            self.store,
+            {"default": (1, 5), "report": (0.01, 2)},
+            reply=reply_text,
+            refusal_text=RATE_LIMIT_TEXT,
+            refusal_interval=60,
+        )
+        patcher = mock.patch("botapp.dispatcher._command_throttle", throttle)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def process(self, text: str, chat_id: int = 1):
+        self.reply_text.reset_mock()
+        process_update(make_update(text, chat_id))
+        return [call.args[0] for call in self.reply_text.call_args_list]
+
+    def test_only_first_refusal_is_answered(self):
+        replies = [self.process("/report day") for _ in range(5)]
+        self.assertEqual(replies[:2], [["No transactions"]] * 2)
+        self.assertEqual(replies[2:], [[RATE_LIMIT_TEXT], [], []])
+
+        # Other commands and chats have their own buckets
+        self.assertEqual(self.process("/balance"), ["Total balance: 0.00"])
+        self.assertEqual(self.process("/report day", chat_id=2), ["No transactions"])
+
+    def test_token_bucket_refills(self):
+        state = None
+        for _ in range(3):
+            wait, state = take_token(state, rate=2, capacity=3, now=0)
+            self.assertEqual(wait, 0)
+        wait, state = take_token(state, rate=2, capacity=3, now=0)
+        self.assertEqual(wait, 0.5)
+        wait, state = take_token(state, rate=2, capacity=3, now=0.5)
+        self.assertEqual(wait, 0)
+
+    def test_outbound_limiter_waits_per_chat(self):
+        limiter = OutboundLimiter(
+            self.store, limit=(1000, 1000), chat_limit=(20, 1), group_limit=(20, 1)
+        )
+        with mock.patch("botapp.throttling.time.sleep") as sleep:
+            limiter.wait(1)
+            limiter.wait(2)
+            sleep.assert_not_called()
+            limiter.wait(1)
+            sleep.assert_called()
+
+    def test_outbound_wait_is_capped(self):
+        limiter = OutboundLimiter(
+            self.store,
+            limit=(1000, 1000),
+            chat_limit=(1, 1),
+            group_limit=(1, 1),
+            max_wait=0.5,
+        )
+        limiter.wait(1)
+        with mock.patch("botapp.throttling.time.sleep") as sleep:
+            with self.assertRaises(RetryAfter):
+                limiter.wait(1)
+        sleep.assert_not_called()
+
+    def test_scheduled_sends_wait_out_the_limits(self):
+        send = mock.Mock(side_effect=[RetryAfter(1), None])
+        with mock.patch("botapp.scheduler.sleep") as sleep:
+            self.assertEqual(send_messages(send, [(1, "text")], workers=1), set())
+        sleep.assert_called_once_with(1)
+        self.assertEqual(send.call_count, 2)
+
+
+class ChatCacheTests(BotTestCase):
+    def test_known_chat_is_not_queried(self):
+        self.send("/income 10")
+        # The operation, its chat and daily totals, in a savepoint
+        with self.assertNumQueries(5):
+            self.send("/income 20")
+        self.assertEqual(Chat.objects.get(id=1).total_income, 3000)
+
+    def test_renamed_user_updates_the_chat(self):
+        self.send("/income 10")
+        update = make_update("/income 5", update_id=2)
+        update.effective_user.username = "renamed"
+        get_dispatcher().process_update(update)
+        self.assertEqual(Chat.objects.get(id=1).username, "renamed")
+
+    def test_deleted_chat_is_forgotten(self):
+        self.send("/income 10")
+        Chat.objects.get(id=1).delete()
+        self.assertEqual(self.send("/income 5"), ["Income added: +5.00"])
+        self.assertEqual(Chat.objects.get(id=1).total_income, 500)
+
+
+class QueryBudgetTests(BotTestCase):
+    # Most queries a command may issue, savepoints included. The writes
+    # take more when the day's first operation of a type creates its row,
+    # and expenses read the chat's budgets.
+    BUDGETS = {
+        "/help": 0,
+        "/balance": 1,
+        "/income": 1,
+        "/expense": 1,
+        "/report month": 1,
+        "/stats month": 1,
+        "/export month": 1,
+        "/income 10 salary": 8,
+        "/expense 5 food": 9,
+        "/update 1 +20": 8,
+        "/delete 1": 6,
+    }
+
+    def test_commands_stay_within_query_budgets(self):
+        self.send("/income 1")
+        for text, budget in self.BUDGETS.items():
+            with self.subTest(text), CaptureQueriesContext(connection) as queries:
+                self.send(text)
+            self.assertLessEqual(len(queries), budget, text)
+
+    def test_metrics_are_exported(self):
+        count = command_db_queries.count("balance")
+        self.send("/balance")
+        self.assertEqual(command_db_queries.count("balance"), count + 1)
+
+        body = self.get_metrics().content.decode()
+        self.assertIn('bot_command_db_queries_bucket{command="balance",le="1"}', body)
+        self.assertIn(
+            f'bot_command_duration_seconds_count{{command="balance"}} {count + 1}', body
+        )
+
+    @override_settings(METRICS_TOKEN="")
+    def test_metrics_are_off_without_a_token(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 404)
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_metrics_ask_for_the_token(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 401)
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer wrong")
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.get_metrics().status_code, 200)
+
+
+class ResponseCacheTests(BotTestCase):
+    def test_repeated_reads_are_served_from_cache(self):
+        self.send("/income 10")
+        self.assertEqual(self.send("/balance"), ["Total balance: 10.00"])
+        hits = response_cache_hits.value("balance")
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.send("/balance"), ["Total balance: 10.00"])
+        self.assertEqual(response_cache_hits.value("balance"), hits + 1)
+        self.assertIn(
+            "bot_response_cache_hit_ratio", self.get_metrics().content.decode()
+        )
+
+    def test_writes_invalidate_the_chat(self):
+        self.send("/income 10")
+        self.send("/income 5", chat_id=2)
+        self.send("/report day")
+        self.send("/expense")
+        self.send("/balance", chat_id=2)
+
+        operation_id = Operation.objects.filter(chat_id=1).get().id
+        self.send("/expense 3")
+        self.assertEqual(self.send("/expense"), ["Total expense: -3.00"])
+        self.send(f"/update {operation_id} +20")
+        self.assertIn("Amount: +20.00", self.send("/report day")[0])
+        self.send(f"/delete {operation_id}")
+        self.assertEqual(self.send("/balance"), ["Total balance: -3.00"])
+
+        # Other chats keep their replies
+        with self.assertNumQueries(0):
+            self.assertEqual(self.send("/balance", chat_id=2), ["Total balance: 5.00"])
+
+    def test_writing_commands_are_not_cached(self):
+        self.send("/income 10")
+        self.send("/income 10")
+        self.assertEqual(self.send("/income"), ["Total income: +20.00"])
+
+    def test_only_single_message_replies_are_cached(self):
+        self.send("/income 10")
+        self.send("/report day")
+        with self.assertNumQueries(0):
+            self.send("/report day")
+
+        Operation.bulk_insert(
+            [
+                Operation(
+                    chat_id=1, amount=100, operation_type="income", note="x" * 200
+                )
+                for _ in range(30)
+            ]
+        )
+        invalidate_chat(1)
+        self.assertGreater(len(self.send("/report day")), 1)
+        with self.assertNumQueries(1):
+            self.send("/report day")
+
+    def test_invalidate_from_another_process(self):
+        # Each process has its own instance over the shared Django cache
+        bot_cache, scheduler_cache = CacheResponseCache(60), CacheResponseCache(60)
+        _, generation = bot_cache.get(1, "balance")
+        bot_cache.set(1, "balance", generation, ["Total balance: 0.00"])
+        self.assertEqual(bot_cache.get(1, "balance")[0], ["Total balance: 0.00"])
+
+        scheduler_cache.invalidate(1)
+        self.assertIsNone(bot_cache.get(1, "balance")[0])
+
+    @mock.patch("signal.signal")
+    @mock.patch("botapp.management.commands.runscheduler.build_scheduler")
+    def test_scheduler_process_warns_of_a_local_cache(self, build_scheduler, _):
+        stderr = io.StringIO()
+        call_command("runscheduler", stdout=io.StringIO(), stderr=stderr)
+        build_scheduler.return_value.start.assert_called_once()
+        self.assertIn(SHARED_CACHE_WARNING, stderr.getvalue())
+
+        with override_settings(RESPONSE_CACHE="cache"):
+            # The default backend is local to the process as well
+            self.assertFalse(is_shared_cache())
+        shared = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+        with override_settings(RESPONSE_CACHE="cache", CACHES=shared):
+            self.assertTrue(is_shared_cache())
+
+    @override_settings(SCHEDULER_IN_PROCESS=True)
+    @mock.patch("botapp.scheduler.build_scheduler")
+    def test_webhook_process_runs_the_scheduler(self, build_scheduler):
+        messages = iter([{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}])
+        sent = []
+
+        async def receive():
+            message = next(messages)
+            if message["type"] == "lifespan.shutdown":
+                build_scheduler.return_value.start.assert_called_once()
+            return message
+
+        async def send(message):
+            sent.append(message["type"])
+
+        async_to_sync(lifespan)({"type": "lifespan"}, receive, send)
+        build_scheduler.return_value.shutdown.assert_called_once()
+        self.assertEqual(
+            sent, ["lifespan.startup.complete", "lifespan.shutdown.complete"]
+        )
+
+    def test_stale_render_is_not_stored(self):
+        cache = LocalResponseCache(max_size=2)
+        _, generation = cache.get(1, "balance")
+        cache.invalidate(1)
+        cache.set(1, "balance", generation, ["stale"])
+        self.assertEqual(cache.get(1, "balance")[0], None)
+
+    def test_least_recently_used_reply_is_evicted(self):
+        cache = LocalResponseCache(max_size=2)
+        for key in ("a", "b"):
+            cache.set(1, key, 0, [key])
+        cache.get(1, "a")
+        cache.set(2, "c", 0, ["c"])
+        self.assertEqual([cache.get(1, key)[0] for key in "ab"], [["a"], None])
+
+        cache.invalidate(1)
+        self.assertEqual(cache.get(1, "a")[0], None)
+        self.assertEqual(cache.get(2, "c")[0], ["c"])
+
+
+class WebhookRetryTests(BotTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch(
+            "botapp.idempotency._update_store",
+            LocalUpdateStore(max_size=100, ttl=60),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_redelivered_updates_are_dropped(self):
+        # A burst as Telegram retries it after timeouts, duplicates interleaved
+        burst = [
+            make_update_data("/income 10", chat_id=7, update_id=1),
+            make_update_data("/income 20", chat_id=7, update_id=2),
+            make_update_data("/income 10", chat_id=7, update_id=1),
+            make_update_data("/expense 5", chat_id=7, update_id=3),
+            make_update_data("/income 20", chat_id=7, update_id=2),
+            make_update_data("/income 10", chat_id=7, update_id=1),
+        ]
+        for data in burst:
+            response = self.client.post(
+                "/telegram/webhook/", data, content_type="application/json"
+            )
+            self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(Operation.objects.filter(chat_id=7).count(), 3)
+        self.assertEqual(self.reply_text.call_count, 3)
+        self.assertEqual(Chat.objects.get(id=7).total_income, 3000)
+
+    def test_local_store_is_bounded_and_expires(self):
+        store = LocalUpdateStore(max_size=2, ttl=60)
+        self.assertTrue(store.add(1))
+        self.assertFalse(store.add(1))
+        store.add(2)
+        store.add(3)
+        self.assertTrue(store.add(1))
+
+        with mock.patch("botapp.idempotency.time.monotonic", return_value=1e9):
+            self.assertTrue(store.add(3))
+
+
+@override_settings(WEBHOOK_INLINE_REPLY=True)
+class InlineReplyTests(BotTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch(
+            "botapp.idempotency._update_store",
+            LocalUpdateStore(max_size=100, ttl=60),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, text: str, update_id: int):
+        return self.client.post(
+            "/telegram/webhook/",
+            make_update_data(text, update_id=update_id),
+            content_type="application/json",
+        )
+
+    def test_first_reply_is_the_response_body(self):
+        response = self.post("/balance", 1)
+        self.assertEqual(
+            response.json(),
+            {"method": "sendMessage", "chat_id": 1, "text": "Total balance: 0.00"},
+        )
+        self.reply_text.assert_not_called()
+
+    def test_later_replies_are_sent_in_order(self):
+        self.post("/budget total 1 monthly", 1)
+        self.reply_text.reset_mock()
+
+        response = self.post("/expense 5", 2)
+        # The first reply is sent through the API too, before the second
+        self.assertEqual(response.content, b"")
+        self.assertEqual(
+            [call.args[0] for call in self.reply_text.call_args_list],
+            [
+                "Expense added: -5.00",
+                "Over the monthly budget for all expenses: 5.00 of 1.00",
+            ],
+        )
+
+
+class AsyncWebhookTests(BotTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch(
+            "botapp.idempotency._update_store",
+            LocalUpdateStore(max_size=100, ttl=60),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.handled = []
+        self.started, self.release = threading.Event(), threading.Event()
+        self.release.set()
+
+    def process(self, update):
+        self.started.set()
+        self.release.wait(5)
+        self.handled.append(update.update_id)
+
+    def post(self, pool, update_id: int):
+        request = RequestFactory().post(
+            "/telegram/webhook/",
+            make_update_data("/balance", update_id=update_id),
+            content_type="application/json",
+        )
+        view = AsyncTelegramWebhookView.as_view()
+        with mock.patch("botapp.views.get_worker_pool", return_value=pool):
+            return async_to_sync(view)(request)
+
+    def test_update_is_queued_and_acknowledged(self):
+        self.release.clear()
+        pool = UpdateWorkerPool(self.process, workers=1, queue_size=10)
+        self.assertEqual(self.post(pool, 1).status_code, 200)
+        # Acknowledged before it is processed
+        self.assertEqual(self.handled, [])
+        self.release.set()
+        pool.shutdown(5)
+        self.assertEqual(self.handled, [1])
+
+    def test_full_queue_is_refused_for_redelivery(self):
+        self.release.clear()
+        pool = UpdateWorkerPool(self.process, workers=1, queue_size=1)
+        self.assertEqual(self.post(pool, 1).status_code, 200)
+        self.started.wait(5)
+        self.assertEqual(self.post(pool, 2).status_code, 200)
+        self.assertEqual(self.post(pool, 3).status_code, 503)
+
+        self.release.set()
+        pool.shutdown(5)
+        # The refused update is not taken for a duplicate when Telegram resends it
+        pool = UpdateWorkerPool(self.process, workers=1, queue_size=1)
+        self.assertEqual(self.post(pool, 3).status_code, 200)
+        pool.shutdown(5)
+        self.assertEqual(self.handled, [1, 2, 3])
+
+    def test_shutdown_drains_the_queues(self):
+        pool = UpdateWorkerPool(self.process, workers=2, queue_size=100)
+        with mock.patch("botapp.workers._worker_pool", pool):
+            for update_id in range(20):
+                pool.submit(make_update("/balance", update_id=update_id))
+            shutdown_worker_pool(5)
+        self.assertEqual(sorted(self.handled), list(range(20)))
+        self.assertFalse(pool.submit(make_update("/balance", update_id=20)))
+
+
+class WriteBatchingTests(BotTestCase):
+    def test_concurrent_operations_share_a_batch(self):
+        batches = []
+        batcher = OperationBatcher(
+            lambda batch: batches.append(len(batch)), max_size=5, max_delay=10
+        )
+        threads = [
+            threading.Thread(target=batcher.submit, args=(Operation(),))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=5)
+        # The leader did not wait out `max_delay` once the batch was full
+        self.assertEqual(batches, [5])
+
+    def test_failed_operation_does_not_fail_the_batch(self):
+        def write(batch):
+            if any(write.operation.note == "bad" for write in batch):
+                raise ValueError("bad operation")
+
+        batcher = OperationBatcher(write, max_size=2, max_delay=10)
+        errors = []
+
+        def submit(note):
+            try:
+                batcher.submit(Operation(note=note))
+            except ValueError as e:
+                errors.append((note, str(e)))
+
+        threads = [
+            threading.Thread(target=submit, args=(name,)) for name in ("ok", "bad")
+        ]
+        with self.assertLogs("botapp.batching", "WARNING"):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(timeout=5)
+        self.assertEqual(errors, [("bad", "bad operation")])
+
+    @override_settings(WRITE_BATCHING=True, WRITE_BATCH_DELAY=0)
+    def test_batched_income_updates_totals(self):
+        self.assertEqual(self.send("/income 10 salary"), ["Income added: +10.00"])
+        self.assertEqual(self.send("/expense 4"), ["Expense added: -4.00"])
+
+        chat = Chat.objects.get(id=1)
+        self.assertEqual(chat.username, "user1")
+        self.assertEqual((chat.total_income, chat.total_expense), (1000, 400))
+        self.assertEqual(Operation.objects.get(note="salary").amount, 1000)
+        self.assertEqual(self.send("/balance"), ["Total balance: 6.00"])
+
+
+class WorkerPoolTests(TestCase):
+    def make_update(self, chat_id: int, update_id: int):
+        return SimpleNamespace(
+            update_id=update_id, effective_chat=SimpleNamespace(id=chat_id)
+        )
+
+    def test_chat_order_under_concurrency(self):
+        handled = defaultdict(list)
+        active, raced = set(), set()
+        most_active = 0
+        lock = threading.Lock()
+
+        def process(update):
+            nonlocal most_active
+            chat_id = update.effective_chat.id
+            with lock:
+                if chat_id in active:
+                    raced.add(chat_id)
+                active.add(chat_id)
+                most_active = max(most_active, len(active))
+            time.sleep(random.random() / 2000)
+            with lock:
+                handled[chat_id].append(update.update_id)
+                active.discard(chat_id)
+
+        pool = UpdateWorkerPool(process, workers=8, queue_size=8000)
+
+        def produce(chat_ids):
+            for update_id in range(50):
+                for chat_id in chat_ids:
+                    pool.submit(self.make_update(chat_id, update_id), block=True)
+
+        # Each producer owns its chats, so their submit order is known
+        producers = [
+            threading.Thread(target=produce, args=(range(number, 40, 4),))
+            for number in range(4)
+        ]
+        for producer in producers:
+            producer.start()
+        for producer in producers:
+            producer.join()
+        pool.shutdown()
+
+        self.assertEqual(raced, set())
+        self.assertEqual(len(handled), 40)
+        for chat_id, update_ids in handled.items():
+            self.assertEqual(update_ids, list(range(50)), chat_id)
+        self.assertGreater(most_active, 1)
+
+    def test_queue_depth_is_exported(self):
+        started, release = threading.Event(), threading.Event()
+
+        def process(update):
+            started.set()
+            release.wait(5)
+
+        pool = UpdateWorkerPool(process, workers=2, queue_size=10)
+        for update_id in range(3):
+            pool.submit(self.make_update(1, update_id))
+        started.wait(5)
+        self.assertIn('bot_update_queue_depth{shard="1"} 2', render_metrics())
+        self.assertIn('bot_update_queue_depth{shard="0"} 0', render_metrics())
+        release.set()
+        pool.shutdown()
+
+
+class PollingTests(TestCase):
+    def test_offset_waits_for_earlier_updates(self):
+        tracker = OffsetTracker()
+        self.assertIsNone(tracker.offset)
+        for update_id in (5, 6, 7):
+            tracker.start(update_id)
+        self.assertFalse(tracker.start(6))
+
+        tracker.done(6)
+        tracker.done(7)
+        self.assertEqual(tracker.offset, 5)
+        tracker.done(5)
+        self.assertEqual(tracker.offset, 8)
+
+    def test_poller_keeps_chat_order_and_commits_handled(self):
+        updates = [
+            make_update(f"/income {number}", chat_id=number % 2, update_id=number)
+            for number in range(1, 7)
+        ]
+        fake_bot = mock.Mock()
+        # The second batch overlaps with updates still being handled
+        fake_bot.get_updates.side_effect = [updates[:4], updates[2:], [], []]
+        handled = []
+        poller = Poller(
+            fake_bot,
+            lambda update: handled.append(update.update_id),
+            workers=2,
+            queue_size=10,
+            timeout=0,
+        )
+        for _ in range(3):
+            poller.poll()
+        poller.shutdown()
+
+        self.assertEqual(sorted(handled), [1, 2, 3, 4, 5, 6])
+        for chat_id in (0, 1):
+            ids = [update_id for update_id in handled if update_id % 2 == chat_id]
+            self.assertEqual(ids, sorted(ids))
+        self.assertEqual(fake_bot.get_updates.call_args.kwargs["offset"], 7)
+
+    def test_poller_waits_while_a_handler_blocks(self):
+        update = make_update("/income 1", update_id=1)
+        started = threading.Event()
+        release = threading.Event()
+
+        def process(update):
+            started.set()
+            release.wait(5)
+
+        fake_bot = mock.Mock()
+        # Telegram returns the update until its offset is confirmed
+        fake_bot.get_updates.side_effect = lambda offset, **kwargs: (
+            [update] if offset in (None, 1) else []
+        )
+        poller = Poller(fake_bot, process, workers=1, queue_size=10, timeout=0)
+        with mock.patch("botapp.polling.IDLE_DELAY", 0.1):
+            thread = threading.Thread(target=poller.run)
+            thread.start()
+            started.wait(5)
+            time.sleep(0.5)
+            calls = fake_bot.get_updates.call_count
+            release.set()
+            poller.shutdown()
+            thread.join(5)
+
+        # One poll per `IDLE_DELAY` rather than a busy loop
+        self.assertLessEqual(calls, 8)
+        self.assertEqual(fake_bot.get_updates.call_args.kwargs["offset"], 2)
+
+
+class TelegramRetryTests(TestCase):
+    def retry(self, *responses):
+        pool = mock.Mock()
+        pool.request.side_effect = list(responses)
+        manager = RetryingPoolManager(pool, retries=3, backoff=0.5, max_wait=30)
+        with mock.patch("botapp.telegram_http.time.sleep") as sleep:
+            response = manager.request("POST", "https://api/bot1:x/sendMessage")
+        return response, [call.args[0] for call in sleep.call_args_list]
+
+    def response(self, status: int, data: dict = None):
+        return SimpleNamespace(status=status, data=json.dumps(data or {}).encode())
+
+    def test_429_waits_retry_after_and_5xx_backs_off(self):
+        too_many = self.response(429, {"parameters": {"retry_after": 3}})
+        response, delays = self.retry(too_many, self.response(502), self.response(200))
+        self.assertEqual(response.status, 200)
+        self.assertTrue(3 <= delays[0] <= 3.5)
+        # The second attempt backs off up to `backoff * 2`
+        self.assertTrue(0 <= delays[1] <= 1)
+
+    def test_gives_up_after_retries_and_long_waits(self):
+        failures = [self.response(503) for _ in range(4)]
+        response, delays = self.retry(*failures)
+        self.assertEqual((response.status, len(delays)), (503, 3))
+
+        too_long = self.response(429, {"parameters": {"retry_after": 60}})
+        response, delays = self.retry(too_long)
+        self.assertEqual((response.status, delays), (429, []))
+
+    def test_client_errors_are_not_retried(self):
+        response, delays = self.retry(self.response(400))
+        self.assertEqual((response.status, delays), (400, []))
+
+
+class ReportTests(BotTestCase):
+    def test_long_report_is_split_under_message_limit(self):
+        chat = Chat.objects.create(id=1, username="user1")
+        Operation.objects.bulk_create(
+            Operation(chat=chat, amount=1, operation_type=OperationType.INCOME)
+            for _ in range(500)
+        )
+
+        with mock.patch("botapp.commands.REPORT_PAGE_SIZE", 30):
+            replies = self.send("/report day")
+
+        self.assertGreater(len(replies), 1)
+        self.assertTrue(all(len(reply) <= MESSAGE_MAX_LENGTH for reply in replies))
+        reported_ids = [
+            int(line.split()[1])
+            for reply in replies
+            for line in reply.splitlines()
+            if line.startswith("ID:")
+        ]
+        self.assertEqual(
+            reported_ids,
+            list(Operation.objects.order_by("id").values_list("id", flat=True)),
+        )
+
+    def test_empty_report(self):
+        self.assertEqual(self.send("/report week"), ["No transactions"])
+
+
+class IntervalTests(BotTestCase):
+    def test_day_starts_at_local_midnight(self):
+        kyiv = ZoneInfo("Europe/Kyiv")
+        # 00:30 on January 2nd in Kyiv
+        created_at = datetime(2025, 1, 1, 22, 30, tzinfo=dt_timezone.utc)
+        Chat.objects.create(id=1, username="user1")
+        Operation.objects.create(
+            chat_id=1, amount=5, operation_type="expense", created_at=created_at
+        )
+
+        for day, count in ((date(2025, 1, 1), 0), (date(2025, 1, 2), 1)):
+            window = Window.from_dates(day, day, kyiv)
+            self.assertEqual(
+                Operation.get_transactions_in_window(1, window).count(), count
+            )
+
+    def test_report_for_date_range(self):
+        self.send("/income 10")
+        self.send("/income 20")
+        first, second = Operation.objects.order_by("id")
+        Operation.objects.filter(id=first.id).update(
+            created_at=datetime(2025, 3, 31, 23, tzinfo=ZoneInfo("Europe/Kyiv"))
+        )
+        Operation.objects.filter(id=second.id).update(
+            created_at=datetime(2025, 4, 1, tzinfo=ZoneInfo("Europe/Kyiv"))
+        )
+
+        report = "".join(self.send("/report 2025-01-01 2025-03-31"))
+        self.assertIn(f"ID: {first.id}", report)
+        self.assertNotIn(f"ID: {second.id}", report)
+
+    def test_invalid_date_range(self):
+        self.assertEqual(
+            self.send("/report 2025-03-31 2025-01-01"),
+            ["The start date is after the end date"],
+        )
+
+    def test_dates_out_of_range(self):
+        for text in ("/stats 2025-01-01 9999-12-31", "/report 0001-01-01 2025-01-01"):
+            with self.subTest(text):
+                result = parse_command(text.split()[0][1:], text)
+                self.assertEqual(result.error.code, "invalid_date")
+                (reply,) = self.send(text)
+                self.assertIn("The year must be from 1900 to 2999", reply)
+
+    def test_week_start(self):
+        wednesday = date(2025, 1, 1)
+        self.assertEqual(
+            get_dates(Interval.WEEK, wednesday, 0),
+            (date(2024, 12, 30), date(2025, 1, 5)),
+        )
+        self.assertEqual(
+            get_dates(Interval.WEEK, wednesday, 6),
+            (date(2024, 12, 29), date(2025, 1, 4)),
+        )
+
+    def test_window_is_cached_until_midnight(self):
+        kyiv = ZoneInfo("Europe/Kyiv")
+        cache = WindowCache()
+        morning = datetime(2025, 1, 31, 8, tzinfo=kyiv)
+
+        window = cache.get(Interval.MONTH, kyiv, 0, now=morning)
+        self.assertIs(
+            cache.get(Interval.MONTH, kyiv, 0, now=morning.replace(hour=23)), window
+        )
+
+        next_month = cache.get(
+            Interval.MONTH, kyiv, 0, now=datetime(2025, 2, 1, tzinfo=kyiv)
+        )
+        self.assertEqual(
+            (next_month.start_date, next_month.end_date),
+            (date(2025, 2, 1), date(2025, 2, 28)),
+        )
+
+
+class SchedulerTests(BotTestCase):
+    KYIV = ZoneInfo("Europe/Kyiv")
+
+    def add_operation(self, amount, operation_type, created_at):
+        Operation.objects.create(
+            chat_id=1,
+            amount=amount,
+            operation_type=operation_type,
+            created_at=created_at,
+        )
+
+    def test_run_dates(self):
+        monthly = [get_run_date("monthly", 31, date(2025, 2, d)) for d in (1, 28)]
+        self.assertEqual(monthly, [date(2025, 2, 28)] * 2)
+        self.assertEqual(get_run_date("monthly", 1, date(2025, 2, 2)), date(2025, 3, 1))
+        # 1 January 2025 is a Wednesday
+        self.assertEqual(get_run_date("weekly", 1, date(2025, 1, 1)), date(2025, 1, 6))
+        self.assertEqual(get_run_date("daily", 1, date(2025, 1, 1)), date(2025, 1, 1))
+
+    def test_recurring_operations_are_added_when_due(self):
+        with mock.patch(
+            "django.utils.timezone.now",
+            return_value=datetime(2025, 1, 15, 12, tzinfo=self.KYIV),
+        ):
+            self.assertIn(
+                "first on 01.02.2025",
+                self.send("/recurring add expense 300 rent monthly 1")[0],
+            )
+        self.assertIn("Repeats monthly on day 1", self.send("/recurring")[0])
+
+        tick(now=datetime(2025, 1, 31, tzinfo=self.KYIV), send=mock.Mock())
+        self.assertFalse(Operation.objects.exists())
+
+        # Missed runs are caught up with their own dates
+        added, _ = tick(now=datetime(2025, 3, 2, tzinfo=self.KYIV), send=mock.Mock())
+        self.assertEqual(added, 2)
+        dates = Operation.objects.order_by("created_at").values_list(
+            "created_at", flat=True
+        )
+        self.assertEqual(
+            [timezone.localdate(d) for d in dates], [date(2025, 2, 1), date(2025, 3, 1)]
+        )
+        self.assertEqual(self.send("/expense"), ["Total expense: -600.00"])
+        self.assertEqual(
+            timezone.localdate(RecurringOperation.objects.get().next_run_at),
+            date(2025, 4, 1),
+        )
+
+        schedule_id = RecurringOperation.objects.get().id
+        self.assertEqual(
+            self.send(f"/recurring delete {schedule_id}"),
+            [f"Recurring transaction {schedule_id} stopped"],
+        )
+
+    def test_due_schedules_take_constant_queries(self):
+        Chat.objects.bulk_create(
+            Chat(id=chat_id, username="user") for chat_id in range(1, 41)
+        )
+        now = timezone.now()
+        RecurringOperation.objects.bulk_create(
+            RecurringOperation(
+                chat_id=chat_id,
+                operation_type="expense",
+                amount=100,
+                frequency="daily",
+                next_run_at=now,
+            )
+            for chat_id in range(1, 41)
+        )
+        # Select, insert, chat totals, daily totals upsert, budgets, next runs
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(run_recurring(now, batch_size=1000), 40)
+        statements = [q for q in queries if "SAVEPOINT" not in q["sql"]]
+        self.assertEqual(len(statements), 6)
+        call_command("rebuild_totals", "--verify", stdout=mock.Mock())
+
+    def test_digests_are_sent_once_per_period(self):
+        with mock.patch(
+            "django.utils.timezone.now",
+            return_value=datetime(2025, 1, 15, 12, tzinfo=self.KYIV),
+        ):
+            self.assertEqual(
+                self.send("/digest daily"),
+                ["Daily digest on, the first on 16.01.2025 09:00"],
+            )
+            self.send("/digest weekly")
+        self.add_operation(10000, "income", datetime(2025, 1, 15, 12, tzinfo=self.KYIV))
+        self.add_operation(3000, "expense", datetime(2025, 1, 15, 23, tzinfo=self.KYIV))
+
+        send = mock.Mock()
+        _, sent = tick(now=datetime(2025, 1, 16, 9, tzinfo=self.KYIV), send=send)
+        self.assertEqual(sent, 1)
+        text = send.call_args.kwargs["text"]
+        self.assertTrue(text.startswith("Daily digest for 15.01.2025"))
+        self.assertIn("Balance: 70.00", text)
+
+        self.assertEqual(
+            tick(now=datetime(2025, 1, 16, 10, tzinfo=self.KYIV), send=send)[1], 0
+        )
+        # The next day had no transactions
+        self.assertEqual(
+            tick(now=datetime(2025, 1, 17, 9, tzinfo=self.KYIV), send=send)[1], 0
+        )
+
+        send.reset_mock()
+        tick(now=datetime(2025, 1, 20, 9, tzinfo=self.KYIV), send=send)
+        self.assertIn(
+            "Weekly digest for 13.01.2025 - 19.01.2025", send.call_args.kwargs["text"]
+        )
+
+    def test_blocked_chat_is_unsubscribed(self):
+        with mock.patch(
+            "django.utils.timezone.now",
+            return_value=datetime(2025, 1, 15, 12, tzinfo=self.KYIV),
+        ):
+            self.send("/digest daily")
+        self.add_operation(10000, "income", datetime(2025, 1, 15, 12, tzinfo=self.KYIV))
+        tick(
+            now=datetime(2025, 1, 16, 9, tzinfo=self.KYIV),
+            send=mock.Mock(side_effect=Unauthorized("blocked")),
+        )
+        self.assertFalse(DigestSubscription.objects.exists())
+
+
+class BudgetTests(BotTestCase):
+    def test_alerts_at_80_and_100_percent_once(self):
+        self.assertEqual(
+            self.send("/budget food 100 monthly"),
+            ["Monthly budget for food set to 100.00, 0.00 spent so far"],
+        )
+        self.assertEqual(len(self.send("/expense 50 food")), 1)
+        self.assertEqual(
+            self.send("/expense 30 Food court"),
+            [
+                "Expense added: -30.00",
+                "80% of the monthly budget for food spent: 80.00 of 100.00",
+            ],
+        )
+        self.assertEqual(len(self.send("/expense 10 food")), 1)
+        self.assertEqual(len(self.send("/expense 10 rent")), 1)
+        self.assertEqual(len(self.send("/income 10 food")), 1)
+        self.assertEqual(
+            self.send("/expense 20 food")[1:],
+            ["Over the monthly budget for food: 110.00 of 100.00"],
+        )
+
+        # Falling below a threshold alerts again on the next rise
+        operation_id = Operation.objects.filter(note="food").order_by("id").first().id
+        self.send(f"/delete {operation_id}")
+        self.assertEqual(
+            self.send("/expense 45 food")[1:],
+            ["Over the monthly budget for food: 105.00 of 100.00"],
+        )
+        self.assertEqual(self.send("/budget"), ["food: 105.00 of 100.00 monthly"])
+
+    def test_total_budget_and_update(self):
+        self.send("/expense 30 rent")
+        self.assertIn("30.00 spent so far", self.send("/budget total 100 weekly")[0])
+        self.send("/budget food 100 weekly")
+        self.send("/expense 10 food")
+
+        operation_id = Operation.objects.get(note="food").id
+        self.assertEqual(
+            self.send(f"/update {operation_id} -50 food")[1:],
+            ["80% of the weekly budget for all expenses spent: 80.00 of 100.00"],
+        )
+        # Moving the expense to another category takes it off the food budget
+        self.send(f"/update {operation_id} books")
+        spent = dict(Budget.objects.values_list("category", "spent"))
+        self.assertEqual(spent, {"": 8000, "food": 0})
+
+        self.assertEqual(self.send("/budget delete food"), ["Budget deleted"])
+        self.assertEqual(self.send("/budget delete food"), ["You have no such budget"])
+        call_command("rebuild_totals", "--verify", stdout=io.StringIO())
+
+    def test_expired_period_rolls_over(self):
+        self.send("/budget total 100 daily")
+        self.send("/expense 90")
+        Budget.objects.update(
+            period_start=date(2025, 1, 1), period_end=date(2025, 1, 1)
+        )
+        self.assertEqual(self.send("/budget"), ["all expenses: 0.00 of 100.00 daily"])
+
+        self.assertEqual(len(self.send("/expense 50")), 1)
+        budget = Budget.objects.get()
+        self.assertEqual(budget.period_start, timezone.localdate())
+        self.assertEqual(budget.spent, 5000)
+
+    def test_future_expense_does_not_roll_over(self):
+        self.send("/budget total 100 monthly")
+        rows = [(2, {"date": "2099-01-05", "type": "expense", "amount": "5"})]
+        import_operations(1, "user1", rows, batch_size=10, max_errors=10)
+        self.assertEqual(
+            Budget.objects.get().period_start.year, timezone.localdate().year
+        )
+
+        self.assertEqual(
+            self.send("/expense 90")[1:],
+            ["80% of the monthly budget for all expenses spent: 90.00 of 100.00"],
+        )
+
+    def test_import_reports_alerts(self):
+        self.send("/budget total 100 monthly")
+        today = timezone.localdate().isoformat()
+        rows = [
+            (number, {"date": today, "type": "expense", "amount": "45"})
+            for number in (2, 3)
+        ]
+        result = import_operations(1, "user1", rows, batch_size=1, max_errors=10)
+        self.assertEqual([threshold for _, threshold in result.alerts], [80])
+        self.assertEqual(Budget.objects.get().alerted, 80)
+
+    def test_rebuild_fixes_spending(self):
+        self.send("/budget total 100 monthly")
+        self.send("/expense 20")
+        Budget.objects.update(spent=1)
+        with self.assertRaises(CommandError):
+            call_command("rebuild_totals", "--verify", stdout=io.StringIO())
+        call_command("rebuild_totals", stdout=io.StringIO())
+        self.assertEqual(Budget.objects.get().spent, 2000)
+
+    def test_write_path_queries_do_not_grow_with_the_period(self):
+        self.send("/budget total 100000 monthly")
+        self.send("/budget food 100000 monthly")
+        self.send("/expense 1 food")
+        with CaptureQueriesContext(connection) as first:
+            self.send("/expense 1 food")
+        Operation.bulk_insert(
+            [
+                Operation(chat_id=1, amount=1, operation_type="expense", note="food")
+                for _ in range(200)
+            ]
+        )
+        with CaptureQueriesContext(connection) as later:
+            self.send("/expense 1 food")
+        self.assertEqual(len(later), len(first))
+        self.assertEqual(
+            dict(Budget.objects.values_list("category", "spent")),
+            {"": 500, "food": 500},
+        )
+
+    def test_recurring_expenses_send_alerts(self):
+        self.send("/budget total 100 monthly")
+        self.send("/recurring add expense 90 daily")
+        send = mock.Mock()
+        tick(now=timezone.now(), send=send)
+        send.assert_called_once_with(
+            chat_id=1,
+            text="80% of the monthly budget for all expenses spent: 90.00 of 100.00",
+        )
+
+    def test_usage(self):
+        self.assertTrue(self.send("/budget food 10")[0].startswith("Usage: /budget"))
+        self.assertEqual(
+            self.send("/budget food 0 daily"),
+            ["The amount must be from 0.01 to 99999999.99"],
+        )
+
+
+@skipUnless(connection.vendor == "sqlite", "The plans are SQLite specific")
+class QueryPlanTests(TestCase):
+    def test_report_uses_chat_created_index(self):
+        operations = Operation.get_transactions_by_interval(1, Interval.YEAR)
+        plan = operations.order_by("created_at", "id").explain()
+        self.assertIn("USING INDEX operation_chat_created_idx", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_sum_by_type_uses_covering_index(self):
+        operations = (
+            Operation.objects.filter(chat_id=1, operation_type=OperationType.EXPENSE)
+            .values("operation_type")
+            .annotate(total=models.Sum("amount"))
+        )
+        plan = operations.explain()
+        self.assertIn("USING COVERING INDEX operation_chat_type_idx", plan)
+
+    def test_ledger_totals_use_covering_index(self):
+        operations = (
+            Operation.objects.filter(chat_id=1)
+            .values("chat_id", "operation_type")
+            .annotate(total=models.Sum("amount"))
+            .order_by()
+        )
+        plan = operations.explain()
+        self.assertIn("USING COVERING INDEX operation_chat_type_idx", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
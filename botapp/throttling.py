@@ -0,0 +1,164 @@
+from collections import OrderedDict
+from telegram.error import RetryAfter
+from django.core.cache import cache
+import threading
+import time
+
+
+def take_token(state, rate: float, capacity: float, now: float):
+    """
+    Token bucket step. `state` is `(tokens, updated_at)` or None for a full bucket.
+    Returns `(wait, new_state)`, `wait` is 0 when a token was taken.
+    """
+    tokens, updated_at = state or (capacity, now)
+    tokens = min(capacity, tokens + (now - updated_at) * rate)
+    if tokens >= 1:
+        return 0, (tokens - 1, now)
+    return (1 - tokens) / rate, (tokens, now)
+
+
+class LocalBucketStore:
+    """Buckets of this process, the least recently used are dropped first."""
+
+    def __init__(self, max_size: int = 100000):
+        self._buckets = OrderedDict()
+        self._max_size = max_size
+        self._lock = threading.Lock()
+
+    def consume(self, key: str, rate: float, capacity: float) -> float:
+        with self._lock:
+            wait, state = take_token(
+                self._buckets.pop(key, None), rate, capacity, time.monotonic()
+            )
+            self._buckets[key] = state
+            if len(self._buckets) > self._max_size:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class CacheBucketStore:
+    """
+    Buckets in the Django cache, shared by every process using it.
+    The read and write are not atomic, so concurrent hits may slightly overdraw.
+    """
+
+    def __init__(self, prefix: str = "bucket"):
+        self._prefix = prefix
+
+    def consume(self, key: str, rate: float, capacity: float) -> float:
+        cache_key = f"{self._prefix}:{key}"
+        wait, state = take_token(cache.get(cache_key), rate, capacity, time.time())
+        # An idle bucket refills completely, so it can expire by then
+        cache.set(cache_key, state, timeout=int(capacity / rate) + 1)
+        return wait
+
+
+def get_bucket_store(name: str):
+    if name == "cache":
+        return CacheBucketStore()
+    if name == "local":
+        return LocalBucketStore()
+    raise ValueError(f"Unknown bucket store: {name}")
+
+
+class RateLimiter:
+    def __init__(self, store, rate: float, capacity: float):
+        self.store = store
+        self.rate = rate
+        self.capacity = capacity
+
+    def hit(self, key) -> float:
+        """Takes a token. Returns 0 if allowed, else seconds until the next token."""
+        return self.store.consume(str(key), self.rate, self.capacity)
+
+    def wait(self, key, deadline: float = None):
+        """
+        Blocks until a token is taken. Raises `RetryAfter` instead of waiting
+        past `deadline`, a `time.monotonic()` time.
+        """
+        while wait := self.hit(key):
+            if deadline is not None and time.monotonic() + wait > deadline:
+                raise RetryAfter(wait)
+            time.sleep(wait)
+
+
+def get_command(update):
+    """The command name of an update, `import` for documents, else None."""
+    message = update.effective_message
+    if message is None:
+        return None
+    if message.document:
+        return "import"
+    if not message.text or not message.text.startswith("/"):
+        return None
+    return message.text.split()[0][1:].split("@")[0].lower()
+
+
+class CommandThrottle:
+    """
+    Per chat and per command token buckets, checked before an update is dispatched.
+    Only the first refused update in `refusal_interval` seconds gets `reply` called
+    with the refusal text, the others are dropped silently.
+    """
+
+    def __init__(
+        self,
+        store,
+        limits: dict,
+        reply,
+        refusal_text: str,
+        refusal_interval: float,
+    ):
+        self._limiters = {
+            command: RateLimiter(store, rate, capacity)
+            for command, (rate, capacity) in limits.items()
+        }
+        self._refusals = RateLimiter(store, 1 / refusal_interval, 1)
+        self._reply = reply
+        self._refusal_text = refusal_text
+
+    def allow(self, update) -> bool:
+        command = get_command(update)
+        if command is None:
+            return True
+
+        limiter = self._limiters.get(command, self._limiters["default"])
+        key = f"{update.effective_chat.id}:{command}"
+        if not limiter.hit(key):
+            return True
+
+        if not self._refusals.hit(f"refused:{key}"):
+            self._reply(update, self._refusal_text)
+        return False
+
+
+class OutboundLimiter:
+    """
+    Keeps sent messages within Telegram's global and per chat limits.
+    The wait blocks the sending thread, which is the thread handling the update,
+    so it is capped at `max_wait` seconds: a send that would wait longer raises
+    `RetryAfter` as a 429 from Telegram would.
+    """
+
+    def __init__(
+        self,
+        store,
+        limit: tuple,
+        chat_limit: tuple,
+        group_limit: tuple,
+        max_wait: float = None,
+    ):
+        self._global = RateLimiter(store, *limit)
+        self._chat = RateLimiter(store, *chat_limit)
+        self._group = RateLimiter(store, *group_limit)
+        self._max_wait = max_wait
+
+    def wait(self, chat_id):
+        deadline = None
+        if self._max_wait is not None:
+            deadline = time.monotonic() + self._max_wait
+        # Group and channel IDs are negative, channels may also be `@username`
+        is_group = str(chat_id).startswith(("-", "@"))
+        limiter = self._group if is_group else self._chat
+        limiter.wait(f"send:{chat_id}", deadline)
+        self._global.wait("send", deadline)
@@ -1,7 +1,12 @@
+from .views import AsyncTelegramWebhookView, TelegramWebhookView
+from django.conf import settings
 from django.urls import path
-from .views import TelegramWebhookView
 
 
+webhook_view = (
+    AsyncTelegramWebhookView if settings.WEBHOOK_ASYNC else TelegramWebhookView
+)
+
 urlpatterns = [
-    path("webhook/", TelegramWebhookView.as_view()),
+    path("webhook/", webhook_view.as_view()),
 ]
@@ -1,10 +1,101 @@
 from botapp.constants import MINUS_SIGN, PLUS_SIGN
-from botapp.models import OperationType
+from botapp.money import format_cents
+from botapp.models import Frequency, OperationType
+from contextlib import contextmanager
+import threading
+
+
+_local = threading.local()
 
 
 def get_operation_sign(operation_type: OperationType) -> str:
     return PLUS_SIGN if operation_type == OperationType.INCOME else MINUS_SIGN
 
 
+def format_summary(summary: dict) -> str:
+    """Income, expense and balance lines of a `DailyTotal.get_summary` result."""
+    income, income_count = summary[OperationType.INCOME]
+    expense, expense_count = summary[OperationType.EXPENSE]
+    return (
+        f"Income: +{format_cents(income)} ({income_count} transactions)\n"
+        f"Expense: -{format_cents(expense)} ({expense_count} transactions)\n"
+        f"Balance: {format_cents(income - expense)}"
+    )
+
+
+def format_budget_alert(budget, threshold: int) -> str:
+    period = Frequency(budget.period).label.lower()
+    spent = f"{format_cents(budget.spent)} of {format_cents(budget.amount)}"
+    if threshold >= 100:
+        return f"Over the {period} budget for {budget.name}: {spent}"
+    return f"{threshold}% of the {period} budget for {budget.name} spent: {spent}"
+
+
+class InlineReply:
+    """
+    Holds the first reply of an update so the webhook can return it
+    as the JSON body of its response instead of calling `sendMessage`.
+    """
+
+    def __init__(self):
+        self.update = None
+        self.text = None
+        self.closed = False
+
+    @property
+    def payload(self):
+        if self.text is None:
+            return None
+        return {
+            "method": "sendMessage",
+            "chat_id": self.update.effective_chat.id,
+            "text": self.text,
+        }
+
+    def flush(self):
+        """Send the held reply through the API, e.g. to keep replies in order."""
+        if self.text is not None:
+            self.update.message.reply_text(self.text)
+        self.text = None
+        self.closed = True
+
+
+@contextmanager
+def inline_reply():
+    reply = InlineReply()
+    _local.inline_reply = reply
+    try:
+        yield reply
+    finally:
+        _local.inline_reply = None
+
+
+@contextmanager
+def capture_replies():
+    """Collects the texts passed to `reply_text` in the block instead of sending them."""
+    replies = []
+    _local.captured_replies = replies
+    try:
+        yield replies
+    finally:
+        _local.captured_replies = None
+
+
 def reply_text(update, text):
+    captured = getattr(_local, "captured_replies", None)
+    if captured is not None:
+        captured.append(text)
+        return None
+
+    reply = getattr(_local, "inline_reply", None)
+    if reply is None or reply.closed:
+        return update.message.reply_text(text)
+
+    if reply.text is None:
+        reply.update, reply.text = update, text
+        return None
+
+    # The webhook response is delivered after any API call made now,
+    # so several replies all go through the API to keep their order.
+    reply.flush()
     return update.message.reply_text(text)
@@ -1,27 +1,88 @@
-from botapp.constants import ALLOWED_COMMANDS, COMMANDS_MODULE
+from django.http import HttpResponse, HttpResponseBadRequest, Http404
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
-from botapp.command_handlers import CommandRegistrar
+from botapp.idempotency import forget_update, is_new_update
+from botapp.dispatcher import process_update
+from botapp.metrics import render_metrics
+from botapp.utils import inline_reply
+from botapp.workers import get_worker_pool
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from telegram.ext import Dispatcher
-from botapp.utils import reply_text
 from rest_framework import status
+from django.conf import settings
+from django.views import View
 from telegram import Update
 from botapp.bot import bot
+import hmac
+import json
 
 
 @method_decorator(csrf_exempt, name="dispatch")
 class TelegramWebhookView(APIView):
     def post(self, request, *args, **kwargs):
-        update = Update.de_json(request.data, bot)
-        dispatcher = Dispatcher(bot, update_queue=None, workers=0, use_context=True)
+        # A redelivered update was already handled, acknowledge it again
+        if not is_new_update(request.data):
+            return Response(status=status.HTTP_200_OK)
+
+        try:
+            return self.handle_update(Update.de_json(request.data, bot))
+        except Exception:
+            # Telegram retries the failed update, so let it through next time
+            forget_update(request.data)
+            raise
 
-        registrar = CommandRegistrar(ALLOWED_COMMANDS, COMMANDS_MODULE)
-        if not registrar.is_valid():
-            reply_text(update, registrar.error)
+    def handle_update(self, update):
+        if not settings.WEBHOOK_INLINE_REPLY:
+            process_update(update)
             return Response(status=status.HTTP_200_OK)
 
-        registrar.register_commands(dispatcher)
-        dispatcher.process_update(update)
-        return Response(status=status.HTTP_200_OK)
+        with inline_reply() as reply:
+            process_update(update)
+        return Response(reply.payload, status=status.HTTP_200_OK)
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class AsyncTelegramWebhookView(View):
+    """
+    Validates and enqueues the update, then acknowledges Telegram right away.
+    Commands are handled in the background by the worker pool.
+    """
+
+    async def post(self, request, *args, **kwargs):
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            return HttpResponseBadRequest()
+        # A redelivered update was already queued, acknowledge it again
+        if not is_new_update(data):
+            return HttpResponse(status=status.HTTP_200_OK)
+
+        try:
+            update = Update.de_json(data, bot)
+        except (ValueError, KeyError, TypeError):
+            update = None
+        if update is None:
+            forget_update(data)
+            return HttpResponseBadRequest()
+
+        # Telegram redelivers the update later if we are overloaded
+        if not get_worker_pool().submit(update):
+            forget_update(data)
+            return HttpResponse(status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return HttpResponse(status=status.HTTP_200_OK)
+
+
+class MetricsView(View):
+    """Command metrics of this process in the Prometheus text format."""
+
+    def get(self, request, *args, **kwargs):
+        if not settings.METRICS_TOKEN:
+            raise Http404
+        expected = f"Bearer {settings.METRICS_TOKEN}"
+        given = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(given.encode(), expected.encode()):
+            return HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+
+        return HttpResponse(
+            render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8"
+        )
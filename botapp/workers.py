@@ -0,0 +1,142 @@
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from botapp.metrics import update_queue_depth
+from django.conf import settings
+import threading
+import logging
+import queue
+
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class UpdateWorkerPool:
+    """
+    Updates processed by a fixed number of worker threads, each with its own
+    bounded queue. Updates are sharded by chat, so the updates of one chat are
+    processed in order by the same worker while other chats run in parallel.
+    `.submit()` does not block by default: a full queue is reported to the
+    caller, so the webhook can push back on Telegram instead of piling up work.
+    """
+
+    def __init__(self, process, workers: int, queue_size: int):
+        self._process = process
+        self._queues = [
+            queue.Queue(maxsize=max(1, queue_size // workers)) for _ in range(workers)
+        ]
+        self._threads = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(shard.qsize() for shard in self._queues)
+
+    def shard_depths(self) -> dict:
+        return {number: shard.qsize() for number, shard in enumerate(self._queues)}
+
+    def start(self):
+        with self._lock:
+            if self._threads or self._closed:
+                return
+            # One pool runs per process, the webhook's or `runbot`'s
+            update_queue_depth.collect = self.shard_depths
+            for number, shard in enumerate(self._queues):
+                thread = threading.Thread(
+                    target=self._run,
+                    args=(shard,),
+                    name=f"update-worker-{number}",
+                    daemon=True,
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def get_shard(self, update) -> queue.Queue:
+        chat = update.effective_chat
+        key = chat.id if chat is not None else update.update_id
+        return self._queues[key % len(self._queues)]
+
+    def submit(self, update, block: bool = False) -> bool:
+        """Returns False if the pool is closed or, unless `block`, the queue is full."""
+        if self._closed:
+            return False
+        self.start()
+        try:
+            self.get_shard(update).put(update, block=block)
+        except queue.Full:
+            return False
+        return True
+
+    def shutdown(self, timeout: float = None):
+        """Stop accepting updates and wait until the queued ones are processed."""
+        with self._lock:
+            self._closed = True
+            threads = list(self._threads)
+
+        if threads:
+            for shard in self._queues:
+                shard.put(_STOP)
+        for thread in threads:
+            thread.join(timeout)
+
+    def _run(self, shard: queue.Queue):
+        while True:
+            update = shard.get()
+            try:
+                if update is _STOP:
+                    return
+                close_old_connections()
+                self._process(update)
+            except Exception:
+                logger.exception("Failed to process update")
+            finally:
+                close_old_connections()
+                shard.task_done()
+
+
+_worker_pool = None
+_worker_pool_lock = threading.Lock()
+
+
+def get_worker_pool() -> UpdateWorkerPool:
+    global _worker_pool
+    with _worker_pool_lock:
+        if _worker_pool is None:
+            from botapp.dispatcher import process_update
+
+            _worker_pool = UpdateWorkerPool(
+                process_update,
+                workers=settings.WEBHOOK_WORKERS,
+                queue_size=settings.WEBHOOK_QUEUE_SIZE,
+            )
+        return _worker_pool
+
+
+def shutdown_worker_pool(timeout: float = None):
+    global _worker_pool
+    with _worker_pool_lock:
+        pool, _worker_pool = _worker_pool, None
+    if pool is not None:
+        pool.shutdown(timeout)
+
+
+async def lifespan(scope, receive, send):
+    """
+    ASGI lifespan handler that starts the scheduler with `SCHEDULER_IN_PROCESS`,
+    and stops it and drains the worker pool on server shutdown.
+    """
+    from botapp.scheduler import start_background_scheduler, stop_background_scheduler
+
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            if settings.SCHEDULER_IN_PROCESS:
+                start_background_scheduler()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await sync_to_async(stop_background_scheduler, thread_sensitive=False)()
+            await sync_to_async(shutdown_worker_pool, thread_sensitive=False)()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
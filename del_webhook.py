@@ -1,9 +1,6 @@
-from telegram_bot.settings import BOT_TOKEN, TELEGRAM_BOT_TOKEN
-import requests
+from botapp.bot import bot
 
 
-response = requests.post(
-    f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/deleteWebhook"
-)
-
-print(response.json())
+bot.delete_webhook()
+info = bot.get_webhook_info()
+print(f"Webhook deleted: {not info.url}")
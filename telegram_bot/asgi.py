@@ -13,4 +13,16 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "telegram_bot.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after the app registry is ready
+from botapp.workers import lifespan  # noqa: E402
+
+
+async def application(scope, receive, send):
+    # Django does not handle lifespan events, so the update worker pool
+    # is drained here when the server shuts down.
+    if scope["type"] == "lifespan":
+        await lifespan(scope, receive, send)
+        return
+    await django_application(scope, receive, send)
@@ -23,12 +23,94 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 
 # My constants
 
-NGROK_URL = "https://fd9013288cb5.ngrok-free.app"
+# Public URL of the webhook deployment, e.g. an ngrok tunnel.
+# Not needed when running with `manage.py runbot`.
+NGROK_URL = config("NGROK_URL", default="")
 
 WEBHOOK_URL = f"{NGROK_URL}/telegram/webhook/"
 
 TELEGRAM_BOT_TOKEN = config("TELEGRAM_BOT_TOKEN")
 
+# Bot API base URL, the bot token is appended to it.
+# Point it at a local fake server for benchmarks.
+TELEGRAM_API_URL = config("TELEGRAM_API_URL", default="https://api.telegram.org/bot")
+
+# Async webhook: acknowledge updates right away and process them on a worker pool.
+# Requires serving the project through `telegram_bot/asgi.py`.
+WEBHOOK_ASYNC = config("WEBHOOK_ASYNC", default=False, cast=bool)
+
+WEBHOOK_WORKERS = config("WEBHOOK_WORKERS", default=4, cast=int)
+
+# When the queue is full the webhook answers 503 and Telegram redelivers later
+WEBHOOK_QUEUE_SIZE = config("WEBHOOK_QUEUE_SIZE", default=1000, cast=int)
+
+# Outbound Bot API calls share one connection pool. Every worker may send
+# a reply at the same time, long polling holds one more connection.
+TELEGRAM_POOL_SIZE = config("TELEGRAM_POOL_SIZE", default=WEBHOOK_WORKERS + 4, cast=int)
+
+TELEGRAM_CONNECT_TIMEOUT = config("TELEGRAM_CONNECT_TIMEOUT", default=5, cast=float)
+
+TELEGRAM_READ_TIMEOUT = config("TELEGRAM_READ_TIMEOUT", default=10, cast=float)
+
+# Retries of 429 and 5xx responses, longer waits than TELEGRAM_MAX_RETRY_WAIT fail
+TELEGRAM_RETRIES = config("TELEGRAM_RETRIES", default=3, cast=int)
+
+TELEGRAM_RETRY_BACKOFF = config("TELEGRAM_RETRY_BACKOFF", default=0.5, cast=float)
+
+TELEGRAM_MAX_RETRY_WAIT = config("TELEGRAM_MAX_RETRY_WAIT", default=30, cast=float)
+
+# Longest wait for the outbound send limits, in the thread handling the update.
+# A send that would wait longer fails with RetryAfter.
+TELEGRAM_MAX_SEND_WAIT = config("TELEGRAM_MAX_SEND_WAIT", default=5, cast=float)
+
+# Where rate limit buckets live: "local" to this process,
+# or "cache" to share them through the Django cache between processes
+RATE_LIMIT_STORE = config("RATE_LIMIT_STORE", default="local")
+
+# Telegram redelivers updates that were not acknowledged in time.
+# Seen update IDs are kept "local" to this process or in the Django "cache".
+UPDATE_DEDUP_STORE = config("UPDATE_DEDUP_STORE", default="local")
+
+UPDATE_DEDUP_TTL = config("UPDATE_DEDUP_TTL", default=3600, cast=int)
+
+UPDATE_DEDUP_MAX_SIZE = config("UPDATE_DEDUP_MAX_SIZE", default=100000, cast=int)
+
+# Replies of read-only commands are cached per chat until its data changes:
+# "local" to this process, in the Django "cache" shared between processes, or "none"
+RESPONSE_CACHE = config("RESPONSE_CACHE", default="local")
+
+RESPONSE_CACHE_SIZE = config("RESPONSE_CACHE_SIZE", default=10000, cast=int)
+
+RESPONSE_CACHE_TTL = config("RESPONSE_CACHE_TTL", default=86400, cast=int)
+
+# Recurring transactions and digests: the scheduler checks for due ones every
+# SCHEDULER_INTERVAL seconds, SCHEDULER_BATCH_SIZE rows per query, and sends
+# digests from DIGEST_SENDERS threads within the outbound rate limits
+SCHEDULER_INTERVAL = config("SCHEDULER_INTERVAL", default=60, cast=int)
+
+SCHEDULER_BATCH_SIZE = config("SCHEDULER_BATCH_SIZE", default=1000, cast=int)
+
+DIGEST_SENDERS = config("DIGEST_SENDERS", default=8, cast=int)
+
+# Run the scheduler inside the ASGI webhook process, started by its lifespan
+SCHEDULER_IN_PROCESS = config("SCHEDULER_IN_PROCESS", default=False, cast=bool)
+
+# Write-behind batching of /income and /expense: operations of concurrent updates
+# are written together, at most WRITE_BATCH_SIZE after waiting WRITE_BATCH_DELAY seconds
+WRITE_BATCHING = config("WRITE_BATCHING", default=False, cast=bool)
+
+WRITE_BATCH_SIZE = config("WRITE_BATCH_SIZE", default=100, cast=int)
+
+WRITE_BATCH_DELAY = config("WRITE_BATCH_DELAY", default=0.005, cast=float)
+
+# Return the reply of the sync webhook in its HTTP response, saving a sendMessage call
+WEBHOOK_INLINE_REPLY = config("WEBHOOK_INLINE_REPLY", default=False, cast=bool)
+
+# Per-command log lines of `botapp.metrics` are written at INFO
+METRICS_LOG_LEVEL = config("METRICS_LOG_LEVEL", default="WARNING")
+# `/metrics` answers only `Authorization: Bearer <token>`, and 404 while unset
+METRICS_TOKEN = config("METRICS_TOKEN", default="")
+
 NGROK_DOMAIN = urlparse(NGROK_URL).netloc
 
 # SECURITY WARNING: keep the secret key used in production secret!
@@ -37,7 +119,7 @@ SECRET_KEY = config("SECRET_KEY")
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 
-ALLOWED_HOSTS = ["localhost", "127.0.0.1", NGROK_DOMAIN]
+ALLOWED_HOSTS = ["localhost", "127.0.0.1"] + ([NGROK_DOMAIN] if NGROK_DOMAIN else [])
 
 
 # Application definition
@@ -86,12 +168,62 @@ WSGI_APPLICATION = "telegram_bot.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+# "sqlite" for a local file, "postgresql" for production with concurrent workers
+DB_ENGINE = config("DB_ENGINE", default="sqlite")
+
+if DB_ENGINE == "postgresql":
+    # Either a psycopg 3 connection pool, or one persistent connection per thread
+    DB_POOL_SIZE = config("DB_POOL_SIZE", default=0, cast=int)
+
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": config("DB_NAME", default="telegram_bot"),
+            "USER": config("DB_USER", default="postgres"),
+            "PASSWORD": config("DB_PASSWORD", default=""),
+            "HOST": config("DB_HOST", default="localhost"),
+            "PORT": config("DB_PORT", default=5432, cast=int),
+            "CONN_MAX_AGE": (
+                0 if DB_POOL_SIZE else config("DB_CONN_MAX_AGE", default=60, cast=int)
+            ),
+            "CONN_HEALTH_CHECKS": True,
+            # `.iterator()` in /export streams through a server-side cursor,
+            # which does not survive transaction pooling (e.g. PgBouncer)
+            "DISABLE_SERVER_SIDE_CURSORS": config(
+                "DB_DISABLE_SERVER_SIDE_CURSORS", default=False, cast=bool
+            ),
+            "OPTIONS": (
+                {"pool": {"min_size": 1, "max_size": DB_POOL_SIZE}}
+                if DB_POOL_SIZE
+                else {}
+            ),
+        }
     }
-}
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": config("DB_NAME", default=str(BASE_DIR / "db.sqlite3")),
+            "OPTIONS": {},
+        }
+    }
+
+    # WAL lets readers run alongside the writer, and waiting on the lock with
+    # busy_timeout instead of failing with "database is locked". Write
+    # transactions take the lock when they begin, so they never deadlock
+    # upgrading a read lock.
+    SQLITE_MMAP_SIZE = config("SQLITE_MMAP_SIZE", default=2**28, cast=int)
+
+    if config("SQLITE_TUNED", default=True, cast=bool):
+        DATABASES["default"]["OPTIONS"] = {
+            "init_command": (
+                "PRAGMA journal_mode=WAL;"
+                "PRAGMA synchronous=NORMAL;"
+                "PRAGMA busy_timeout=5000;"
+                f"PRAGMA mmap_size={SQLITE_MMAP_SIZE};"
+            ),
+            "transaction_mode": "IMMEDIATE",
+        }
 
 
 # Password validation
@@ -124,6 +256,9 @@ USE_I18N = True
 
 USE_TZ = True
 
+# First day of the week for reports, 0 is Monday and 6 is Sunday
+WEEK_START = config("WEEK_START", default=0, cast=int)
+
 
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
@@ -134,3 +269,14 @@ STATIC_URL = "static/"
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "botapp.metrics": {"handlers": ["console"], "level": METRICS_LOG_LEVEL},
+    },
+}
@@ -17,8 +17,10 @@ Including another URLconf
 
 from django.contrib import admin
 from django.urls import path, include
+from botapp.views import MetricsView
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("telegram/", include("botapp.urls")),
+    path("metrics", MetricsView.as_view()),
 ]